@@ -0,0 +1,875 @@
+"""
+Measurement engine shared by the client experiment scripts (run_reciprocity.py,
+run_gbwpt_phases.py, run_gbwpt_random_phases.py and usrp_pilot.py).
+
+USRP setup (clock, PPS, tuning, streamers), the RX path (rx_ref: phases and
+amplitudes estimated while receiving, optionally a bounded IQ recording), the TX
+path (tx_ref) and the measurement steps (pilot, loopback, coherent TX) live here
+once; an experiment script is the sequence of steps of its experiment.
+
+Settings are the module globals below, overridden by cal-settings.yml through
+load_settings(), as the scripts did with their own globals.
+"""
+
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import uhd
+import yaml
+import zmq
+
+import tools
+
+# =============================================================================
+#                           Experiment Configuration
+# =============================================================================
+# Default settings and timing parameters used throughout the measurement and
+# loopback procedure. Values are overridden by entries in cal-settings.yml.
+# =============================================================================
+
+CMD_DELAY = 0.05  # Command delay (50 ms) between USRP instructions
+RX_TX_SAME_CHANNEL = True  # True if loopback occurs between the same RF channel
+CLOCK_TIMEOUT = 1000  # Timeout for external clock locking (in ms)
+INIT_DELAY = 0.2  # Initial delay before starting transmission (200 ms)
+RATE = 250e3  # Sampling rate in samples per second (250 kSps)
+LOOPBACK_TX_GAIN = (
+    50  # 70     # Empirically determined transmit gain for loopback tests
+)
+RX_GAIN = 22  # Empirically determined receive gain (22 dB without splitter, 27 dB with splitter)
+CAPTURE_TIME = 10  # Duration of each capture in seconds
+RX_TAIL_TIME = None  # Seconds of IQ kept per recorded capture (None: up to CAPTURE_TIME)
+TX_RANDOM_PHASES = False  # Transmit random phases (per sample) instead of a constant tone
+FREQ = 0  # Base frequency offset (Hz); 0 means use default center frequency
+# SERVER_IP = "10.128.52.53"  # Optional remote server address (commented out)
+meas_id = 0  # Measurement identifier
+# =============================================================================
+# =============================================================================
+
+SWITCH_LOOPBACK_MODE = 0x00000006  # which is 110
+SWITCH_RESET_MODE = 0x00000000
+
+context = zmq.Context()
+
+HOSTNAME = socket.gethostname()[4:]
+file_open = False
+file_name = None
+data_file = None
+begin_time = 2.0
+
+DEG = "\u00b0"
+
+
+# =============================================================================
+#                           Custom Log Formatter
+# =============================================================================
+# This formatter adds timestamps with fractional seconds to log messages,
+# allowing for more precise event timing (useful in measurement systems).
+# =============================================================================
+
+
+class LogFormatter(logging.Formatter):
+    """Custom log formatter that prints timestamps with fractional seconds."""
+
+    @staticmethod
+    def pp_now():
+        """Return the current time of day as a formatted string with milliseconds."""
+        now = datetime.now()
+        return "{:%H:%M}:{:05.2f}".format(now, now.second + now.microsecond / 1e6)
+
+    def formatTime(self, record, datefmt=None):
+        """Override the default time formatter to include fractional seconds."""
+        converter = self.converter(record.created)
+        if datefmt:
+            formatted_date = converter.strftime(datefmt)
+        else:
+            formatted_date = LogFormatter.pp_now()
+        return formatted_date
+
+
+class ColoredFormatter(LogFormatter):
+    """Console formatter with ANSI colors per level."""
+
+    COLORS = {
+        logging.DEBUG: "\033[36m",     # cyan
+        logging.INFO: "\033[32m",      # green
+        logging.WARNING: "\033[33m",   # yellow
+        logging.ERROR: "\033[31m",     # red
+        logging.CRITICAL: "\033[35m",  # magenta
+    }
+    RESET = "\033[0m"
+
+    def format(self, record):
+        color = self.COLORS.get(record.levelno, "")
+        reset = self.RESET if color else ""
+        record.levelname = f"{color}{record.levelname}{reset}"
+        return super().format(record)
+
+
+def fmt(val):
+    """Format float to 0.3f."""
+    try:
+        return f"{float(val):.3f}"
+    except Exception:
+        return str(val)
+
+
+# -------------------------------------------------------------------------
+# Logger setup
+# -------------------------------------------------------------------------
+logger = logging.getLogger("measurement")
+logger.setLevel(logging.DEBUG)
+
+# Stream logs to console
+console = logging.StreamHandler()
+logger.addHandler(console)
+
+# Custom log format (includes time, level, and thread name)
+formatter = LogFormatter(
+    fmt="[%(asctime)s] [%(levelname)s] (%(threadName)-10s) %(message)s"
+)
+# Colored for console
+console.setFormatter(ColoredFormatter(fmt=formatter._fmt))
+
+# Also log to file in the script directory
+file_handler = logging.FileHandler(os.path.join(os.path.dirname(__file__), "log.txt"))
+file_handler.setFormatter(formatter)
+logger.addHandler(file_handler)
+
+
+def set_channels():
+    """Channel mapping for reference and loopback measurements (RX_TX_SAME_CHANNEL)."""
+    global REF_RX_CH, FREE_TX_CH, LOOPBACK_RX_CH, LOOPBACK_TX_CH
+    if RX_TX_SAME_CHANNEL:
+        # Reference signal received on CH0, loopback on CH1
+        REF_RX_CH = FREE_TX_CH = 0
+        LOOPBACK_RX_CH = LOOPBACK_TX_CH = 1
+        logger.debug("\nPLL REF → CH0 RX\nCH1 TX → CH1 RX\nCH0 TX →")
+    else:
+        # Reference and loopback channels are swapped
+        LOOPBACK_RX_CH = FREE_TX_CH = 0
+        REF_RX_CH = LOOPBACK_TX_CH = 1
+        logger.debug("\nPLL REF → CH1 RX\nCH1 TX → CH0 RX\nCH0 TX →")
+
+
+set_channels()
+
+
+def load_settings(path=None):
+    """
+    Load cal-settings.yml (next to this file unless path is given) over the module
+    defaults and return its values, so a script can take them into its own globals.
+    """
+    if path is None:
+        path = os.path.join(os.path.dirname(__file__), "cal-settings.yml")
+    with open(path, "r") as file:
+        settings = yaml.safe_load(file)
+    globals().update(settings)  # update the global variables with the vars in yaml
+    set_channels()
+    return settings
+
+
+# =============================================================================
+#                           USRP setup
+# =============================================================================
+
+
+def setup_clock(usrp, clock_src, num_mboards):
+    usrp.set_clock_source(clock_src)
+    logger.debug("Now confirming lock on clock signals...")
+    end_time = datetime.now() + timedelta(milliseconds=CLOCK_TIMEOUT)
+    # Lock onto clock signals for all mboards
+    for i in range(num_mboards):
+        is_locked = usrp.get_mboard_sensor("ref_locked", i)
+        while (not is_locked) and (datetime.now() < end_time):
+            time.sleep(1e-3)
+            is_locked = usrp.get_mboard_sensor("ref_locked", i)
+        if not is_locked:
+            logger.error("Unable to confirm clock signal locked on board %d", i)
+            return False
+        else:
+            logger.debug("Clock signals are locked")
+    return True
+
+
+def setup_pps(usrp, pps):
+    """Setup the PPS source"""
+
+    logger.debug("Setting PPS")
+    usrp.set_time_source(pps)
+    return True
+
+
+def print_tune_result(tune_res):
+    logger.debug(
+        "Tune Result:\n    Target RF  Freq: %s MHz\n    Actual RF  Freq: %s MHz\n    Target DSP Freq: %s MHz\n    Actual DSP Freq: %s MHz",
+        fmt(tune_res.target_rf_freq / 1e6),
+        fmt(tune_res.actual_rf_freq / 1e6),
+        fmt(tune_res.target_dsp_freq / 1e6),
+        fmt(tune_res.actual_dsp_freq / 1e6),
+    )
+
+
+def wait_till_time(usrp, at_time):
+    logger.debug("Wait till command is executed")
+    while usrp.get_time_now().get_real_secs() < at_time + CMD_DELAY:
+        time.sleep(0.01)
+    usrp.clear_command_time()
+
+
+def tune_usrp(usrp, freq, channels, at_time, wait=False):
+    """Synchronously set the device's frequency.
+    If a channel is using an internal LO it will be tuned first
+    and every other channel will be manually tuned based on the response.
+    This is to account for the internal LO channel having an offset in the actual DSP frequency.
+    Then all channels are synchronously tuned.
+    With wait, block until the timed tune has executed and clear the command time."""
+    treq = uhd.types.TuneRequest(freq)
+    usrp.set_command_time(uhd.types.TimeSpec(at_time))
+    treq.dsp_freq = 0.0
+    treq.target_freq = freq
+    treq.rf_freq = freq
+    treq.rf_freq_policy = uhd.types.TuneRequestPolicy(ord("M"))
+    treq.dsp_freq_policy = uhd.types.TuneRequestPolicy(ord("M"))
+    args = uhd.types.DeviceAddr("mode_n=integer")
+    treq.args = args
+    rx_freq = freq - 1e3
+    rreq = uhd.types.TuneRequest(rx_freq)
+    rreq.rf_freq = rx_freq
+    rreq.target_freq = rx_freq
+    rreq.dsp_freq = 0.0
+    rreq.rf_freq_policy = uhd.types.TuneRequestPolicy(ord("M"))
+    rreq.dsp_freq_policy = uhd.types.TuneRequestPolicy(ord("M"))
+    rreq.args = uhd.types.DeviceAddr("mode_n=fractional")
+    for chan in channels:
+        logger.debug("RX tuning...")
+        print_tune_result(usrp.set_rx_freq(rreq, chan))
+        logger.debug("TX tuning...")
+        print_tune_result(usrp.set_tx_freq(treq, chan))
+    if wait:
+        wait_till_time(usrp, at_time)
+    while not usrp.get_rx_sensor("lo_locked").to_bool():
+        print(".")
+        time.sleep(0.01)
+    logger.info("RX LO is locked")
+    while not usrp.get_tx_sensor("lo_locked").to_bool():
+        print(".")
+        time.sleep(0.01)
+    logger.info("TX LO is locked")
+
+
+def wait_till_go_from_server(ip, _connect=True, alive=None):
+    """Announce this tile (alive, default HOSTNAME) and wait for the server's SYNC."""
+
+    global meas_id, file_open, data_file, file_name
+    # Connect to the publisher's address
+    logger.debug("Connecting to server %s.", ip)
+    sync_socket = context.socket(zmq.SUB)
+
+    alive_socket = context.socket(zmq.REQ)
+
+    sync_socket.connect(f"tcp://{ip}:{5557}")
+    alive_socket.connect(f"tcp://{ip}:{5558}")
+    # Subscribe to topics
+    sync_socket.subscribe("")
+
+    logger.debug("Sending ALIVE")
+    alive_socket.send_string(HOSTNAME if alive is None else alive)
+    # Receives a string format message
+    logger.debug("Waiting on SYNC from server %s.", ip)
+
+    meas_id, unique_id = sync_socket.recv_string().split(" ")
+
+    file_name = f"data_{HOSTNAME}_{unique_id}_{meas_id}"
+
+    if not file_open:
+        data_file = open(f"data_{HOSTNAME}_{unique_id}.txt", "a")
+        file_open = True
+
+    logger.debug(meas_id)
+
+    alive_socket.close()
+    sync_socket.close()
+
+
+def send_usrp_in_tx_mode(ip):
+    tx_mode_socket = context.socket(zmq.REQ)
+    tx_mode_socket.connect(f"tcp://{ip}:{5559}")
+    logger.debug("USRP IN TX MODE")
+    tx_mode_socket.send_string(HOSTNAME)
+    tx_mode_socket.close()
+
+
+def setup(usrp, SERVER_IP, connect=True):
+    rate = RATE
+    mcr = 20e6
+    assert (
+        mcr / rate
+    ).is_integer(), f"The masterclock rate {mcr} should be an integer multiple of the sampling rate {rate}"
+    # Manual selection of master clock rate may also be required to synchronize multiple B200 units in time.
+    usrp.set_master_clock_rate(mcr)
+    channels = [0, 1]
+    setup_clock(usrp, "external", usrp.get_num_mboards())
+    setup_pps(usrp, "external")
+    # smallest as possible (https://files.ettus.com/manual/page_usrp_b200.html#b200_fe_bw)
+    rx_bw = 200e3
+    for chan in channels:
+        usrp.set_rx_rate(rate, chan)
+        usrp.set_tx_rate(rate, chan)
+        # NOTE DC offset is enabled
+        usrp.set_rx_dc_offset(True, chan)
+        usrp.set_rx_bandwidth(rx_bw, chan)
+        usrp.set_rx_agc(False, chan)
+    # specific settings from loopback/REF PLL
+    usrp.set_tx_gain(LOOPBACK_TX_GAIN, LOOPBACK_TX_CH)
+    usrp.set_tx_gain(LOOPBACK_TX_GAIN, FREE_TX_CH)
+
+    usrp.set_rx_gain(LOOPBACK_RX_GAIN, LOOPBACK_RX_CH)
+    usrp.set_rx_gain(REF_RX_GAIN, REF_RX_CH)
+    # streaming arguments
+    st_args = uhd.usrp.StreamArgs("fc32", "sc16")
+    st_args.channels = channels
+    # streamers
+    tx_streamer = usrp.get_tx_stream(st_args)
+    rx_streamer = usrp.get_rx_stream(st_args)
+    # Step1: wait for the last pps time to transition to catch the edge
+    # Step2: set the time at the next pps (synchronous for all boards)
+    # this is better than set_time_next_pps as we wait till the next PPS to transition and after that we set the time.
+    # this ensures that the FPGA has enough time to clock in the new timespec (otherwise it could be too close to a PPS edge)
+    wait_till_go_from_server(SERVER_IP, connect)
+    logger.info("Setting device timestamp to 0...")
+    usrp.set_time_unknown_pps(uhd.types.TimeSpec(0.0))
+    logger.debug("[SYNC] Resetting time.")
+    logger.info(f"RX GAIN PROFILE CH0: {usrp.get_rx_gain_names(0)}")
+    logger.info(f"RX GAIN PROFILE CH1: {usrp.get_rx_gain_names(1)}")
+    # we wait 2 seconds to ensure a PPS rising edge occurs and latches the 0.000s value to both USRPs.
+    time.sleep(2)
+    tune_usrp(usrp, FREQ, channels, at_time=begin_time)
+    logger.info(
+        f"USRP has been tuned and setup. ({usrp.get_time_now().get_real_secs()})"
+    )
+    return tx_streamer, rx_streamer
+
+
+def delta(usrp, at_time):
+    return at_time - usrp.get_time_now().get_real_secs()
+
+
+def get_current_time(usrp):
+    return usrp.get_time_now().get_real_secs()
+
+
+def starting_in(usrp, at_time):
+    return f"Starting in {delta(usrp, at_time):.2f}s"
+
+
+# =============================================================================
+#                           RX path
+# =============================================================================
+
+
+def log_rx_counters(counters):
+    logger.debug(
+        "RX samples: received %d kept %d discarded %d",
+        counters["received"],
+        counters["kept"],
+        counters["discarded"],
+    )
+    if counters["overflow"] or counters["late"]:
+        logger.warning(
+            "RX errors: %d overflow(s), %d late packet(s)",
+            counters["overflow"],
+            counters["late"],
+        )
+
+
+def rx_ref(
+    usrp, rx_streamer, quit_event, duration, result_queue, start_time=None, record=None
+):
+    """
+    Receive on all channels until quit_event is set and put the estimate on
+    result_queue: the dict of tools.StreamingPhaseEstimator.result() (phase
+    difference CH0 - CH1, amplitudes, frequency offsets) plus the RX counters of
+    tools.RingCapture. The first second is skipped (settling).
+
+    With record (a file name), the last RX_TAIL_TIME seconds (default: duration)
+    of IQ are kept and saved with np.save; otherwise no IQ is kept.
+    """
+    # https://files.ettus.com/manual/page_sync.html#sync_phase_cordics
+    # The CORDICs are reset at each start-of-burst command, so users should ensure that every start-of-burst also has a time spec set.
+    logger.debug(f"GAIN IS CH0: {usrp.get_rx_gain(0)} CH1: {usrp.get_rx_gain(1)}")
+
+    num_channels = rx_streamer.get_num_channels()
+    max_samps_per_packet = rx_streamer.get_max_num_samps()
+    tail_time = 0 if record is None else (duration if RX_TAIL_TIME is None else RX_TAIL_TIME)
+    capture = tools.RingCapture(num_channels, int(tail_time * RATE), skip=int(RATE * 1))
+    estimator = tools.StreamingPhaseEstimator(num_channels, skip=int(RATE * 1), fs=RATE)
+
+    recv_buffer = np.zeros((num_channels, max_samps_per_packet), dtype=np.complex64)
+    rx_md = uhd.types.RXMetadata()
+    # Craft and send the Stream Command
+    stream_cmd = uhd.types.StreamCMD(uhd.types.StreamMode.start_cont)
+    # The stream now parameter controls when the stream begins. When true, the device will begin streaming ASAP. When false, the device will begin streaming at a time specified by time_spec.
+    stream_cmd.stream_now = False
+    timeout = 1.0
+    if start_time is not None:
+        stream_cmd.time_spec = start_time
+        time_diff = start_time.get_real_secs() - usrp.get_time_now().get_real_secs()
+        if time_diff > 0:
+            timeout = 1.0 + time_diff
+    else:
+        stream_cmd.time_spec = uhd.types.TimeSpec(
+            usrp.get_time_now().get_real_secs() + INIT_DELAY + 0.1
+        )
+    rx_streamer.issue_stream_cmd(stream_cmd)
+    try:
+        while not quit_event.is_set():
+            try:
+                num_rx_i = rx_streamer.recv(recv_buffer, rx_md, timeout)
+                if rx_md.error_code != uhd.types.RXMetadataErrorCode.none:
+                    logger.error(rx_md.error_code)
+                    capture.error(rx_md.error_code)
+                else:
+                    if num_rx_i > 0:
+                        samples = recv_buffer[:, :num_rx_i]
+                        estimator.update(samples)
+                        capture.push(samples)
+            except RuntimeError as ex:
+                logger.error("Runtime error in receive: %s", ex)
+                return
+    except KeyboardInterrupt:
+        pass
+    finally:
+        logger.debug("CTRL+C is pressed or duration is reached, closing off ")
+        rx_streamer.issue_stream_cmd(
+            uhd.types.StreamCMD(uhd.types.StreamMode.stop_cont)
+        )
+        if record is not None:
+            np.save(record, capture.samples())
+
+        est = estimator.result()
+        est.update(capture.counters())
+        log_rx_counters(est)
+
+        logger.debug(
+            "Frequency offset CH0:     %.2f Hz     %.2f Hz", float(est["freq_before"][0]), float(est["freq_after"][0])
+        )
+        logger.debug(
+            "Frequency offset CH1:     %.2f Hz     %.2f Hz", float(est["freq_before"][1]), float(est["freq_after"][1])
+        )
+
+        logger.debug(
+            "Phase CH0 - CH1: mean %s%s min %s%s max %s%s (circular - linear mean %s%s)",
+            fmt(np.rad2deg(est["phase_diff"])),
+            DEG,
+            fmt(np.rad2deg(est["phase_diff_min"])),
+            DEG,
+            fmt(np.rad2deg(est["phase_diff_max"])),
+            DEG,
+            fmt(np.rad2deg(est["phase_diff"] - est["phase_diff_mean"])),
+            DEG,
+        )
+
+        result_queue.put(est)
+
+        logger.debug(
+            "MAX AMPL IQ CH0: I %s Q %s CH1: I %s Q %s",
+            fmt(est["max_I"][0]),
+            fmt(est["max_Q"][0]),
+            fmt(est["max_I"][1]),
+            fmt(est["max_Q"][1]),
+        )
+
+        logger.debug(
+            "AVG AMPL IQ CH0: %s CH1: %s",
+            fmt(est["avg_ampl"][0]),
+            fmt(est["avg_ampl"][1]),
+        )
+
+
+def rx_thread(usrp, rx_streamer, quit_event, duration, res, start_time=None, record=None):
+    _rx_thread = threading.Thread(
+        target=rx_ref,
+        args=(
+            usrp,
+            rx_streamer,
+            quit_event,
+            duration,
+            res,
+            start_time,
+            record,
+        ),
+    )
+    _rx_thread.name = "RX_thread"
+    _rx_thread.start()
+    return _rx_thread
+
+
+# =============================================================================
+#                           TX path
+# =============================================================================
+
+
+def tx_ref(usrp, tx_streamer, quit_event, phase, amplitude, start_time=None):
+    """
+    Transmit a continuous reference signal on all active channels.
+
+    This function generates a complex baseband signal based on the provided
+    amplitude and phase values, then continuously transmits it using the
+    specified USRP transmit streamer until `quit_event` is set.
+
+    Args:
+        usrp: The USRP device instance.
+        tx_streamer: UHD transmit streamer used for sending samples.
+        quit_event: Threading event used to stop transmission when set.
+        phase (list or np.ndarray): Phase offset for each channel (in radians).
+        amplitude (list or np.ndarray): Amplitude for each channel.
+        start_time (uhd.types.TimeSpec, optional): Scheduled start time.
+            If None, transmission begins after `INIT_DELAY` seconds.
+
+    Notes:
+        - This function continuously sends the same buffer of complex samples,
+          taken from tools.tx_waveforms (allocated once per streamer shape).
+        - It is typically used to generate a reference signal for phase calibration.
+        - With TX_RANDOM_PHASES, every sample gets a random phase (phase is ignored).
+        - A streamer with fewer channels uses the first entries of phase and amplitude.
+    """
+
+    # Retrieve USRP transmission parameters
+    num_channels = tx_streamer.get_num_channels()
+    max_samps_per_packet = tx_streamer.get_max_num_samps()
+
+    # A streamer with fewer channels transmits the first entries
+    amplitude = np.asarray(amplitude)[:num_channels]
+    phase = np.asarray(phase)[:num_channels]
+
+    # Reuse the cached (num_channels, 1000 * max_samps_per_packet) buffer of this
+    # streamer; only its contents change when phase or amplitude do
+    if TX_RANDOM_PHASES:
+        # Random phase per sample, scaled per channel by its amplitude
+        transmit_buffer = tools.tx_waveforms.random(
+            amplitude, num_channels, max_samps_per_packet
+        )
+    else:
+        # The complex signal for each channel: A * e^(j * phi)
+        transmit_buffer = tools.tx_waveforms.constant(
+            phase, amplitude, num_channels, max_samps_per_packet
+        )
+
+    # Create UHD transmit metadata (for timed transmission)
+    tx_md = uhd.types.TXMetadata()
+
+    # Schedule the transmission start time
+    if start_time is not None:
+        tx_md.time_spec = start_time
+    else:
+        tx_md.time_spec = uhd.types.TimeSpec(
+            usrp.get_time_now().get_real_secs() + INIT_DELAY
+        )
+
+    tx_md.has_time_spec = True
+
+    try:
+        # Continuously transmit the reference signal until quit_event is triggered
+        while not quit_event.is_set():
+            tx_streamer.send(transmit_buffer, tx_md)
+
+    except KeyboardInterrupt:
+        logger.debug("CTRL+C detected — stopping transmission")
+
+    finally:
+        # Send an end-of-burst (EOB) packet to properly terminate streaming
+        tx_md.end_of_burst = True
+        tx_streamer.send(np.zeros((num_channels, 0), dtype=np.complex64), tx_md)
+
+
+def tx_thread(
+    usrp, tx_streamer, quit_event, phase=[0, 0], amplitude=[0.8, 0.8], start_time=None
+):
+    tx_thr = threading.Thread(
+        target=tx_ref,
+        args=(usrp, tx_streamer, quit_event, phase, amplitude, start_time),
+    )
+
+    tx_thr.name = "TX_thread"
+    tx_thr.start()
+
+    return tx_thr
+
+
+def tx_async_th(tx_streamer, quit_event):
+    async_metadata = uhd.types.TXAsyncMetadata()
+    try:
+        while not quit_event.is_set():
+            if not tx_streamer.recv_async_msg(async_metadata, 0.01):
+                continue
+            else:
+                if async_metadata.event_code != uhd.types.TXMetadataEventCode.burst_ack:
+                    logger.error(async_metadata.event_code)
+    except KeyboardInterrupt:
+        pass
+
+
+def tx_meta_thread(tx_streamer, quit_event):
+    tx_meta_thr = threading.Thread(target=tx_async_th, args=(tx_streamer, quit_event))
+
+    tx_meta_thr.name = "TX_META_thread"
+    tx_meta_thr.start()
+    return tx_meta_thr
+
+
+# =============================================================================
+#                           Measurement steps
+# =============================================================================
+
+
+def measure_pilot(
+    usrp, tx_streamer, rx_streamer, quit_event, result_queue, at_time=None
+):
+    """
+    Perform a pilot measurement using the specified USRP device and RX streamer.
+
+    This function:
+    - Configures the RX antenna for pilot capture
+    - Starts a receive thread to record samples
+    - Waits until the capture is complete
+    - Restores the default antenna configuration
+
+    Parameters
+    ----------
+    usrp : uhd.usrp.MultiUSRP
+        The USRP device instance.
+    rx_streamer : uhd.usrp.RXStreamer
+        The receive streamer for data capture.
+    quit_event : threading.Event
+        Event object to control and stop the RX thread.
+    result_queue : queue.Queue
+        Queue used to store measurement results (the rx_ref estimate).
+    at_time : float, optional
+        Scheduled start time for the measurement (in seconds).
+    """
+    logger.debug("########### Measure PILOT ###########")
+
+    # ------------------------------------------------------------
+    # 1. Configure RX antenna
+    # ------------------------------------------------------------
+    usrp.set_rx_antenna("TX/RX", 1)
+
+    # ------------------------------------------------------------
+    # 2. Set the transmission start time
+    # ------------------------------------------------------------
+    start_time = uhd.types.TimeSpec(at_time)
+    logger.debug(starting_in(usrp, at_time))
+
+    # ------------------------------------------------------------
+    # 4. Start receive (RX) threads
+    # ------------------------------------------------------------
+
+    rx_thr = rx_thread(
+        usrp,
+        rx_streamer,
+        quit_event,
+        duration=CAPTURE_TIME,
+        res=result_queue,
+        start_time=start_time,
+    )
+
+    # ------------------------------------------------------------
+    # 5. Wait for the capture duration plus some safety margin (delta)
+    # ------------------------------------------------------------
+    time.sleep(CAPTURE_TIME + delta(usrp, at_time))
+
+    # ------------------------------------------------------------
+    # 6. Signal all threads to stop and wait for them to finish
+    # ------------------------------------------------------------
+    quit_event.set()  # Triggers thread termination
+    rx_thr.join()
+
+    # ------------------------------------------------------------
+    # 7. Reset antenna
+    # ------------------------------------------------------------
+    usrp.set_rx_antenna("RX2", 1)
+
+    # ------------------------------------------------------------
+    # 8. Clear the quit event flag to prepare for the next measurement
+    # ------------------------------------------------------------
+    quit_event.clear()
+
+
+def measure_loopback(
+    usrp, tx_streamer, rx_streamer, quit_event, result_queue, at_time=None, record=None
+):
+    # ------------------------------------------------------------
+    # Function: measure_loopback
+    # Purpose:
+    #   This function performs a loopback measurement using a USRP device.
+    #   It transmits a known signal on one channel and simultaneously
+    #   receives it on another channel (loopback). The result is captured,
+    #   stored (np.save to record, if given), and processed later.
+    # ------------------------------------------------------------
+
+    logger.debug("########### Measure LOOPBACK ###########")
+
+    # ------------------------------------------------------------
+    # 1. Configure transmit signal amplitudes
+    # ------------------------------------------------------------
+    amplitudes = [0.0, 0.0]  # Initialize amplitude array for both channels
+    amplitudes[LOOPBACK_TX_CH] = 0.8  # Enable TX on the selected loopback channel
+
+    # ------------------------------------------------------------
+    # 2. Set the transmission start time
+    # ------------------------------------------------------------
+    start_time = uhd.types.TimeSpec(at_time)
+    logger.debug(starting_in(usrp, at_time))
+
+    # ------------------------------------------------------------
+    # 3. (Legacy) Access user settings interface for low-level FPGA control
+    #    Used to switch the USRP into "loopback mode" by writing to
+    #    a register in the user settings interface.
+    #    NOTE: This interface is no longer available in UHD 4.x.
+    # ------------------------------------------------------------
+    user_settings = None
+    try:
+        user_settings = usrp.get_user_settings_iface(1)
+        if user_settings:
+            # Read current register value (for debug)
+            logger.debug(user_settings.peek32(0))
+            # Write a value to activate loopback mode
+            user_settings.poke32(0, SWITCH_LOOPBACK_MODE)
+            # Read again to verify the register value was updated
+            logger.debug(user_settings.peek32(0))
+        else:
+            logger.error("Cannot write to user settings.")
+    except Exception as e:
+        logger.error(e)
+
+    # ------------------------------------------------------------
+    # 4. Start transmit (TX), metadata, and receive (RX) threads
+    # ------------------------------------------------------------
+    tx_thr = tx_thread(
+        usrp,
+        tx_streamer,
+        quit_event,
+        amplitude=amplitudes,
+        phase=[0.0, 0.0],
+        start_time=start_time,
+    )
+
+    # Thread responsible for handling TX metadata (timestamps, etc.)
+    tx_meta_thr = tx_meta_thread(tx_streamer, quit_event)
+
+    # Thread that captures received samples during loopback
+    rx_thr = rx_thread(
+        usrp,
+        rx_streamer,
+        quit_event,
+        duration=CAPTURE_TIME,
+        res=result_queue,
+        start_time=start_time,
+        record=record,
+    )
+
+    # ------------------------------------------------------------
+    # 5. Wait for the capture duration plus some safety margin (delta)
+    # ------------------------------------------------------------
+    time.sleep(CAPTURE_TIME + delta(usrp, at_time))
+
+    # ------------------------------------------------------------
+    # 6. Signal all threads to stop and wait for them to finish
+    # ------------------------------------------------------------
+    quit_event.set()  # Triggers thread termination
+    tx_thr.join()
+    rx_thr.join()
+    tx_meta_thr.join()
+
+    # ------------------------------------------------------------
+    # 7. Reset the RF switch control (disable loopback mode)
+    # ------------------------------------------------------------
+    if user_settings:
+        user_settings.poke32(0, SWITCH_RESET_MODE)
+
+    # ------------------------------------------------------------
+    # 8. Clear the quit event flag to prepare for the next measurement
+    # ------------------------------------------------------------
+    quit_event.clear()
+
+
+def tx_phase_coh(
+    usrp, tx_streamer, quit_event, phase_corr, at_time, SERVER_IP, long_time=True
+):
+    """
+    Transmit a coherent signal with an adjusted phase correction.
+
+    This function starts a transmission thread that sends a signal with
+    a specific phase correction on the loopback transmit channel.
+    It also launches a metadata thread to handle UHD transmission metadata.
+    The function blocks until the transmission time has elapsed, then stops
+    both threads cleanly.
+
+    Args:
+        usrp: The USRP device instance.
+        tx_streamer: UHD transmit streamer.
+        quit_event: Threading event to signal thread termination.
+        phase_corr (float): Phase correction value (in radians).
+        at_time (float): Scheduled start time for transmission.
+        SERVER_IP (str): Server notified that this USRP is in TX mode.
+        long_time (bool): If True, use TX_TIME; otherwise, transmit for 10 seconds.
+    """
+    logger.debug("########### TX with adjusted phases ###########")
+
+    # Initialize arrays for phase and amplitude per TX channel
+    phases = [0.0, 0.0]
+    amplitudes = [0.0, 0.0]
+
+    # Apply phase correction and amplitude to the loopback transmit channel
+    phases[LOOPBACK_TX_CH] = phase_corr
+    amplitudes[LOOPBACK_TX_CH] = 0.8
+
+    logger.debug(f"Phases: {phases}")
+    logger.debug(f"amplitudes: {amplitudes}")
+    logger.debug(f"TX Gain: {FREE_TX_GAIN}")
+
+    # Set the transmit gain for the active channel
+    usrp.set_tx_gain(FREE_TX_GAIN, LOOPBACK_TX_CH)
+
+    # Define the UHD transmission start time
+    start_time = uhd.types.TimeSpec(at_time)
+
+    # Start the transmit thread
+    tx_thr = tx_thread(
+        usrp,
+        tx_streamer,
+        quit_event,
+        amplitude=amplitudes,
+        phase=phases,
+        start_time=start_time,
+    )
+
+    # Start the metadata monitoring thread
+    tx_meta_thr = tx_meta_thread(tx_streamer, quit_event)
+
+    # Send USRP is in TX mode for scope measurements
+    send_usrp_in_tx_mode(SERVER_IP)
+
+    # Allow transmission to continue for the configured duration
+    if long_time:
+        time.sleep(TX_TIME + delta(usrp, at_time))
+    else:
+        time.sleep(10.0 + delta(usrp, at_time))
+
+    # Signal all threads to stop
+    quit_event.set()
+
+    # Ensure both threads terminate cleanly
+    tx_thr.join()
+    tx_meta_thr.join()
+
+    logger.debug("Transmission completed successfully")
+
+    quit_event.clear()
+
+    return tx_thr, tx_meta_thr
@@ -65,13 +65,64 @@ def butter_bandpass_filter(data, lowcut, highcut, fs, order=5, sos=None):
     return y
 
 
-def apply_bandpass(x: np.ndarray, fs=250e3):
-    sos = butter_bandpass(lowcut, highcut, fs, order=9)
+def _split_iq(x):
+    # real and imaginary part as the rows of one array, so both go through a single sosfilt call
+    return np.stack((np.real(x), np.imag(x)))
+
+
+class BandpassFilterBank:
+    """
+    Bandpass filters around f0 (+- cutoff), designed once per (fs, f0, cutoff, order)
+    instead of on every capture. A complex signal is filtered in one sosfilt call over
+    its real and imaginary part; the result equals filtering them separately.
+    """
+
+    def __init__(self):
+        self._sos = {}
+
+    def sos(self, fs=250e3, f0=f0, cutoff=cutoff, order=9):
+        key = (float(fs), float(f0), float(cutoff), int(order))
+        if key not in self._sos:
+            self._sos[key] = butter_bandpass(f0 - cutoff, f0 + cutoff, fs, order=order)
+        return self._sos[key]
+
+    def filter(self, x, fs=250e3, f0=f0, cutoff=cutoff, order=9):
+        y = sosfilt(self.sos(fs, f0, cutoff, order), _split_iq(x))
+        return y[0] + 1j * y[1]
+
+    def stream(self, fs=250e3, f0=f0, cutoff=cutoff, order=9):
+        """A StreamingBandpass for a capture that arrives in chunks."""
+        return StreamingBandpass(self.sos(fs, f0, cutoff, order))
+
+
+class StreamingBandpass:
+    """
+    Filters a complex capture chunk by chunk, carrying the filter state (zi) between
+    chunks: the concatenated output equals filtering the whole capture at once.
+    A chunk is one signal (n,) or one row per channel (channels, n).
+    """
+
+    def __init__(self, sos):
+        self.sos = sos
+        self.reset()
 
-    y_re = butter_bandpass_filter(np.real(x), lowcut, highcut, fs, order=9, sos=sos)
-    y_imag = butter_bandpass_filter(np.imag(x), lowcut, highcut, fs, order=9, sos=sos)
+    def reset(self):
+        # zero initial state, like a single sosfilt call; created on the first chunk
+        self.zi = None
 
-    return y_re + 1j * y_imag
+    def process(self, chunk):
+        iq = _split_iq(chunk)
+        if self.zi is None:
+            self.zi = np.zeros((self.sos.shape[0],) + iq.shape[:-1] + (2,))
+        y, self.zi = sosfilt(self.sos, iq, zi=self.zi)
+        return y[0] + 1j * y[1]
+
+
+filter_bank = BandpassFilterBank()
+
+
+def apply_bandpass(x: np.ndarray, fs=250e3):
+    return filter_bank.filter(x, fs)
 
 
 def compute_instantaneous_frequency(x: np.ndarray, fs=250e3):
@@ -81,17 +132,12 @@ def compute_instantaneous_frequency(x: np.ndarray, fs=250e3):
     return freq_offset
 
 def get_phases_and_apply_bandpass(x: np.ndarray, fs=250e3):
-    sos = butter_bandpass(lowcut, highcut, fs, order=9)
-
     phase = np.angle(x)
     # Approximate instantaneous frequency offset via phase derivative
     dphi = np.unwrap(np.angle(x[1:] * np.conj(x[:-1])))
     freq_offset = (fs / (2 * np.pi)) * np.mean(dphi)
 
-    y_re = butter_bandpass_filter(np.real(x), lowcut, highcut, fs, order=9, sos=sos)
-    y_imag = butter_bandpass_filter(np.imag(x), lowcut, highcut, fs, order=9, sos=sos)
-
-    y = y_re + 1j * y_imag
+    y = filter_bank.filter(x, fs)
 
     return (
         np.angle(y),
@@ -100,16 +146,251 @@ def get_phases_and_apply_bandpass(x: np.ndarray, fs=250e3):
     )
 
 
+class StreamingPhaseEstimator:
+    """
+    On-the-fly version of the rx_ref post-processing (get_phases_and_apply_bandpass
+    per channel, circmean of the CH0 - CH1 phase difference, amplitudes): update()
+    takes each received packet (channels, n), the result is ready as soon as the
+    capture stops and no IQ has to be kept.
+
+    The first skip samples are dropped (settling), the rest is bandpass filtered with
+    the filter state carried between packets. Statistics are running sums, so they
+    match the block computation up to float summation order.
+    """
+
+    def __init__(self, num_channels=2, skip=0, fs=250e3):
+        self.fs = fs
+        self.skip = int(skip)
+        self.bandpass = filter_bank.stream(fs)
+        self.num_received = 0
+        self.num_samples = 0
+        self.diff_sum = 0j  # sum of exp(1j * (phase CH0 - phase CH1))
+        self.diff_lin_sum = 0.0
+        self.diff_min = np.inf
+        self.diff_max = -np.inf
+        self.phase_lin_sum = np.zeros(num_channels)
+        self.abs_sum = np.zeros(num_channels)
+        self.power_sum = np.zeros(num_channels)
+        self.max_I = np.zeros(num_channels)
+        self.max_Q = np.zeros(num_channels)
+        # sums of exp(1j * sample-to-sample rotation), before and after the bandpass
+        self.rot_before = np.zeros(num_channels, dtype=complex)
+        self.rot_after = np.zeros(num_channels, dtype=complex)
+        self._last_x = None
+        self._last_y = None
+
+    @staticmethod
+    def _rotations(x, last):
+        if last is not None:
+            x = np.concatenate((last[:, None], x), axis=1)
+        z = x[:, 1:] * np.conj(x[:, :-1])
+        m = np.abs(z)
+        # z / |z| is exp(1j * angle(z)), without the angle round trip
+        return np.sum(np.divide(z, m, out=np.ones_like(z), where=m > 0), axis=1)
+
+    def update(self, samples):
+        n = samples.shape[1]
+        start = min(max(self.skip - self.num_received, 0), n)
+        self.num_received += n
+        x = samples[:, start:]
+        if x.shape[1] == 0:
+            return
+
+        y = self.bandpass.process(x)
+        phase = np.angle(y)
+        diff = to_min_pi_plus_pi(phase[0] - phase[1], deg=False)
+        self.diff_sum += np.sum(np.exp(1j * diff))
+        self.diff_lin_sum += np.sum(diff)
+        self.diff_min = min(self.diff_min, diff.min())
+        self.diff_max = max(self.diff_max, diff.max())
+        self.phase_lin_sum += np.sum(phase, axis=1)
+
+        ampl = np.abs(x)
+        self.abs_sum += np.sum(ampl, axis=1)
+        self.power_sum += np.sum(ampl.astype(float) ** 2, axis=1)
+        self.max_I = np.maximum(self.max_I, np.max(np.abs(np.real(x)), axis=1))
+        self.max_Q = np.maximum(self.max_Q, np.max(np.abs(np.imag(x)), axis=1))
+
+        self.rot_before += self._rotations(x, self._last_x)
+        self.rot_after += self._rotations(y, self._last_y)
+        self._last_x, self._last_y = x[:, -1], y[:, -1]
+        self.num_samples += x.shape[1]
+
+    def result(self):
+        """Estimates over the samples seen so far (phases in rad, frequencies in Hz)."""
+        n = self.num_samples
+        if n == 0:
+            nan = np.full(self.abs_sum.shape, np.nan)
+            return {
+                "num_samples": 0,
+                "phase_diff": np.nan,
+                "phase_diff_mean": np.nan,
+                "phase_diff_min": np.nan,
+                "phase_diff_max": np.nan,
+                "phase_mean": nan,
+                "freq_before": nan,
+                "freq_after": nan,
+                "avg_ampl": nan,
+                "A_rms": nan,
+                "max_I": nan,
+                "max_Q": nan,
+            }
+        return {
+            "num_samples": n,
+            "phase_diff": float(np.angle(self.diff_sum)),
+            "phase_diff_mean": self.diff_lin_sum / n,
+            "phase_diff_min": float(self.diff_min),
+            "phase_diff_max": float(self.diff_max),
+            "phase_mean": self.phase_lin_sum / n,
+            "freq_before": self.fs / (2 * np.pi) * np.angle(self.rot_before),
+            "freq_after": self.fs / (2 * np.pi) * np.angle(self.rot_after),
+            "avg_ampl": self.abs_sum / n,
+            "A_rms": np.sqrt(self.power_sum / n),
+            "max_I": self.max_I,
+            "max_Q": self.max_Q,
+        }
+
+
+class RingCapture:
+    """
+    Fixed-size IQ store for rx_ref: after skipping the first skip samples, keeps the
+    last tail samples per channel in a preallocated ring, so memory does not grow
+    with the capture time and no data is refused when the capture runs long.
+    tail=0 keeps no IQ and only counts.
+
+    counters() reports what happened on the way: samples received, kept and
+    discarded (pushed out of the tail, the skipped ones not included) and the
+    receive errors by name (overflow and late are always present).
+    """
+
+    def __init__(self, num_channels, tail, skip=0):
+        self.tail = int(tail)
+        self.skip = int(skip)
+        self.buffer = np.empty((num_channels, self.tail), dtype=np.complex64)
+        self.num_received = 0
+        self.num_written = 0  # samples after skip, including overwritten ones
+        self.errors = {"overflow": 0, "late": 0}
+
+    def push(self, samples):
+        n = samples.shape[1]
+        start = min(max(self.skip - self.num_received, 0), n)
+        self.num_received += n
+        x = samples[:, start:]
+        k = x.shape[1]
+        if k == 0 or self.tail == 0:
+            self.num_written += k
+            return
+        if k > self.tail:
+            x = x[:, k - self.tail :]
+            self.num_written += k - self.tail
+            k = self.tail
+        pos = self.num_written % self.tail
+        first = min(k, self.tail - pos)
+        self.buffer[:, pos : pos + first] = x[:, :first]
+        self.buffer[:, : k - first] = x[:, first:]
+        self.num_written += k
+
+    def error(self, error_code):
+        """Counts a receive error (a uhd RXMetadataErrorCode, counted by name)."""
+        name = getattr(error_code, "name", str(error_code).split(".")[-1])
+        self.errors[name] = self.errors.get(name, 0) + 1
+
+    def samples(self):
+        """The kept samples (channels, n), oldest first."""
+        n = min(self.num_written, self.tail)
+        if n < self.tail or self.tail == 0:
+            return self.buffer[:, :n]
+        pos = self.num_written % self.tail
+        return np.concatenate((self.buffer[:, pos:], self.buffer[:, :pos]), axis=1)
+
+    def counters(self):
+        kept = min(self.num_written, self.tail)
+        return {
+            "received": self.num_received,
+            "kept": kept,
+            "discarded": self.num_written - kept,
+            **self.errors,
+        }
+
+
+def _aligned_empty(shape, dtype=np.complex64, align=64):
+    # np.empty on a cache-line boundary: a raw byte buffer with the offset cut off the front
+    dtype = np.dtype(dtype)
+    nbytes = int(np.prod(shape)) * dtype.itemsize
+    raw = np.empty(nbytes + align, dtype=np.uint8)
+    offset = -raw.ctypes.data % align
+    return raw[offset : offset + nbytes].view(dtype).reshape(shape)
+
+
+class TxWaveformCache:
+    """
+    Transmit buffers for tx_ref, one per (channels, packet size), allocated once
+    (64-byte aligned) and reused by every later transmission of that shape.
+
+    constant() returns the buffer holding amplitude * e^(j * phase) per channel: when
+    phase and amplitude are those of the previous call it is returned as is, otherwise
+    the new values are written into the same buffer. Re-beamforming between iterations
+    thus costs a fill, not an allocation. random() refills it with random phases.
+
+    The buffers belong to the cache: callers only send them. They are not marked
+    read-only because uhd's send() asks for a writeable C array and would copy a
+    read-only one on every call. A buffer is rewritten when the next transmission of
+    its shape is prepared, so the previous one must have ended (tx_ref returned).
+    """
+
+    def __init__(self, packets=1000):
+        self.packets = int(packets)
+        self._buffers = {}
+        self._contents = {}  # (phase, amplitude) currently in each buffer
+
+    def _buffer(self, num_channels, max_samps_per_packet):
+        key = (int(num_channels), int(max_samps_per_packet))
+        if key not in self._buffers:
+            self._buffers[key] = _aligned_empty((key[0], self.packets * key[1]))
+            self._contents[key] = None
+        return key, self._buffers[key]
+
+    def constant(self, phase, amplitude, num_channels, max_samps_per_packet):
+        key, buffer = self._buffer(num_channels, max_samps_per_packet)
+        amplitude = np.broadcast_to(np.asarray(amplitude, dtype=float), (key[0],))
+        phase = np.broadcast_to(np.asarray(phase, dtype=float), (key[0],))
+        contents = (tuple(phase), tuple(amplitude))
+        if self._contents[key] != contents:
+            # fill row by row in place: A * e^(j * phi), no (channels, n) temporary
+            for row, sample in zip(buffer, amplitude * np.exp(1j * phase)):
+                row.fill(sample)
+            self._contents[key] = contents
+        return buffer
+
+    def random(self, amplitude, num_channels, max_samps_per_packet, rng=np.random):
+        key, buffer = self._buffer(num_channels, max_samps_per_packet)
+        amplitude = np.broadcast_to(np.asarray(amplitude, dtype=float), (key[0],))
+        for row, a in zip(buffer, amplitude):
+            # random phase per sample, written through the real/imaginary views
+            angle = rng.random_sample(row.shape).astype(np.float32) * np.float32(2 * np.pi)
+            np.cos(angle, out=row.real)
+            np.sin(angle, out=row.imag)
+            row *= np.float32(a)
+        self._contents[key] = None  # never reused as a constant tone
+        return buffer
+
+    def clear(self):
+        """Frees all buffers."""
+        self._buffers.clear()
+        self._contents.clear()
+
+
+tx_waveforms = TxWaveformCache()
+
+
 def get_phases_and_remove_CFO(x, fs=250e3, remove_first_samples=True):
 
-    sos = butter_bandpass(lowcut, highcut, fs, order=9)
-    y_re = butter_bandpass_filter(np.real(x), lowcut, highcut, fs, order=9, sos=sos)
-    y_imag = butter_bandpass_filter(np.imag(x), lowcut, highcut, fs, order=9, sos=sos)
+    y = filter_bank.filter(x, fs)
 
-    # return np.angle(y_re + 1j * y_imag)
+    # return np.angle(y)
 
-    angle_unwrapped = np.unwrap(np.angle(y_re + 1j * y_imag))
-    t = np.arange(0, len(y_re)) * (1 / fs)
+    angle_unwrapped = np.unwrap(np.angle(y))
+    t = np.arange(0, len(y)) * (1 / fs)
 
     lin_regr = stats.linregress(t, angle_unwrapped)
     angles = angle_unwrapped - lin_regr.slope * t
@@ -0,0 +1,274 @@
+"""
+Producer/consumer plumbing for the recorders.
+
+An AcquisitionThread polls the instruments and pushes timestamped samples into
+a SampleRing. Each consumer (sample writer, live plot, ...) drains the ring at
+its own pace, so a slow plot redraw or fsync no longer delays the next
+instrument read. The ring is bounded: a consumer that falls more than
+`capacity` samples behind loses the oldest ones, and those are counted.
+"""
+
+import threading
+from time import monotonic, sleep, time
+
+SCHEDULER_MODES = ("fixed", "rate", "event")
+
+
+class SampleRing:
+    """
+    Bounded ring buffer with one read cursor per named consumer.
+
+    push() never blocks. drain(consumer) returns everything that consumer has
+    not seen yet, oldest first, as (t_arrival, sample) tuples.
+    """
+
+    def __init__(self, capacity, consumers):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacity = int(capacity)
+        self._items = [None] * self.capacity
+        self._head = 0  # total number of samples pushed
+        self._cursor = {name: 0 for name in consumers}
+        self._dropped = {name: 0 for name in consumers}
+        self._max_depth = {name: 0 for name in consumers}
+        self._cond = threading.Condition()
+
+    def push(self, sample, t_arrival=None):
+        with self._cond:
+            self._items[self._head % self.capacity] = (time() if t_arrival is None else t_arrival, sample)
+            self._head += 1
+            for name, cursor in self._cursor.items():
+                depth = self._head - cursor
+                if depth > self._max_depth[name]:
+                    self._max_depth[name] = min(depth, self.capacity)
+            self._cond.notify_all()
+
+    def drain(self, consumer, timeout=None, max_items=None):
+        """Return pending (t_arrival, sample) tuples for consumer; wait up to timeout if there are none."""
+        with self._cond:
+            if self._head == self._cursor[consumer] and timeout:
+                self._cond.wait(timeout)
+            cursor = self._cursor[consumer]
+            if self._head - cursor > self.capacity:
+                self._dropped[consumer] += self._head - cursor - self.capacity
+                cursor = self._head - self.capacity
+            end = self._head if max_items is None else min(self._head, cursor + max_items)
+            batch = [self._items[i % self.capacity] for i in range(cursor, end)]
+            self._cursor[consumer] = end
+            return batch
+
+    def depth(self, consumer):
+        with self._cond:
+            return min(self._head - self._cursor[consumer], self.capacity)
+
+    def stats(self):
+        """Counters per consumer: current depth, max depth seen and samples dropped."""
+        with self._cond:
+            return {
+                "pushed": self._head,
+                "depth": {n: min(self._head - c, self.capacity) for n, c in self._cursor.items()},
+                "max_depth": dict(self._max_depth),
+                "dropped": {
+                    n: self._dropped[n] + max(self._head - c - self.capacity, 0)
+                    for n, c in self._cursor.items()
+                },
+            }
+
+
+class AcquisitionScheduler:
+    """
+    Paces an acquisition loop; call start() once and wait(got_sample) after
+    every read attempt.
+
+    Modes (``acquisition:`` section in experiment-settings.yaml):
+    - fixed: sleep `interval` seconds after every read (the old sleep(0.1)).
+    - rate:  deadline-based pacing at `rate_hz`. Deadlines are anchored to the
+             start time, so sleep jitter and read latency do not accumulate;
+             when a read overruns a whole period the missed slots are skipped
+             (counted in .overruns) instead of bursting to catch up.
+    - event: re-poll every `event_poll_interval` seconds until a read returns
+             new data (e.g. a fresh positioner sample), then read again at once,
+             optionally capped at `rate_hz`. New data is got_sample: the read
+             function must return None (a miss) for a value it already returned.
+    """
+
+    def __init__(self, mode="fixed", rate_hz=None, interval=0.1, event_poll_interval=0.002):
+        if mode not in SCHEDULER_MODES:
+            raise ValueError(f"acquisition mode must be one of: {', '.join(SCHEDULER_MODES)}")
+        if mode == "rate" and not rate_hz:
+            raise ValueError("acquisition mode 'rate' needs a positive rate_hz")
+        self.mode = mode
+        self.rate_hz = float(rate_hz) if rate_hz else None
+        self.period = 1.0 / self.rate_hz if self.rate_hz else None
+        self.interval = float(interval)
+        self.event_poll_interval = float(event_poll_interval)
+        self.samples = 0
+        self.attempts = 0
+        self.overruns = 0
+        self._t_start = None
+        self._t_end = None
+        self._next = None
+        self._last_sample = None
+
+    @classmethod
+    def from_settings(cls, acquisition_settings):
+        """Build a scheduler from the ``acquisition:`` settings dict (None -> fixed 0.1 s)."""
+        cfg = acquisition_settings or {}
+        return cls(
+            mode=cfg.get("mode", "fixed"),
+            rate_hz=cfg.get("rate_hz"),
+            interval=cfg.get("interval", 0.1),
+            event_poll_interval=cfg.get("event_poll_interval", 0.002),
+        )
+
+    def start(self):
+        self._t_start = monotonic()
+        self._t_end = None
+        self._next = self._t_start
+
+    def stop(self):
+        self._t_end = monotonic()
+
+    def wait(self, got_sample):
+        """Account for one read attempt and sleep until the next one is due."""
+        self.attempts += 1
+        if got_sample:
+            self.samples += 1
+        now = monotonic()
+
+        if self.mode == "fixed":
+            sleep(self.interval)
+            return
+
+        if self.mode == "rate":
+            self._next += self.period
+            if now - self._next >= self.period:
+                skipped = int((now - self._next) // self.period)
+                self.overruns += skipped
+                self._next += skipped * self.period
+            delay = self._next - now
+            if delay > 0:
+                sleep(delay)
+            return
+
+        # event
+        if not got_sample:
+            sleep(self.event_poll_interval)
+            return
+        if self.period is not None:
+            if self._last_sample is not None:
+                delay = self._last_sample + self.period - now
+                if delay > 0:
+                    sleep(delay)
+            self._last_sample = monotonic()
+
+    def elapsed(self):
+        if self._t_start is None:
+            return 0.0
+        return (self._t_end or monotonic()) - self._t_start
+
+    def requested_rate_desc(self):
+        if self.mode == "fixed":
+            return f"fixed {self.interval:g} s sleep (<= {1.0 / self.interval:.1f} Hz)" if self.interval > 0 else "fixed, no sleep"
+        if self.mode == "rate":
+            return f"{self.rate_hz:.1f} Hz"
+        cap = f", max {self.rate_hz:.1f} Hz" if self.rate_hz else ""
+        return f"event-driven (poll {self.event_poll_interval * 1e3:.1f} ms{cap})"
+
+    def report(self):
+        """Requested vs achieved sample rate for the end-of-run summary."""
+        elapsed = self.elapsed()
+        achieved = self.samples / elapsed if elapsed > 0 else 0.0
+        attempts = self.attempts / elapsed if elapsed > 0 else 0.0
+        text = (
+            f"requested {self.requested_rate_desc()}, achieved {achieved:.2f} Hz "
+            f"({self.samples} samples / {elapsed:.1f} s; {attempts:.2f} reads/s)"
+        )
+        if self.mode == "rate":
+            text += f", {self.overruns} skipped slots"
+        return text
+
+
+class AcquisitionThread(threading.Thread):
+    """
+    Calls acquire() in a loop and pushes every non-None result into the ring.
+    None counts as a miss (no fresh data). The scheduler paces the reads. An
+    exception stops the thread and is kept in .error so the main thread can
+    re-raise it.
+    """
+
+    def __init__(self, acquire, ring, scheduler):
+        super().__init__(name="acquisition", daemon=True)
+        self.acquire = acquire
+        self.ring = ring
+        self.scheduler = scheduler
+        self.stop_event = threading.Event()
+        self.samples = 0
+        self.misses = 0
+        self.error = None
+
+    def run(self):
+        self.scheduler.start()
+        try:
+            while not self.stop_event.is_set():
+                sample = self.acquire()
+                if sample is None:
+                    self.misses += 1
+                else:
+                    self.ring.push(sample)
+                    self.samples += 1
+                self.scheduler.wait(sample is not None)
+        except Exception as exc:
+            self.error = exc
+        finally:
+            self.scheduler.stop()
+
+    def stop(self, timeout=None):
+        self.stop_event.set()
+        self.join(timeout)
+
+
+class ConsumerThread(threading.Thread):
+    """
+    Drains one consumer of the ring in the background and hands each
+    non-empty batch to handle_batch(batch). On stop() it drains what is left
+    before exiting.
+    """
+
+    def __init__(self, ring, consumer, handle_batch, idle_timeout=0.5):
+        super().__init__(name=f"consumer-{consumer}", daemon=True)
+        self.ring = ring
+        self.consumer = consumer
+        self.handle_batch = handle_batch
+        self.idle_timeout = idle_timeout
+        self.stop_event = threading.Event()
+        self.error = None
+
+    def run(self):
+        try:
+            while not self.stop_event.is_set():
+                batch = self.ring.drain(self.consumer, timeout=self.idle_timeout)
+                if batch:
+                    self.handle_batch(batch)
+            batch = self.ring.drain(self.consumer)
+            if batch:
+                self.handle_batch(batch)
+        except Exception as exc:
+            self.error = exc
+
+    def stop(self, timeout=None):
+        self.stop_event.set()
+        self.join(timeout)
+
+
+def format_pipeline_stats(ring, acquisition=None):
+    """One-line summary of ring counters (and acquisition misses) for logging."""
+    stats = ring.stats()
+    parts = [f"pushed={stats['pushed']}"]
+    if acquisition is not None:
+        parts.append(f"misses={acquisition.misses}")
+    for name in stats["depth"]:
+        parts.append(
+            f"{name}: depth={stats['depth'][name]} max={stats['max_depth'][name]} dropped={stats['dropped'][name]}"
+        )
+    return ", ".join(parts)
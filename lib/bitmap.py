@@ -0,0 +1,51 @@
+"""
+Pixel-exact PNG export of heatmap grids.
+
+The *_bitmap.png products are embedded by the PGFPlots snippets that
+export_heatmap_tex writes (``\\addplot graphics`` stretched over the grid
+extent, with axes and colorbar drawn by TikZ). They therefore must contain the
+grid and nothing else: no axes, no padding, and every cell the same number of
+pixels. write_heatmap_png maps a (nx, ny) grid through a matplotlib colormap and
+vmin/vmax (autoscaled from the finite values when omitted, like imshow) and
+writes the RGBA pixels directly, each cell as a scale x scale block. Row 0 of
+the PNG is the highest y, so the image has the orientation of
+imshow(origin="lower").
+"""
+
+import matplotlib
+import numpy as np
+from matplotlib.colors import Normalize, to_rgba
+from PIL import Image
+
+DEFAULT_SCALE = 8
+# The figure-based bitmaps showed empty (NaN) cells as the white figure background.
+DEFAULT_BAD_COLOR = "white"
+
+
+def heatmap_rgba(data, cmap, vmin=None, vmax=None, bad_color=DEFAULT_BAD_COLOR):
+    """(nx, ny) grid -> (ny, nx, 4) uint8 RGBA, top row = highest y."""
+    values = np.ma.masked_invalid(np.asarray(data, dtype=float).T[::-1])
+    norm = Normalize(vmin=vmin, vmax=vmax)
+    norm.autoscale_None(values)
+    if isinstance(cmap, str):
+        cmap = matplotlib.colormaps[cmap]
+    cmap = cmap.with_extremes(bad=bad_color)
+    return cmap(norm(values), bytes=True)
+
+
+def upscale(pixels, scale):
+    """Repeat every pixel into a scale x scale block (nearest neighbour, no smoothing)."""
+    scale = int(scale)
+    if scale < 1:
+        raise ValueError("bitmap scale must be a positive integer")
+    if scale == 1:
+        return pixels
+    return np.repeat(np.repeat(pixels, scale, axis=0), scale, axis=1)
+
+
+def write_heatmap_png(path, data, cmap, vmin=None, vmax=None, scale=DEFAULT_SCALE, bad_color=DEFAULT_BAD_COLOR):
+    """Write a (nx, ny) grid as a PNG of exactly (ny * scale, nx * scale) pixels."""
+    pixels = upscale(heatmap_rgba(data, cmap, vmin, vmax, bad_color), scale)
+    if to_rgba(bad_color)[3] == 1.0:
+        pixels = pixels[..., :3]  # every pixel is opaque
+    Image.fromarray(np.ascontiguousarray(pixels)).save(path, compress_level=1)
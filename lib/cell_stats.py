@@ -0,0 +1,295 @@
+"""
+Mergeable per-cell statistics on the canonical grid, for cross-folder composites.
+
+CellStats keeps, per grid cell, the sample count, the sum and M2 (the sum of
+squared deviations from the cell mean) plus a QuantileSketch for the median.
+Cells are those of a HeatmapGrid (lib/heatmap_grid.py), the lattice every
+folder bins on, so the statistics of any two folders on the same grid line up
+cell by cell. Each object only stores the window of lattice cells its samples
+touched; the window grows as samples arrive.
+
+Statistics combine as array algebra:
+
+- merge():    pool another CellStats into this one (Chan et al.'s pairwise
+              update for M2), e.g. repeated runs of the same experiment.
+- subtract(): remove a CellStats that was merged in before (the inverse
+              update), e.g. one run out of a pooled composite.
+- ratio():    per-cell ratio of two aggregates on a common window, e.g. a
+              folder's mean power over a baseline's (10 log10 of it is the
+              delta map in dB).
+
+state()/from_state() convert to/from a dict of plain arrays (for the folder
+cache), save()/load() to/from an .npz file. Samples outside the grid (see
+HeatmapGrid.locate) are ignored; NaN values are counted (and make the cell's
+mean NaN, like np.mean) but not sketched.
+"""
+
+import numpy as np
+
+from lib.heatmap_accumulator import DEFAULT_RELATIVE_ACCURACY, QuantileSketch
+from lib.heatmap_grid import HeatmapGrid, union_windows
+from lib.sparse_heatmap import SparseHeatmap
+
+CELL_STATS_AGGREGATIONS = ("mean", "median")
+
+
+class CellStats:
+    """Per-cell count/sum/M2/quantile sketch on a HeatmapGrid; see the module docstring."""
+
+    def __init__(self, grid, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+        self.grid = grid
+        self.offset = (0, 0)  # lattice index of the window's first cell
+        self.shape = (0, 0)
+        self.count = np.zeros(0, dtype=np.int64)  # flat, row-major over the window
+        self.sum = np.zeros(0)
+        self.m2 = np.zeros(0)
+        self.sketch = QuantileSketch(0, relative_accuracy)
+
+    @property
+    def relative_accuracy(self):
+        return self.sketch.relative_accuracy
+
+    @property
+    def window(self):
+        """(ix0, iy0, nx, ny): lattice index of the first cell and the window size."""
+        return self.offset + self.shape
+
+    def edges(self):
+        """(x_edges, y_edges) of the window."""
+        return self.grid.edges(self.window)
+
+    def _check_compatible(self, other):
+        if other.grid != self.grid or other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("cell statistics must share their grid and relative accuracy")
+
+    def _grow(self, window):
+        """Extend the window to cover another (ix0, iy0, nx, ny) window."""
+        ix0, iy0, nx, ny = window
+        if nx == 0 or ny == 0:
+            return
+        if self.count.size:
+            ix0, iy0, nx, ny = union_windows(self.window, window)
+        if (ix0, iy0, nx, ny) == self.window:
+            return
+        cell_map = _cell_map(self.window, (ix0, iy0, nx, ny))
+        for name in ("count", "sum", "m2"):
+            old = getattr(self, name)
+            new = np.zeros(nx * ny, dtype=old.dtype)
+            new[cell_map] = old
+            setattr(self, name, new)
+        self.sketch.remap(cell_map, nx * ny)
+        self.offset, self.shape = (ix0, iy0), (nx, ny)
+
+    def _combine(self, count, total, m2, sign=1):
+        """Pool (sign=1) or remove (sign=-1) flat per-cell statistics on this window."""
+        n_a, s_a = self.count, self.sum
+        if sign > 0:
+            n = n_a + count
+            both = (n_a > 0) & (count > 0)
+            delta = np.zeros(n.size)
+            delta[both] = total[both] / count[both] - s_a[both] / n_a[both]
+            self.m2 = self.m2 + m2
+            self.m2[both] += delta[both] ** 2 * n_a[both] * count[both] / n[both]
+            self.sum = s_a + total
+        else:
+            if (count > n_a).any():
+                raise ValueError("cannot subtract more samples than a cell holds")
+            n = n_a - count
+            rest = (n > 0) & (count > 0)
+            delta = np.zeros(n.size)
+            delta[rest] = total[rest] / count[rest] - (s_a[rest] - total[rest]) / n[rest]
+            self.m2 = self.m2 - m2
+            self.m2[rest] -= delta[rest] ** 2 * n[rest] * count[rest] / n_a[rest]
+            self.m2 = np.maximum(self.m2, 0.0)
+            self.sum = s_a - total
+            self.m2[n == 0] = 0.0
+            self.sum[n == 0] = 0.0
+        self.count = n
+
+    def add(self, xs, ys, vs):
+        """Accumulate samples (x, y, value)."""
+        xs = np.asarray(xs, dtype=float)
+        ys = np.asarray(ys, dtype=float)
+        vs = np.asarray(vs, dtype=float)
+        ix, iy, inside = self.grid.locate(xs, ys)
+        if not inside.any():
+            return self
+        ix, iy, vs = ix[inside], iy[inside], vs[inside]
+        self._grow((int(ix.min()), int(iy.min()), int(ix.max() - ix.min()) + 1, int(iy.max() - iy.min()) + 1))
+        lin = (ix - self.offset[0]) * self.shape[1] + (iy - self.offset[1])
+        size = self.count.size
+        count = np.bincount(lin, minlength=size)
+        total = np.bincount(lin, weights=vs, minlength=size)
+        occupied = count > 0
+        mean = np.zeros(size)
+        mean[occupied] = total[occupied] / count[occupied]
+        m2 = np.bincount(lin, weights=(vs - mean[lin]) ** 2, minlength=size)
+        self._combine(count, total, m2)
+        self.sketch.add(lin, vs)
+        return self
+
+    def _embedded(self, other):
+        """Flat count/sum/M2 and sketch of other, placed on this (covering) window."""
+        cell_map = _cell_map(other.window, self.window)
+        size = self.count.size
+        arrays = []
+        for name in ("count", "sum", "m2"):
+            arr = np.zeros(size, dtype=getattr(other, name).dtype)
+            arr[cell_map] = getattr(other, name)
+            arrays.append(arr)
+        sketch = QuantileSketch(other.sketch.num_cells, other.relative_accuracy)
+        sketch.keys, sketch.counts = other.sketch.keys, other.sketch.counts
+        sketch.remap(cell_map, size)
+        return arrays, sketch
+
+    def merge(self, other):
+        """Pool the samples of another CellStats into this one."""
+        self._check_compatible(other)
+        if other.count.size == 0:
+            return self
+        self._grow(other.window)
+        (count, total, m2), sketch = self._embedded(other)
+        self._combine(count, total, m2)
+        self.sketch.merge(sketch)
+        return self
+
+    def subtract(self, other):
+        """Remove the samples of a CellStats that was merged into this one before."""
+        self._check_compatible(other)
+        if other.count.size == 0:
+            return self
+        if union_windows(self.window, other.window) != self.window:
+            raise ValueError("cannot subtract cell statistics outside this window")
+        (count, total, m2), sketch = self._embedded(other)
+        self._combine(count, total, m2, sign=-1)
+        self.sketch.subtract(sketch)
+        return self
+
+    def copy(self):
+        return CellStats.from_state(self.state())
+
+    @classmethod
+    def pooled(cls, stats):
+        """A new CellStats holding the samples of every CellStats in stats."""
+        stats = list(stats)
+        if not stats:
+            raise ValueError("nothing to pool")
+        result = stats[0].copy()
+        for other in stats[1:]:
+            result.merge(other)
+        return result
+
+    def counts(self):
+        """Samples per cell, shaped like the window."""
+        return self.count.reshape(self.shape).copy()
+
+    def heatmap(self, agg="mean"):
+        """Per-cell mean or (sketched) median, NaN where a cell has no samples."""
+        if agg not in CELL_STATS_AGGREGATIONS:
+            raise ValueError(f"agg must be one of: {', '.join(CELL_STATS_AGGREGATIONS)}")
+        if agg == "median":
+            return self.sketch.quantile(0.5).reshape(self.shape)
+        occupied = self.count > 0
+        result = np.full(self.count.size, np.nan)
+        result[occupied] = self.sum[occupied] / self.count[occupied]
+        return result.reshape(self.shape)
+
+    def sparse(self, agg="mean"):
+        """The occupied cells' aggregate as a SparseHeatmap on this window."""
+        occupied = np.flatnonzero(self.count)
+        xi, yi = np.divmod(occupied, self.shape[1]) if self.count.size else (occupied, occupied)
+        values = self.heatmap(agg).reshape(-1)[occupied]
+        return SparseHeatmap(self.grid, self.window, xi, yi, values, self.count[occupied])
+
+    def std(self):
+        """Per-cell population standard deviation."""
+        occupied = self.count > 0
+        result = np.full(self.count.size, np.nan)
+        result[occupied] = np.sqrt(self.m2[occupied] / self.count[occupied])
+        return result.reshape(self.shape)
+
+    def on_window(self, values, window):
+        """Place a per-cell array of this window onto another window (NaN where it has no cells)."""
+        result = np.full(window[2] * window[3], np.nan)
+        if self.count.size:
+            ix0, iy0, nx, ny = window
+            xs = np.arange(self.offset[0], self.offset[0] + self.shape[0])
+            ys = np.arange(self.offset[1], self.offset[1] + self.shape[1])
+            in_x = (xs >= ix0) & (xs < ix0 + nx)
+            in_y = (ys >= iy0) & (ys < iy0 + ny)
+            sub = np.asarray(values, dtype=float).reshape(self.shape)[np.ix_(in_x, in_y)]
+            target = result.reshape(nx, ny)
+            target[np.ix_(xs[in_x] - ix0, ys[in_y] - iy0)] = sub
+        return result.reshape(window[2], window[3])
+
+    def aligned(self, other, agg="mean", window=None):
+        """
+        (mine, theirs, x_edges, y_edges): both heatmaps on a common window,
+        by default the union of both windows.
+        """
+        self._check_compatible(other)
+        if window is None:
+            window = union_windows(self.window, other.window) if self.count.size else other.window
+        x_edges, y_edges = self.grid.edges(window)
+        return (
+            self.on_window(self.heatmap(agg), window),
+            other.on_window(other.heatmap(agg), window),
+            x_edges,
+            y_edges,
+        )
+
+    def ratio(self, other, agg="mean", window=None):
+        """(ratio, x_edges, y_edges): this aggregate over other's, per cell (NaN where either is empty)."""
+        mine, theirs, x_edges, y_edges = self.aligned(other, agg, window)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            result = mine / theirs
+        result[~np.isfinite(result)] = np.nan
+        return result, x_edges, y_edges
+
+    def state(self):
+        """State as a dict of arrays (round-trips through np.savez / from_state)."""
+        extent = self.grid.extent if self.grid.extent is not None else (np.nan, np.nan)
+        return {
+            "res": np.array(self.grid.res),
+            "origin": np.array(self.grid.origin),
+            "extent": np.array(extent),
+            "window": np.array(self.window, dtype=np.int64),
+            "count": self.count,
+            "sum": self.sum,
+            "m2": self.m2,
+            "sketch_keys": self.sketch.keys,
+            "sketch_counts": self.sketch.counts,
+            "relative_accuracy": np.array(self.relative_accuracy),
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        extent = np.asarray(state["extent"], dtype=float)
+        grid = HeatmapGrid(float(state["res"]), state["origin"], None if np.isnan(extent).any() else extent)
+        stats = cls(grid, float(state["relative_accuracy"]))
+        ix0, iy0, nx, ny = (int(v) for v in state["window"])
+        if np.shape(state["count"]) != (nx * ny,):
+            raise ValueError("cell statistics state does not match its window")
+        stats.offset, stats.shape = (ix0, iy0), (nx, ny)
+        stats.count = np.array(state["count"], dtype=np.int64)
+        stats.sum = np.array(state["sum"], dtype=float)
+        stats.m2 = np.array(state["m2"], dtype=float)
+        stats.sketch.num_cells = nx * ny
+        stats.sketch.keys = np.array(state["sketch_keys"], dtype=np.int64)
+        stats.sketch.counts = np.array(state["sketch_counts"], dtype=np.int64)
+        return stats
+
+    def save(self, path):
+        np.savez_compressed(path, **self.state())
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as npz:
+            return cls.from_state({name: npz[name] for name in npz.files})
+
+
+def _cell_map(src, dst):
+    """Flat index on window dst of every cell of window src (src must lie within dst)."""
+    ix = np.arange(src[2]) + src[0] - dst[0]
+    iy = np.arange(src[3]) + src[1] - dst[1]
+    return (ix[:, None] * dst[3] + iy[None, :]).ravel()
@@ -0,0 +1,238 @@
+"""
+Time-aligned fusion of the positioner and power streams.
+
+The recorders used to pair whatever positioner.get_data() and the power meter
+returned in the same loop iteration. During fast scans that attaches a power
+reading to a position that is already stale (or repeats an unchanged reading
+at a new position), and plot_all_folders_heatmap.py later has to throw those
+pairs away.
+
+StreamFusion instead timestamps every position and every power reading when it
+arrives and buffers both. Each power reading is then located at its own
+arrival time:
+
+- interpolate: linear interpolation between the positions just before and just
+               after it, if both are within `tolerance` seconds; otherwise the
+               nearest of the two if that one is within tolerance.
+- nearest:     the nearest position within `tolerance` seconds.
+
+Power readings with no position within tolerance are dropped (and counted).
+A reading is held back until a later position has arrived or `tolerance` has
+passed, so a fused sample is emitted at most ~tolerance after its reading.
+Readings identical to the previous one (the meter has not updated yet) are
+dropped as stale when drop_repeated_power is set; by default they are fused
+and written like any other, so the recorded data stays raw.
+
+Positions are stamped when they are read, so a position get_data() returns
+again before the positioner updates (same timestamp and xyz) would look fresh:
+those are always dropped and counted as repeated.
+
+Fused samples are SAMPLE_DTYPE record tuples; ``t`` is the power arrival time
+as seconds of day (local time), the same scale as the positioner's "HH:MM:SS"
+timestamps but with sub-second resolution.
+"""
+
+import threading
+from bisect import bisect_left, bisect_right
+from time import localtime, time
+
+import numpy as np
+
+from lib.snapshot import position_key
+
+FUSION_METHODS = ("pair", "interpolate", "nearest")
+MAX_BUFFERED_POSITIONS = 100_000
+
+
+def seconds_of_day(t):
+    """Epoch seconds -> local seconds of day (float)."""
+    lt = localtime(t)
+    return lt.tm_hour * 3600.0 + lt.tm_min * 60.0 + lt.tm_sec + (t % 1.0)
+
+
+class _FusionInput:
+    """push() adapter so an AcquisitionThread can feed one fusion stream like a ring."""
+
+    def __init__(self, add):
+        self._add = add
+
+    def push(self, sample, t_arrival=None):
+        self._add(sample, t_arrival)
+
+
+class StreamFusion:
+    """
+    Thread-safe: positions and power readings may be added from different
+    threads. Fused samples go to output.push(row, t_arrival) (e.g. a
+    SampleRing) in power-arrival order and are also returned by
+    add_position()/add_power()/flush().
+    """
+
+    def __init__(self, output=None, method="interpolate", tolerance=0.05, drop_repeated_power=False):
+        if method not in FUSION_METHODS[1:]:
+            raise ValueError(f"fusion method must be one of: {', '.join(FUSION_METHODS[1:])}")
+        if tolerance <= 0:
+            raise ValueError("fusion tolerance must be positive")
+        self.output = output
+        self.method = method
+        self.tolerance = float(tolerance)
+        self.drop_repeated_power = drop_repeated_power
+        self._lock = threading.Lock()
+        self._pos_t = []  # arrival times, non-decreasing
+        self._pos_xyz = []
+        self._pending = []  # (t, pwr_pw, bd_pw), arrival order
+        self._last_position = None  # position_key of the last buffered position
+        self._last_power = None
+        self.counts = {
+            "positions": 0,
+            "power": 0,
+            "interpolated": 0,
+            "nearest": 0,
+            "unmatched": 0,
+            "stale": 0,
+            "repeated": 0,
+        }
+        self.position_input = _FusionInput(lambda pos, t: self.add_position(pos, t))
+        self.power_input = _FusionInput(lambda reading, t: self.add_power(*reading, t=t))
+
+    @classmethod
+    def from_settings(cls, fusion_settings, output=None):
+        """
+        Build from the ``fusion:`` settings dict. Returns None when the section
+        is missing or method is "pair" (the old same-iteration pairing).
+        """
+        cfg = fusion_settings or {}
+        method = cfg.get("method", "pair")
+        if method not in FUSION_METHODS:
+            raise ValueError(f"fusion method must be one of: {', '.join(FUSION_METHODS)}")
+        if method == "pair":
+            return None
+        return cls(
+            output=output,
+            method=method,
+            tolerance=cfg.get("tolerance", 0.05),
+            drop_repeated_power=cfg.get("drop_repeated_power", False),
+        )
+
+    def is_repeated_position(self, pos):
+        """True (and counted as repeated) if pos is the last buffered position again."""
+        with self._lock:
+            return self._repeats_position(position_key(pos))
+
+    def _repeats_position(self, key):
+        if key != self._last_position:
+            return False
+        self.counts["repeated"] += 1
+        return True
+
+    def add_position(self, pos, t=None):
+        """
+        Buffer one positioner value (object with x, y, z, t) that arrived at t
+        (default: now). A repeat of the last buffered position is dropped.
+        """
+        t = time() if t is None else t
+        key = position_key(pos)
+        with self._lock:
+            if self._repeats_position(key):
+                return []
+            self._last_position = key
+            if self._pos_t and t < self._pos_t[-1]:
+                t = self._pos_t[-1]  # keep the buffer sorted if the clock steps back
+            self._pos_t.append(t)
+            self._pos_xyz.append((float(pos.x), float(pos.y), float(pos.z)))
+            self.counts["positions"] += 1
+            return self._emit_ready(t)
+
+    def add_power(self, pwr_pw, bd_pw=None, t=None):
+        """Buffer one power reading (pW) that arrived at t (default: now)."""
+        t = time() if t is None else t
+        pwr_pw = np.nan if pwr_pw is None else float(pwr_pw)
+        bd_pw = np.nan if bd_pw is None else float(bd_pw)
+        with self._lock:
+            self.counts["power"] += 1
+            reading = (pwr_pw, bd_pw)
+            if self.drop_repeated_power and reading == self._last_power:
+                self.counts["stale"] += 1
+                return []
+            self._last_power = reading
+            self._pending.append((t, pwr_pw, bd_pw))
+            return self._emit_ready(t)
+
+    def flush(self):
+        """Resolve every pending reading with the positions seen so far (call at stop)."""
+        with self._lock:
+            return self._emit_ready(None)
+
+    def _emit_ready(self, now):
+        emitted = []
+        done = 0
+        for t, pwr_pw, bd_pw in self._pending:
+            after = bisect_left(self._pos_t, t)
+            if now is not None and after == len(self._pos_t) and now - t <= self.tolerance:
+                break  # a later position may still arrive
+            done += 1
+            xyz = self._locate(t, after)
+            if xyz is None:
+                self.counts["unmatched"] += 1
+                continue
+            row = (xyz[0], xyz[1], xyz[2], seconds_of_day(t), pwr_pw, bd_pw)
+            emitted.append(row)
+            if self.output is not None:
+                self.output.push(row, t)
+        del self._pending[:done]
+        if self._pending:
+            self._prune(self._pending[0][0])
+        else:
+            # a reading stamped just before the newest position may still be added
+            self._prune(None if now is None else now - self.tolerance)
+        return emitted
+
+    def _locate(self, t, after):
+        """Position at time t; after = index of the first position at or after t."""
+        before = after - 1 if after == len(self._pos_t) or self._pos_t[after] > t else after
+        tol = self.tolerance
+        have_before = before >= 0 and t - self._pos_t[before] <= tol
+        have_after = after < len(self._pos_t) and self._pos_t[after] - t <= tol
+        if self.method == "interpolate" and have_before and have_after:
+            t0, t1 = self._pos_t[before], self._pos_t[after]
+            p0, p1 = self._pos_xyz[before], self._pos_xyz[after]
+            self.counts["interpolated"] += 1
+            if t1 == t0:
+                return p0
+            w = (t - t0) / (t1 - t0)
+            return tuple(a + w * (b - a) for a, b in zip(p0, p1))
+        candidates = []
+        if have_before:
+            candidates.append((t - self._pos_t[before], before))
+        if have_after:
+            candidates.append((self._pos_t[after] - t, after))
+        if not candidates:
+            return None
+        self.counts["nearest"] += 1
+        return self._pos_xyz[min(candidates)[1]]
+
+    def _prune(self, t_ref):
+        """Drop positions that can no longer be the neighbour of a reading at or after t_ref."""
+        if t_ref is None:
+            keep_from = max(len(self._pos_t) - 1, 0)
+        else:
+            # the last position at or before t_ref - tolerance is the oldest one still useful
+            keep_from = max(bisect_right(self._pos_t, t_ref - self.tolerance) - 1, 0)
+        keep_from = max(keep_from, len(self._pos_t) - MAX_BUFFERED_POSITIONS)
+        if keep_from > 0:
+            del self._pos_t[:keep_from]
+            del self._pos_xyz[:keep_from]
+
+    def report(self):
+        """One-line summary of the fusion counters for logging."""
+        with self._lock:
+            c = dict(self.counts)
+            pending = len(self._pending)
+        fused = c["interpolated"] + c["nearest"]
+        return (
+            f"{self.method} (tolerance {self.tolerance * 1e3:.0f} ms): "
+            f"{c['positions']} positions, {c['power']} power readings -> {fused} samples "
+            f"({c['interpolated']} interpolated, {c['nearest']} nearest), "
+            f"{c['unmatched']} unmatched, {c['stale']} stale, {c['repeated']} repeated positions, "
+            f"{pending} pending"
+        )
@@ -0,0 +1,274 @@
+"""
+Streaming per-cell statistics for heatmaps.
+
+HeatmapAccumulator bins (x, y, value) chunks onto fixed grid edges and keeps
+running statistics per cell: count, sum, sum of squares, min and max, plus a
+QuantileSketch for the median. Memory depends on the grid (and the spread of
+values per cell), not on the number of samples, so a folder can be streamed
+chunk by chunk instead of being concatenated first.
+
+add() bins with np.digitize(v, edges) - 1; add_binned() takes cell indices
+computed elsewhere (plot_all_folders_heatmap.py passes the arithmetic indices
+of its canonical grid). Samples outside the grid are ignored. Mean, min and
+max therefore equal the in-memory compute_heatmap result (the mean up to float
+summation order); the median is the sketch estimate, within
+`relative_accuracy` of the exact median (NaN values are counted but not
+sketched).
+
+The state of two accumulators on the same edges can be merged, e.g. to combine
+partial results of separate runs; state()/from_state() convert it to/from a
+dict of plain arrays (for np.savez).
+"""
+
+import numpy as np
+
+AGGREGATIONS = ("mean", "median", "min", "max")
+DEFAULT_RELATIVE_ACCURACY = 0.01
+_MIN_MAGNITUDE = 1e-300  # smaller magnitudes share the zero bucket
+
+
+class QuantileSketch:
+    """
+    Mergeable per-cell quantile sketch with relative error guarantees.
+
+    Values are counted in logarithmic buckets: bucket k of the positive values
+    spans (gamma^(k-1), gamma^k] with gamma = (1 + a) / (1 - a), and is
+    represented by 2 gamma^k / (gamma + 1), which is within relative error a of
+    every value in it. Negative values use mirrored buckets, (near) zero has its
+    own. Only occupied (cell, bucket) pairs are stored, as sorted int64 keys with
+    counts, so merging two sketches is adding counts. Memory grows with the
+    number of occupied pairs: at most the sample count, and at most about
+    ln(max/min) / (2 a) buckets per cell for values spanning [min, max].
+    """
+
+    def __init__(self, num_cells, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+        if not 0.0 < relative_accuracy < 1.0:
+            raise ValueError("relative_accuracy must be in (0, 1)")
+        self.num_cells = int(num_cells)
+        self.relative_accuracy = float(relative_accuracy)
+        gamma = (1.0 + self.relative_accuracy) / (1.0 - self.relative_accuracy)
+        self._gamma = gamma
+        self._log_gamma = np.log(gamma)
+        # Bucket layout per cell: negatives in (0, 2K), zero at 2K, positives in (2K, 4K)
+        self._k_max = int(np.ceil(np.log(np.finfo(float).max) / self._log_gamma)) + 2
+        self._buckets_per_cell = 4 * self._k_max
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.counts = np.zeros(0, dtype=np.int64)
+
+    def _bucket(self, values):
+        magnitude = np.abs(values)
+        k = np.ceil(np.log(np.maximum(magnitude, _MIN_MAGNITUDE)) / self._log_gamma).astype(np.int64)
+        bucket = np.where(values > 0, 3 * self._k_max + k, self._k_max - k)
+        bucket[magnitude < _MIN_MAGNITUDE] = 2 * self._k_max
+        return bucket
+
+    def _bucket_value(self, bucket):
+        k = np.where(bucket > 2 * self._k_max, bucket - 3 * self._k_max, self._k_max - bucket)
+        value = 2.0 * np.power(self._gamma, k.astype(float)) / (self._gamma + 1.0)
+        value = np.where(bucket > 2 * self._k_max, value, -value)
+        value[bucket == 2 * self._k_max] = 0.0
+        return value
+
+    def _insert(self, keys, counts):
+        """Add counts for sorted, unique keys."""
+        if keys.size == 0:
+            return
+        pos = np.searchsorted(self.keys, keys)
+        found = pos < self.keys.size
+        found[found] = self.keys[pos[found]] == keys[found]
+        self.counts[pos[found]] += counts[found]  # keys are unique, so are their positions
+        new = ~found
+        if new.any():
+            self.keys = np.insert(self.keys, pos[new], keys[new])
+            self.counts = np.insert(self.counts, pos[new], counts[new])
+
+    def add(self, cells, values):
+        """Count values (NaN is skipped) into their cells (flat indices)."""
+        values = np.asarray(values, dtype=float)
+        finite = ~np.isnan(values)
+        cells = np.asarray(cells, dtype=np.int64)[finite]
+        keys = cells * self._buckets_per_cell + self._bucket(values[finite])
+        keys, counts = np.unique(keys, return_counts=True)
+        self._insert(keys, counts.astype(np.int64))
+
+    def _check_compatible(self, other):
+        if other.num_cells != self.num_cells or other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("quantile sketches must have the same cells and accuracy")
+
+    def merge(self, other):
+        self._check_compatible(other)
+        self._insert(other.keys, other.counts)
+
+    def subtract(self, other):
+        """Remove values counted in other (which must be a subset of the values counted here)."""
+        self._check_compatible(other)
+        if other.keys.size == 0:
+            return
+        pos = np.searchsorted(self.keys, other.keys)
+        found = pos < self.keys.size
+        found[found] = self.keys[pos[found]] == other.keys[found]
+        counts = self.counts.copy()
+        if found.all():
+            counts[pos] -= other.counts
+        if not found.all() or (counts < 0).any():
+            raise ValueError("cannot subtract a quantile sketch that is not a subset of this one")
+        keep = counts > 0
+        self.keys = self.keys[keep]
+        self.counts = counts[keep]
+
+    def remap(self, cell_map, num_cells):
+        """
+        Renumber cells (old flat index i -> cell_map[i]), e.g. after the grid
+        they index grew. Cells mapped to the same new cell are merged.
+        """
+        cells, buckets = np.divmod(self.keys, self._buckets_per_cell)
+        keys = np.asarray(cell_map, dtype=np.int64)[cells] * self._buckets_per_cell + buckets
+        order = np.argsort(keys, kind="stable")
+        keys, counts = keys[order], self.counts[order]
+        if keys.size:
+            first = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+            keys, counts = keys[first], np.add.reduceat(counts, first)
+        self.keys = keys
+        self.counts = counts
+        self.num_cells = int(num_cells)
+
+    def cell_counts(self):
+        """Number of sketched values per cell."""
+        return np.bincount(self.keys // self._buckets_per_cell, weights=self.counts, minlength=self.num_cells).astype(
+            np.int64
+        )
+
+    def quantile(self, q):
+        """
+        Estimated q-quantile per cell (NaN for empty cells). Like np.median,
+        the value between ranks floor(q (n-1)) and ceil(q (n-1)) is averaged,
+        so q=0.5 matches the even/odd median convention.
+        """
+        if not 0.0 <= q <= 1.0:
+            raise ValueError("q must be in [0, 1]")
+        result = np.full(self.num_cells, np.nan)
+        if self.keys.size == 0:
+            return result
+        n = self.cell_counts()
+        occupied = np.flatnonzero(n)
+        cumulative = np.cumsum(self.counts)
+        before = cumulative - self.counts  # values in earlier keys
+        first_key = np.searchsorted(self.keys, occupied * self._buckets_per_cell)
+        offset = before[first_key]
+        rank = q * (n[occupied] - 1)
+        lo = np.searchsorted(cumulative, offset + np.floor(rank).astype(np.int64), side="right")
+        hi = np.searchsorted(cumulative, offset + np.ceil(rank).astype(np.int64), side="right")
+        buckets = self.keys % self._buckets_per_cell
+        result[occupied] = (self._bucket_value(buckets[lo]) + self._bucket_value(buckets[hi])) / 2.0
+        return result
+
+
+class HeatmapAccumulator:
+    """Running per-cell statistics on fixed x/y edges; see the module docstring."""
+
+    def __init__(self, x_edges, y_edges, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+        self.x_edges = np.asarray(x_edges, dtype=float)
+        self.y_edges = np.asarray(y_edges, dtype=float)
+        self.shape = (len(self.x_edges) - 1, len(self.y_edges) - 1)
+        size = self.shape[0] * self.shape[1]
+        self.count = np.zeros(size, dtype=np.int64)
+        self.sum = np.zeros(size)
+        self.sumsq = np.zeros(size)
+        self.min = np.full(size, np.inf)
+        self.max = np.full(size, -np.inf)
+        self.sketch = QuantileSketch(size, relative_accuracy)
+
+    def bin(self, xs, ys):
+        """Cell indices (xi, yi) of positions, as compute_heatmap assigns them (may be out of range)."""
+        return np.digitize(xs, self.x_edges) - 1, np.digitize(ys, self.y_edges) - 1
+
+    def add(self, xs, ys, vs):
+        """Accumulate one chunk of samples; returns their (xi, yi) cell indices."""
+        xi, yi = self.bin(xs, ys)
+        self.add_binned(xi, yi, vs)
+        return xi, yi
+
+    def add_binned(self, xi, yi, vs):
+        """Accumulate values whose cell indices are already known; out-of-grid cells are ignored."""
+        in_grid = (xi >= 0) & (xi < self.shape[0]) & (yi >= 0) & (yi < self.shape[1])
+        lin = (xi[in_grid] * self.shape[1] + yi[in_grid]).astype(np.intp)
+        if lin.size == 0:
+            return
+        v = np.asarray(vs, dtype=float)[in_grid]
+        size = self.count.size
+        self.count += np.bincount(lin, minlength=size)
+        self.sum += np.bincount(lin, weights=v, minlength=size)
+        self.sumsq += np.bincount(lin, weights=v * v, minlength=size)
+        np.minimum.at(self.min, lin, v)
+        np.maximum.at(self.max, lin, v)
+        self.sketch.add(lin, v)
+
+    def merge(self, other):
+        """Add the statistics of another accumulator on the same edges."""
+        if not (np.array_equal(self.x_edges, other.x_edges) and np.array_equal(self.y_edges, other.y_edges)):
+            raise ValueError("can only merge heatmap accumulators with identical edges")
+        self.count += other.count
+        self.sum += other.sum
+        self.sumsq += other.sumsq
+        # np.minimum/np.maximum (not fmin/fmax) so NaN propagates like it does within a chunk
+        np.minimum(self.min, other.min, out=self.min)
+        np.maximum(self.max, other.max, out=self.max)
+        self.sketch.merge(other.sketch)
+        return self
+
+    def counts(self):
+        """Samples per cell, shaped like the grid."""
+        return self.count.reshape(self.shape).copy()
+
+    def heatmap(self, agg="median"):
+        """Per-cell aggregate (mean, median, min or max), NaN where a cell has no samples."""
+        if agg not in AGGREGATIONS:
+            raise ValueError(f"agg must be one of: {', '.join(AGGREGATIONS)}")
+        occupied = self.count > 0
+        result = np.full(self.count.size, np.nan)
+        if agg == "mean":
+            result[occupied] = self.sum[occupied] / self.count[occupied]
+        elif agg == "min":
+            result[occupied] = self.min[occupied]
+        elif agg == "max":
+            result[occupied] = self.max[occupied]
+        else:
+            result = self.sketch.quantile(0.5)
+        return result.reshape(self.shape)
+
+    def std(self):
+        """Per-cell population standard deviation from sum and sum of squares."""
+        occupied = self.count > 0
+        result = np.full(self.count.size, np.nan)
+        mean = self.sum[occupied] / self.count[occupied]
+        result[occupied] = np.sqrt(np.maximum(self.sumsq[occupied] / self.count[occupied] - mean * mean, 0.0))
+        return result.reshape(self.shape)
+
+    def state(self):
+        """Accumulator state as a dict of arrays (round-trips through np.savez / from_state)."""
+        return {
+            "x_edges": self.x_edges,
+            "y_edges": self.y_edges,
+            "count": self.count,
+            "sum": self.sum,
+            "sumsq": self.sumsq,
+            "min": self.min,
+            "max": self.max,
+            "sketch_keys": self.sketch.keys,
+            "sketch_counts": self.sketch.counts,
+            "relative_accuracy": np.array(self.sketch.relative_accuracy),
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        acc = cls(state["x_edges"], state["y_edges"], float(state["relative_accuracy"]))
+        if np.shape(state["count"]) != acc.count.shape:
+            raise ValueError("accumulator state does not match its edges")
+        acc.count = np.array(state["count"], dtype=np.int64)
+        acc.sum = np.array(state["sum"], dtype=float)
+        acc.sumsq = np.array(state["sumsq"], dtype=float)
+        acc.min = np.array(state["min"], dtype=float)
+        acc.max = np.array(state["max"], dtype=float)
+        acc.sketch.keys = np.array(state["sketch_keys"], dtype=np.int64)
+        acc.sketch.counts = np.array(state["sketch_counts"], dtype=np.int64)
+        return acc
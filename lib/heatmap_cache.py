@@ -0,0 +1,145 @@
+"""
+Per-folder cache for processed scan data, stored in ``data/<folder>/.heatmap_cache/``.
+
+An entry holds the arrays a processing script derived from a folder (binned
+heatmap, per-cell statistics, ...) plus a small JSON meta dict, in its own
+compressed ``<key>.npz``; storing one entry leaves the others untouched. It is
+looked up by the processing parameters (grid resolution, aggregation, filter
+flags, ...) and is only valid for the snapshot files it was built from: the
+file names, sizes and mtimes of every snapshot in the folder form its
+fingerprint. When a snapshot is added, grows (a running recorder) or is
+converted, the fingerprint changes, the entry misses, and stale entries are
+dropped on the next store. At most MAX_ENTRIES parameter sets are kept per
+folder.
+
+The cache is written without changing the folder's mtime, because
+plot_all_folders_heatmap.py orders folders by it.
+"""
+
+import hashlib
+import json
+import os
+from time import time
+
+import numpy as np
+
+from lib.snapshot import (
+    LEGACY_BD_POWER_SUFFIX,
+    LEGACY_POSITIONS_SUFFIX,
+    LEGACY_VALUES_SUFFIX,
+    SAMPLE_LOG_SUFFIX,
+    SAMPLES_SUFFIX,
+)
+
+CACHE_NAME = ".heatmap_cache"
+LEGACY_CACHE_NAME = ".heatmap_cache.npz"  # all entries in one file, replaced on the first store
+CACHE_VERSION = 3  # bump when the cached arrays change layout
+MAX_ENTRIES = 8
+SNAPSHOT_SUFFIXES = (
+    SAMPLES_SUFFIX,
+    SAMPLE_LOG_SUFFIX,
+    LEGACY_POSITIONS_SUFFIX,
+    LEGACY_VALUES_SUFFIX,
+    LEGACY_BD_POWER_SUFFIX,
+)
+_ENTRY = "__entry__"
+
+
+def snapshot_fingerprint(folder_path):
+    """Sorted [name, size, mtime_ns] of every snapshot file in a folder, as a JSON string."""
+    entries = []
+    for name in sorted(os.listdir(folder_path)):
+        if name.endswith(SNAPSHOT_SUFFIXES):
+            st = os.stat(os.path.join(folder_path, name))
+            entries.append([name, st.st_size, st.st_mtime_ns])
+    return json.dumps(entries)
+
+
+def cache_key(params):
+    """Stable short key for a dict of JSON-serializable processing parameters."""
+    text = json.dumps({"version": CACHE_VERSION, **params}, sort_keys=True)
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+
+def _remove(path):
+    # another process (--jobs) may have evicted the same entry
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class FolderCache:
+    """Load/store cache entries for one data folder."""
+
+    def __init__(self, folder_path):
+        self.folder_path = folder_path
+        self.path = os.path.join(folder_path, CACHE_NAME)
+        self.fingerprint = snapshot_fingerprint(folder_path)
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, f"{key}.npz")
+
+    @staticmethod
+    def _read_entry(npz):
+        return json.loads(str(npz[_ENTRY]))
+
+    def load(self, params):
+        """Return (arrays, meta) for params, or None on a miss or a stale entry."""
+        path = self._entry_path(cache_key(params))
+        if not os.path.isfile(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as npz:
+                entry = self._read_entry(npz)
+                if entry["fingerprint"] != self.fingerprint:
+                    return None
+                arrays = {name: npz[name] for name in npz.files if name != _ENTRY}
+        except Exception as exc:
+            print(f"Ignoring unreadable cache entry {path}: {exc}")
+            return None
+        return arrays, entry["meta"]
+
+    def store(self, params, arrays, meta):
+        """Add/replace the entry for params; drop stale entries and keep the newest MAX_ENTRIES."""
+        key = cache_key(params)
+        entry = {"fingerprint": self.fingerprint, "params": params, "meta": meta, "stored": time()}
+        payload = {name: np.asarray(arr) for name, arr in arrays.items()}
+        payload[_ENTRY] = np.array(json.dumps(entry))
+
+        folder_stat = os.stat(self.folder_path)
+        path = self._entry_path(key)
+        tmp_path = f"{path}.tmp"
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                np.savez_compressed(f, **payload)
+            os.replace(tmp_path, path)
+            legacy_path = os.path.join(self.folder_path, LEGACY_CACHE_NAME)
+            if os.path.isfile(legacy_path):
+                os.remove(legacy_path)
+            self._evict(key)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            os.utime(self.folder_path, ns=(folder_stat.st_atime_ns, folder_stat.st_mtime_ns))
+
+    def _evict(self, keep_key):
+        """Remove stale and unreadable entries, then all but the newest MAX_ENTRIES."""
+        stored = {}
+        for name in os.listdir(self.path):
+            if not name.endswith(".npz"):
+                continue
+            key = name[: -len(".npz")]
+            path = self._entry_path(key)
+            try:
+                with np.load(path, allow_pickle=False) as npz:
+                    entry = self._read_entry(npz)
+            except Exception:
+                entry = None
+            if key != keep_key and (entry is None or entry["fingerprint"] != self.fingerprint):
+                _remove(path)
+            else:
+                stored[key] = entry["stored"] if entry is not None else time()
+        for key in sorted(stored, key=stored.get)[:-MAX_ENTRIES]:
+            _remove(self._entry_path(key))
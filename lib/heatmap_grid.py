@@ -0,0 +1,147 @@
+"""
+Canonical heatmap grid shared by every folder.
+
+The grid is a lattice of square cells of `res` meters anchored at `origin`:
+cell (i, j) spans [ox + i res, ox + (i + 1) res) x [oy + j res, oy + (j + 1) res).
+A sample's cell is a floor division (no edge search), and since every folder
+and baseline bins on the same lattice, cell (i, j) is the same patch of the
+room in all of them: heatmaps of different folders line up cell by cell.
+
+A heatmap covers a window (ix0, iy0, nx, ny) of the lattice: the cells its
+samples touched or, when an extent (width, height from the origin) is
+configured, the whole extent, so every folder gets identical edges. Samples
+outside the extent are ignored.
+
+Configured in experiment-settings.yaml:
+
+    heatmap_grid:
+      origin: [0.0, 0.0]       # meters
+      resolution_lambda: 0.04  # cell size as a fraction of the wavelength
+      extent: null             # or [width, height] in meters
+"""
+
+import math
+
+import numpy as np
+
+DEFAULT_RESOLUTION_LAMBDA = 0.04
+
+
+class HeatmapGrid:
+    """Cell lattice (res, origin, optional extent); see the module docstring."""
+
+    def __init__(self, res, origin=(0.0, 0.0), extent=None):
+        if not res > 0:
+            raise ValueError("grid resolution must be positive")
+        self.res = float(res)
+        self.origin = (float(origin[0]), float(origin[1]))
+        self.extent = None
+        self.shape = None  # cells in the extent
+        if extent is not None:
+            width, height = float(extent[0]), float(extent[1])
+            if not (width > 0 and height > 0):
+                raise ValueError("grid extent must be positive")
+            self.extent = (width, height)
+            # a cell that only just crosses the extent because of rounding does not count
+            self.shape = (int(np.ceil(width / self.res - 1e-9)), int(np.ceil(height / self.res - 1e-9)))
+
+    @classmethod
+    def from_settings(cls, grid_settings, wavelength, resolution_lambda=None):
+        """
+        Build from the ``heatmap_grid:`` settings dict (missing keys: origin
+        (0, 0), DEFAULT_RESOLUTION_LAMBDA, no extent). resolution_lambda, when
+        given, overrides the configured resolution.
+        """
+        cfg = grid_settings or {}
+        if resolution_lambda is None:
+            resolution_lambda = cfg.get("resolution_lambda", DEFAULT_RESOLUTION_LAMBDA)
+        origin = cfg.get("origin") or (0.0, 0.0)
+        extent = cfg.get("extent")
+        if len(origin) != 2 or (extent is not None and len(extent) != 2):
+            raise ValueError("heatmap_grid origin and extent must be [x, y] pairs")
+        return cls(float(resolution_lambda) * wavelength, origin, extent)
+
+    def __eq__(self, other):
+        return isinstance(other, HeatmapGrid) and self.params() == other.params()
+
+    def __hash__(self):
+        return hash((self.res, self.origin, self.extent))
+
+    def params(self):
+        """JSON-serializable description, e.g. for cache keys."""
+        return {
+            "res": self.res,
+            "origin": list(self.origin),
+            "extent": list(self.extent) if self.extent is not None else None,
+        }
+
+    @property
+    def full_window(self):
+        """The window of the whole extent, or None without one."""
+        return (0, 0) + self.shape if self.shape is not None else None
+
+    def locate(self, xs, ys):
+        """
+        Lattice cells (ix, iy) of positions plus a mask of the ones inside the
+        grid (finite, and within the extent if there is one; others get 0, 0).
+        """
+        xs = np.asarray(xs, dtype=float)
+        ys = np.asarray(ys, dtype=float)
+        inside = np.isfinite(xs) & np.isfinite(ys)
+        ix = np.zeros(xs.shape, dtype=np.int64)
+        iy = np.zeros(ys.shape, dtype=np.int64)
+        ix[inside] = np.floor((xs[inside] - self.origin[0]) / self.res)
+        iy[inside] = np.floor((ys[inside] - self.origin[1]) / self.res)
+        if self.shape is not None:
+            inside &= (ix >= 0) & (ix < self.shape[0]) & (iy >= 0) & (iy < self.shape[1])
+        return ix, iy, inside
+
+    def cell(self, x, y):
+        """Lattice cell (ix, iy) of one position, or None outside the grid (scalar math, for per-sample use)."""
+        x, y = float(x), float(y)
+        if not (math.isfinite(x) and math.isfinite(y)):
+            return None
+        ix = math.floor((x - self.origin[0]) / self.res)
+        iy = math.floor((y - self.origin[1]) / self.res)
+        if self.shape is not None and not (0 <= ix < self.shape[0] and 0 <= iy < self.shape[1]):
+            return None
+        return ix, iy
+
+    def window(self, ix, iy):
+        """Window of a heatmap holding cells ix, iy (lattice indices inside the grid); None if empty."""
+        if self.shape is not None:
+            return self.full_window
+        if len(ix) == 0:
+            return None
+        ix0, iy0 = int(np.min(ix)), int(np.min(iy))
+        return (ix0, iy0, int(np.max(ix)) - ix0 + 1, int(np.max(iy)) - iy0 + 1)
+
+    def edges(self, window):
+        """(x_edges, y_edges) of a window."""
+        ix0, iy0, nx, ny = window
+        return (
+            self.origin[0] + (ix0 + np.arange(nx + 1)) * self.res,
+            self.origin[1] + (iy0 + np.arange(ny + 1)) * self.res,
+        )
+
+    def window_of(self, x_edges, y_edges):
+        """Window of a heatmap on this grid, from its edges."""
+        return (
+            int(round((x_edges[0] - self.origin[0]) / self.res)),
+            int(round((y_edges[0] - self.origin[1]) / self.res)),
+            len(x_edges) - 1,
+            len(y_edges) - 1,
+        )
+
+    def describe(self):
+        extent = f"{self.extent[0]:.3f}x{self.extent[1]:.3f} m" if self.extent else "none"
+        return f"{self.res:.4f} m (origin ({self.origin[0]:.3f}, {self.origin[1]:.3f}), extent: {extent})"
+
+
+def union_windows(a, b):
+    """Smallest (ix0, iy0, nx, ny) window covering windows a and b (either may be None)."""
+    if a is None or b is None:
+        return a if b is None else b
+    ix0, iy0 = min(a[0], b[0]), min(a[1], b[1])
+    ix1, iy1 = max(a[0] + a[2], b[0] + b[2]), max(a[1] + a[3], b[1] + b[3])
+    return (ix0, iy0, ix1 - ix0, iy1 - iy0)
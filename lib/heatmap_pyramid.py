@@ -0,0 +1,121 @@
+"""
+Multi-resolution heatmap pyramid.
+
+Level 0 is a HeatmapAccumulator (lib/heatmap_accumulator.py) binned on a
+window of a HeatmapGrid (lib/heatmap_grid.py); level k + 1 has cells twice
+the size of level k's, on the same origin and extent. Since the grid is a
+lattice, coarse cell (i, j) is exactly the fine cells (2i..2i+1, 2j..2j+1):
+a coarser level is derived from the one below by merging 2x2 blocks of cell
+statistics (count, sum, sum of squares, min, max and the quantile sketch),
+without re-binning samples.
+
+Mean, min and max of every level are those of binning at its resolution
+directly (the mean up to float summation order); the median is the sketch
+estimate, as for a streamed folder. Picking a resolution is choosing a level
+(level()), a zoom is a window of it (zoom()). state()/from_state() hold all
+levels in one dict of arrays (for np.savez or the folder cache).
+"""
+
+import numpy as np
+
+from lib.heatmap_accumulator import HeatmapAccumulator, QuantileSketch
+from lib.heatmap_grid import HeatmapGrid
+from lib.sparse_heatmap import SparseHeatmap
+
+DEFAULT_LEVELS = 4
+
+
+def coarser_window(window):
+    """Window of the 2x coarser lattice covering window (ix0, iy0, nx, ny)."""
+    ix0, iy0, nx, ny = window
+    cx0, cy0 = ix0 // 2, iy0 // 2
+    return (cx0, cy0, (ix0 + nx - 1) // 2 - cx0 + 1, (iy0 + ny - 1) // 2 - cy0 + 1)
+
+
+def coarsen(grid, window, acc):
+    """(grid, window, accumulator) of the next level: acc's cells merged 2x2."""
+    coarse_grid = HeatmapGrid(2 * grid.res, grid.origin, grid.extent)
+    coarse_window = coarser_window(window)
+    ix0, iy0, nx, ny = window
+    cx0, cy0, _, cny = coarse_window
+    fx, fy = np.divmod(np.arange(nx * ny), ny)  # x-major, like the accumulator's flat cells
+    cell_map = ((ix0 + fx) // 2 - cx0) * cny + (iy0 + fy) // 2 - cy0
+
+    coarse = HeatmapAccumulator(*coarse_grid.edges(coarse_window), acc.sketch.relative_accuracy)
+    size = coarse.count.size
+    coarse.count = np.bincount(cell_map, weights=acc.count, minlength=size).astype(np.int64)
+    coarse.sum = np.bincount(cell_map, weights=acc.sum, minlength=size)
+    coarse.sumsq = np.bincount(cell_map, weights=acc.sumsq, minlength=size)
+    np.minimum.at(coarse.min, cell_map, acc.min)
+    np.maximum.at(coarse.max, cell_map, acc.max)
+    sketch = QuantileSketch(acc.sketch.num_cells, acc.sketch.relative_accuracy)
+    sketch.keys, sketch.counts = acc.sketch.keys, acc.sketch.counts
+    sketch.remap(cell_map, size)
+    coarse.sketch = sketch
+    return coarse_grid, coarse_window, coarse
+
+
+class HeatmapPyramid:
+    """Levels (grid, window, HeatmapAccumulator), finest first; see the module docstring."""
+
+    def __init__(self, levels):
+        self.levels = list(levels)
+
+    @classmethod
+    def build(cls, grid, window, acc, num_levels=DEFAULT_LEVELS):
+        """Pyramid of num_levels levels on top of acc (binned on window of grid)."""
+        if num_levels < 1:
+            raise ValueError("a pyramid needs at least one level")
+        levels = [(grid, window, acc)]
+        for _ in range(num_levels - 1):
+            levels.append(coarsen(*levels[-1]))
+        return cls(levels)
+
+    def __len__(self):
+        return len(self.levels)
+
+    def resolutions(self):
+        return [grid.res for grid, _, _ in self.levels]
+
+    def level(self, grid):
+        """Index of the level on grid, or None when no level has its cells."""
+        for k, (level_grid, _, _) in enumerate(self.levels):
+            if level_grid == grid:
+                return k
+        return None
+
+    def heatmap(self, k, agg="median"):
+        """Level k as a SparseHeatmap of its occupied cells."""
+        grid, window, acc = self.levels[k]
+        return SparseHeatmap.from_dense(grid, window, acc.heatmap(agg), acc.counts())
+
+    def zoom(self, k, center_xy, half_size, agg="median"):
+        """The cells of level k within half_size of center_xy, or None when there are none."""
+        heatmap = self.heatmap(k, agg)
+        window = heatmap.zoom_window(center_xy, half_size)
+        return heatmap.on_window(window) if window is not None else None
+
+    def state(self):
+        """All levels as one dict of arrays (from_state reverses it)."""
+        grid = self.levels[0][0]
+        state = {
+            "origin": np.array(grid.origin),
+            "extent": np.array(grid.extent if grid.extent is not None else (np.nan, np.nan)),
+            "res": np.array(self.resolutions()),
+            "windows": np.array([window for _, window, _ in self.levels], dtype=np.int64),
+        }
+        for k, (_, _, acc) in enumerate(self.levels):
+            for name, arr in acc.state().items():
+                state[f"level{k}_{name}"] = arr
+        return state
+
+    @classmethod
+    def from_state(cls, state):
+        extent = state["extent"]
+        extent = None if np.isnan(extent).any() else extent
+        levels = []
+        for k, (res, window) in enumerate(zip(state["res"], state["windows"])):
+            acc_state = {name[len(f"level{k}_"):]: arr for name, arr in state.items() if name.startswith(f"level{k}_")}
+            grid = HeatmapGrid(res, state["origin"], extent)
+            levels.append((grid, tuple(int(v) for v in window), HeatmapAccumulator.from_state(acc_state)))
+        return cls(levels)
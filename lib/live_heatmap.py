@@ -0,0 +1,368 @@
+"""
+Live heatmap for the recorders.
+
+plot_all_folders_heatmap.py only builds a heatmap after the run. LiveHeatmap
+keeps one while recording: every sample adds to the count and sum of its
+cell on the canonical grid (lib/heatmap_grid.py, the same cells as the batch
+heatmaps), a dict update per sample. heatmap() turns it into a mean-power
+SparseHeatmap of the visited cells; summary() adds coverage (visited cells
+and holes in the scanned area) and, with a target and a baseline folder, the
+power and gain at the target cell.
+
+coverage_gaps() lists the cells of the scan area with fewer than `min_count`
+samples, to steer the scan: unvisited cells first, then under-sampled ones,
+each nearest to the receiver's last position first. The scan area is
+`scan_area` ([x0, y0, x1, y1] in meters), else the grid's extent, else the
+bounding box scanned so far.
+
+LiveHeatmapPublisher writes a snapshot every `publish_every` seconds to
+``heatmap_live.npz`` in the recording folder (replaced atomically, so a
+viewer never reads a partial file) and/or sends the same npz bytes on a ZMQ
+PUB socket under the topic ``heatmap_live``. Configured in
+experiment-settings.yaml:
+
+    live_heatmap:
+      enabled: true
+      publish_every: 2.0   # seconds
+      file: true           # write heatmap_live.npz
+      zmq: null            # e.g. "tcp://*:50002"
+      baseline: null       # data folder to compute the target gain against
+      coverage:
+        min_count: 5       # cells with fewer samples are gaps
+        scan_area: null    # [x0, y0, x1, y1] meters
+        max_gaps: 20       # gaps listed in the summary
+
+The live map is a preview: samples are not cleaned like the batch pipeline
+does (no duplicate/small-value filters), and the baseline is the unfiltered
+mean of its folder.
+"""
+
+import io
+import json
+import math
+import os
+from time import monotonic, time
+
+import numpy as np
+
+from lib.cell_stats import CellStats
+from lib.heatmap_grid import HeatmapGrid
+from lib.snapshot import load_folder_samples
+from lib.sparse_heatmap import SparseHeatmap
+
+LIVE_HEATMAP_NAME = "heatmap_live.npz"
+LIVE_HEATMAP_TOPIC = b"heatmap_live"
+COVERAGE_TOPIC = b"coverage"
+DEFAULT_MIN_COUNT = 5
+DEFAULT_MAX_GAPS = 20
+SPEED_OF_LIGHT = 3e8
+
+
+def _parse_xy(value):
+    """(x, y) from a target_location list or "x, y[, z]" string, or None."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = [v for v in value.replace(",", " ").split() if v]
+    return float(value[0]), float(value[1])
+
+
+class LiveHeatmap:
+    """Per-cell count and sum of the samples recorded so far; see the module docstring."""
+
+    def __init__(
+        self,
+        grid,
+        target_xy=None,
+        baseline=None,
+        min_count=DEFAULT_MIN_COUNT,
+        scan_area=None,
+        max_gaps=DEFAULT_MAX_GAPS,
+    ):
+        self.grid = grid
+        self.num_samples = 0
+        self.num_outside = 0  # samples outside the grid's extent
+        self.last_xy = None
+        self._cells = {}  # (ix, iy) -> [count, sum]
+        self._bounds = None  # [ix_min, iy_min, ix_max, iy_max] of the visited cells
+        self.min_count = int(min_count)
+        self.scan_area = tuple(float(v) for v in scan_area) if scan_area is not None else None
+        self.max_gaps = int(max_gaps)
+        self.target_xy = target_xy
+        self.target_cell = grid.cell(*target_xy) if target_xy is not None else None
+        self.baseline = baseline.sparse("mean") if baseline is not None else None
+
+    @classmethod
+    def from_settings(cls, settings, data_dir):
+        """
+        Build from the experiment settings (``live_heatmap:`` incl. its
+        ``coverage:``, ``heatmap_grid:``, ``frequency`` and
+        ``experiment_config.target_location``). Returns None when the section
+        is missing or not enabled.
+        """
+        cfg = settings.get("live_heatmap") or {}
+        if not cfg.get("enabled", False):
+            return None
+        wavelength = SPEED_OF_LIGHT / float(settings["frequency"])
+        grid = HeatmapGrid.from_settings(settings.get("heatmap_grid"), wavelength)
+        target_xy = _parse_xy((settings.get("experiment_config") or {}).get("target_location"))
+        baseline = None
+        if cfg.get("baseline"):
+            baseline_dir = os.path.join(data_dir, cfg["baseline"])
+            try:
+                samples, _ = load_folder_samples(baseline_dir)
+                baseline = CellStats(grid)
+                baseline.add(samples["x"], samples["y"], samples["pwr_pw"] / 1e6)
+            except Exception as exc:
+                print(f"Live heatmap: failed to load baseline {baseline_dir}, no gains: {exc}")
+                baseline = None  # a partly built one is not usable
+        coverage = cfg.get("coverage") or {}
+        scan_area = coverage.get("scan_area")
+        if scan_area is not None and len(scan_area) != 4:
+            raise ValueError("live_heatmap.coverage.scan_area must be [x0, y0, x1, y1]")
+        return cls(
+            grid,
+            target_xy,
+            baseline,
+            min_count=coverage.get("min_count", DEFAULT_MIN_COUNT),
+            scan_area=scan_area,
+            max_gaps=coverage.get("max_gaps", DEFAULT_MAX_GAPS),
+        )
+
+    def add(self, x, y, value):
+        """Add one sample (value in uW)."""
+        self.num_samples += 1
+        self.last_xy = (x, y)
+        cell = self.grid.cell(x, y)
+        if cell is None:
+            self.num_outside += 1
+            return
+        stats = self._cells.get(cell)
+        if stats is not None:
+            stats[0] += 1
+            stats[1] += value
+            return
+        self._cells[cell] = [1, value]
+        ix, iy = cell
+        if self._bounds is None:
+            self._bounds = [ix, iy, ix, iy]
+        else:
+            bounds = self._bounds
+            bounds[0], bounds[1] = min(bounds[0], ix), min(bounds[1], iy)
+            bounds[2], bounds[3] = max(bounds[2], ix), max(bounds[3], iy)
+
+    @property
+    def window(self):
+        """The grid's full extent, or the bounding box of the visited cells (None before any)."""
+        if self.grid.full_window is not None:
+            return self.grid.full_window
+        if self._bounds is None:
+            return None
+        ix0, iy0, ix1, iy1 = self._bounds
+        return (ix0, iy0, ix1 - ix0 + 1, iy1 - iy0 + 1)
+
+    def scan_window(self):
+        """Window of the scan area (see the module docstring), or None when there is none yet."""
+        if self.scan_area is None:
+            return self.window
+        x0, y0, x1, y1 = self.scan_area
+        res, (ox, oy) = self.grid.res, self.grid.origin
+        ix0, ix1 = sorted((math.floor((x0 - ox) / res), math.floor((x1 - ox) / res)))
+        iy0, iy1 = sorted((math.floor((y0 - oy) / res), math.floor((y1 - oy) / res)))
+        if self.grid.shape is not None:
+            ix0, iy0 = max(ix0, 0), max(iy0, 0)
+            ix1, iy1 = min(ix1, self.grid.shape[0] - 1), min(iy1, self.grid.shape[1] - 1)
+        if ix1 < ix0 or iy1 < iy0:
+            return None
+        return (ix0, iy0, ix1 - ix0 + 1, iy1 - iy0 + 1)
+
+    def coverage_gaps(self):
+        """
+        (x, y, count) arrays of the centers and sample counts of the scan area's
+        cells with fewer than min_count samples, in priority order; None
+        without a scan area.
+        """
+        window = self.scan_window()
+        if window is None:
+            return None
+        ix0, iy0, nx, ny = window
+        counts = np.zeros((nx, ny), dtype=np.int64)
+        if self._cells:
+            cells = np.array(list(self._cells), dtype=np.int64).reshape(-1, 2)
+            n = np.array([stats[0] for stats in self._cells.values()], dtype=np.int64)
+            gx, gy = cells[:, 0] - ix0, cells[:, 1] - iy0
+            inside = (gx >= 0) & (gx < nx) & (gy >= 0) & (gy < ny)
+            counts[gx[inside], gy[inside]] = n[inside]
+        gx, gy = np.nonzero(counts < self.min_count)
+        x_edges, y_edges = self.grid.edges(window)
+        xs = (x_edges[gx] + x_edges[gx + 1]) / 2
+        ys = (y_edges[gy] + y_edges[gy + 1]) / 2
+        count = counts[gx, gy]
+        dist = np.hypot(xs - self.last_xy[0], ys - self.last_xy[1]) if self.last_xy is not None else np.zeros(xs.size)
+        order = np.lexsort((dist, count > 0))  # unvisited first, then nearest first
+        return xs[order], ys[order], count[order]
+
+    def heatmap(self):
+        """Mean power (uW) of the visited cells as a SparseHeatmap, or None before any."""
+        window = self.window
+        if window is None:
+            return None
+        cells = np.array(list(self._cells), dtype=np.int64).reshape(-1, 2)
+        stats = np.array(list(self._cells.values()), dtype=float).reshape(-1, 2)
+        order = np.lexsort((cells[:, 1], cells[:, 0]))  # x-major
+        cells, stats = cells[order], stats[order]
+        return SparseHeatmap(
+            self.grid,
+            window,
+            cells[:, 0] - window[0],
+            cells[:, 1] - window[1],
+            stats[:, 1] / stats[:, 0],
+            stats[:, 0].astype(np.int64),
+        )
+
+    def summary(self, heatmap=None, gaps=None):
+        """
+        Coverage and target figures (JSON-serializable); heatmap and gaps
+        default to heatmap() and coverage_gaps().
+        """
+        heatmap = self.heatmap() if heatmap is None else heatmap
+        gaps = self.coverage_gaps() if gaps is None else gaps
+        summary = {
+            "time": time(),
+            "samples": self.num_samples,
+            "samples_outside": self.num_outside,
+            "cells_visited": len(self._cells),
+            "last_position": list(self.last_xy) if self.last_xy is not None else None,
+        }
+        if gaps is not None:
+            xs, ys, count = gaps
+            summary["min_count"] = self.min_count
+            summary["gap_cells"] = int(count.size)
+            summary["unvisited_cells"] = int(np.count_nonzero(count == 0))
+            summary["next_cells"] = [
+                [round(float(x), 4), round(float(y), 4), int(n)]
+                for x, y, n in zip(xs[: self.max_gaps], ys[: self.max_gaps], count[: self.max_gaps])
+            ]
+        if heatmap is None:
+            return summary
+        if self._bounds is not None:
+            ix0, iy0, ix1, iy1 = self._bounds
+            scanned = (ix1 - ix0 + 1) * (iy1 - iy0 + 1)
+            summary["cells_scanned_area"] = scanned
+            summary["holes"] = scanned - len(self._cells)  # unvisited cells inside the scanned bounding box
+            summary["coverage"] = len(self._cells) / scanned
+        if self.target_cell is not None:
+            t = heatmap.find(*self.target_cell)
+            summary["target_cell"] = list(self.target_cell)
+            summary["target_count"] = int(heatmap.counts[t]) if t >= 0 else 0
+            summary["target_power_uW"] = float(heatmap.values[t]) if t >= 0 else None
+            b = self.baseline.find(*self.target_cell) if self.baseline is not None else -1
+            if t >= 0 and b >= 0 and heatmap.values[t] > 0 and self.baseline.values[b] > 0:
+                summary["target_gain_db"] = float(10 * np.log10(heatmap.values[t] / self.baseline.values[b]))
+        if self.baseline is not None:
+            i, j = heatmap.align(self.baseline)
+            curr, base = heatmap.values[i], self.baseline.values[j]
+            valid = (curr > 0) & (base > 0)
+            if valid.any():
+                summary["avg_gain_db"] = float(10 * np.log10(np.mean(curr[valid] / base[valid])))
+        return summary
+
+    def state(self, heatmap=None, gaps=None, summary=None):
+        """
+        Arrays of a snapshot (np.savez): the SparseHeatmap state, grid, the
+        full prioritized gap list (gap_x, gap_y, gap_count) and the summary.
+        """
+        heatmap = self.heatmap() if heatmap is None else heatmap
+        gaps = self.coverage_gaps() if gaps is None else gaps
+        summary = self.summary(heatmap, gaps) if summary is None else summary
+        state = {
+            "res": np.array(self.grid.res),
+            "origin": np.array(self.grid.origin),
+            "summary": np.array(json.dumps(summary)),
+        }
+        if heatmap is not None:
+            state.update(heatmap.state())
+        if gaps is not None:
+            state["gap_x"], state["gap_y"], state["gap_count"] = gaps
+        return state
+
+
+def format_coverage(summary):
+    """One console line of a summary's coverage guidance."""
+    if "gap_cells" not in summary:
+        return "no scan area yet"
+    text = (
+        f"{summary['cells_visited']} cells visited, {summary['gap_cells']} below "
+        f"{summary['min_count']} samples ({summary['unvisited_cells']} unvisited)"
+    )
+    if summary["next_cells"]:
+        x, y, n = summary["next_cells"][0]
+        text += f"; next: ({x:.3f}, {y:.3f}) with {n} samples"
+    return text
+
+
+class LiveHeatmapPublisher:
+    """Periodic snapshots of a LiveHeatmap to a file and/or a ZMQ PUB socket; see the module docstring."""
+
+    def __init__(self, live, path=None, socket=None, publish_every=2.0):
+        self.live = live
+        self.path = path
+        self.socket = socket
+        self.publish_every = float(publish_every)
+        self.published = 0
+        self.last_summary = None
+        self._last = None
+
+    @classmethod
+    def from_settings(cls, live, live_settings, folder, zmq_context=None):
+        """
+        Publisher for the ``live_heatmap:`` settings: heatmap_live.npz in folder
+        unless file is false, plus a PUB socket bound to the zmq address
+        (created on zmq_context, default the process-wide context).
+        """
+        cfg = live_settings or {}
+        path = os.path.join(folder, LIVE_HEATMAP_NAME) if cfg.get("file", True) else None
+        socket = None
+        if cfg.get("zmq"):
+            import zmq  # only the recorders that publish need it
+
+            socket = (zmq_context or zmq.Context.instance()).socket(zmq.PUB)
+            socket.bind(cfg["zmq"])
+        return cls(live, path, socket, cfg.get("publish_every", 2.0))
+
+    def maybe_publish(self):
+        """Publish if publish_every seconds passed since the last snapshot."""
+        now = monotonic()
+        if self._last is not None and now - self._last < self.publish_every:
+            return False
+        self._last = now
+        self.publish()
+        return True
+
+    def publish(self):
+        """
+        Write/send one snapshot; returns its summary. On the socket the npz
+        goes out under LIVE_HEATMAP_TOPIC and the summary as JSON under
+        COVERAGE_TOPIC, for viewers that only want the guidance.
+        """
+        heatmap = self.live.heatmap()
+        gaps = self.live.coverage_gaps()
+        summary = self.live.summary(heatmap, gaps)
+        buf = io.BytesIO()
+        np.savez(buf, **self.live.state(heatmap, gaps, summary))
+        payload = buf.getvalue()
+        if self.path is not None:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(payload)
+            os.replace(tmp_path, self.path)
+        if self.socket is not None:
+            self.socket.send_multipart([LIVE_HEATMAP_TOPIC, payload])
+            self.socket.send_multipart([COVERAGE_TOPIC, json.dumps(summary).encode()])
+        self.published += 1
+        self.last_summary = summary
+        return summary
+
+    def close(self):
+        if self.socket is not None:
+            self.socket.close()
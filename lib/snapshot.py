@@ -0,0 +1,353 @@
+"""
+Typed on-disk snapshot format for recorded scans.
+
+A snapshot is a single ``<timestamp>_samples.npy`` file holding a structured
+array with one float64 column per field in SAMPLE_FIELDS. It loads without
+pickle (one contiguous read, or a memory map) and every column is a plain
+ndarray: ``samples["x"]``, ``samples["pwr_pw"]``, ...
+
+While recording, samples go to an append-only ``<timestamp>_samples.log``
+(SampleLog): a 16-byte header followed by raw SAMPLE_DTYPE records. Each
+autosave appends only the new records and fsyncs, so the cost does not grow
+with run length; a record torn by a crash is dropped on the next open/read.
+Loaders treat a log exactly like a ``*_samples.npy`` snapshot.
+
+Older folders contain pickled ``*_positions.npy`` / ``*_values.npy`` object
+arrays (plus optional ``*_bd_power.npy``). Those are still readable through
+load_legacy_snapshot, and convert_folder rewrites them once into the typed
+format. Unpickling them needs the Positioner package and a ``scope_data``
+class in ``__main__``, exactly as before.
+"""
+
+import os
+
+import numpy as np
+
+SAMPLE_FIELDS = ("x", "y", "z", "t", "pwr_pw", "bd_pw")
+SAMPLE_DTYPE = np.dtype([(name, "<f8") for name in SAMPLE_FIELDS])
+
+SAMPLES_SUFFIX = "_samples.npy"
+SAMPLE_LOG_SUFFIX = "_samples.log"
+SAMPLE_LOG_MAGIC = b"DLISMPL1"
+SAMPLE_LOG_HEADER_SIZE = len(SAMPLE_LOG_MAGIC) + 8  # magic + uint64 record size
+LEGACY_POSITIONS_SUFFIX = "_positions.npy"
+LEGACY_VALUES_SUFFIX = "_values.npy"
+LEGACY_BD_POWER_SUFFIX = "_bd_power.npy"
+
+
+def time_to_seconds(t):
+    """
+    Convert a positioner timestamp to float seconds.
+
+    Qualisys positions carry "HH:MM:SS" strings; these become seconds of day,
+    which orders the same way as the strings did. Numbers pass through and
+    missing values become NaN.
+    """
+    if t is None:
+        return np.nan
+    if isinstance(t, (bytes, str)):
+        text = t.decode() if isinstance(t, bytes) else t
+        if ":" in text:
+            seconds = 0.0
+            for part in text.split(":"):
+                seconds = seconds * 60.0 + float(part)
+            return seconds
+        return float(text) if text.strip() else np.nan
+    return float(t)
+
+
+def empty_samples(n=0):
+    """Return a zero-length (or n-long, NaN-filled) samples array."""
+    samples = np.empty(n, dtype=SAMPLE_DTYPE)
+    for name in SAMPLE_FIELDS:
+        samples[name] = np.nan
+    return samples
+
+
+def sample_row(pos, pwr_pw, bd_pw=None):
+    """Build one record tuple (in SAMPLE_FIELDS order) from a positioner value."""
+    return (
+        float(pos.x),
+        float(pos.y),
+        float(pos.z),
+        time_to_seconds(getattr(pos, "t", None)),
+        np.nan if pwr_pw is None else float(pwr_pw),
+        np.nan if bd_pw is None else float(bd_pw),
+    )
+
+
+def position_key(pos):
+    """
+    Identity of one positioner value: its timestamp and coordinates. get_data()
+    returns the last value again until the positioner updates, with the same key.
+    """
+    return (getattr(pos, "t", None), float(pos.x), float(pos.y), float(pos.z))
+
+
+def pack_samples(positions, values, bd_power=None):
+    """
+    Convert positioner objects and power values to a samples array.
+
+    values may hold objects with a ``pwr_pw`` attribute (scope_data, ep_data)
+    or plain numbers in pW. bd_power is optional and may be shorter than
+    positions; missing entries become NaN.
+    """
+    n = min(len(positions), len(values))
+    samples = empty_samples(n)
+    if n == 0:
+        return samples
+    positions = positions[:n]
+    values = values[:n]
+    samples["x"] = np.fromiter((p.x for p in positions), dtype=float, count=n)
+    samples["y"] = np.fromiter((p.y for p in positions), dtype=float, count=n)
+    samples["z"] = np.fromiter((p.z for p in positions), dtype=float, count=n)
+    samples["t"] = np.fromiter(
+        (time_to_seconds(getattr(p, "t", None)) for p in positions), dtype=float, count=n
+    )
+    samples["pwr_pw"] = np.fromiter(
+        (getattr(v, "pwr_pw", v) for v in values), dtype=float, count=n
+    )
+    if bd_power is not None:
+        bd = np.asarray(bd_power, dtype=float)[:n]
+        samples["bd_pw"][: len(bd)] = bd
+    return samples
+
+
+def save_samples(path, samples):
+    """Write a samples array to path via temp file + fsync + replace."""
+    samples = np.asarray(samples, dtype=SAMPLE_DTYPE)
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            np.save(f, samples, allow_pickle=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        try:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        except Exception:
+            pass
+        raise
+
+
+def load_samples(path, mmap=False):
+    """Load a typed samples file (no pickle). Set mmap=True to memory-map it."""
+    samples = np.load(path, mmap_mode="r" if mmap else None, allow_pickle=False)
+    if samples.dtype != SAMPLE_DTYPE:
+        raise ValueError(f"{path}: unexpected dtype {samples.dtype}, expected {SAMPLE_DTYPE}")
+    return samples
+
+
+class SampleLog:
+    """
+    Append-only fixed-record sample log.
+
+    The file is a header (magic + record size) followed by SAMPLE_DTYPE
+    records. Opening an existing log validates the header and truncates a
+    partially written trailing record left by a crash, so appends resume at
+    a record boundary.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fh = open(path, "a+b")
+        self._fh.seek(0, os.SEEK_END)
+        size = self._fh.tell()
+        if size < SAMPLE_LOG_HEADER_SIZE:
+            # New file, or a crash while writing the header: nothing to keep.
+            self._fh.truncate(0)
+            self._fh.write(SAMPLE_LOG_MAGIC + np.array(SAMPLE_DTYPE.itemsize, dtype="<u8").tobytes())
+            self._sync()
+            self.count = 0
+            return
+        _check_log_header(path, self._fh)
+        self.count = (size - SAMPLE_LOG_HEADER_SIZE) // SAMPLE_DTYPE.itemsize
+        valid_size = SAMPLE_LOG_HEADER_SIZE + self.count * SAMPLE_DTYPE.itemsize
+        if valid_size != size:
+            print(f"Warning: {path} ends in a partial record; truncating {size - valid_size} bytes")
+            self._fh.truncate(valid_size)
+            self._sync()
+
+    def append(self, samples):
+        """Append records (array or list of record tuples), fsync, return how many were written."""
+        if len(samples) == 0:
+            return 0
+        if isinstance(samples, np.ndarray):
+            records = np.ascontiguousarray(samples, dtype=SAMPLE_DTYPE)
+        else:
+            records = np.array(samples, dtype=SAMPLE_DTYPE)
+        self._fh.write(records.tobytes())
+        self._sync()
+        self.count += len(records)
+        return len(records)
+
+    def close(self):
+        if not self._fh.closed:
+            self._fh.close()
+
+    def _sync(self):
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _check_log_header(path, fh):
+    fh.seek(0)
+    header = fh.read(SAMPLE_LOG_HEADER_SIZE)
+    if len(header) < SAMPLE_LOG_HEADER_SIZE or header[: len(SAMPLE_LOG_MAGIC)] != SAMPLE_LOG_MAGIC:
+        raise ValueError(f"{path}: not a sample log")
+    record_size = int(np.frombuffer(header[len(SAMPLE_LOG_MAGIC):], dtype="<u8")[0])
+    if record_size != SAMPLE_DTYPE.itemsize:
+        raise ValueError(f"{path}: record size {record_size} does not match {SAMPLE_DTYPE.itemsize}")
+
+
+def load_sample_log(path, mmap=False):
+    """Load all complete records of a sample log (a torn trailing record is ignored)."""
+    with open(path, "rb") as fh:
+        _check_log_header(path, fh)
+        fh.seek(0, os.SEEK_END)
+        count = (fh.tell() - SAMPLE_LOG_HEADER_SIZE) // SAMPLE_DTYPE.itemsize
+    if count == 0:
+        return empty_samples()
+    if mmap:
+        return np.memmap(path, dtype=SAMPLE_DTYPE, mode="r", offset=SAMPLE_LOG_HEADER_SIZE, shape=(count,))
+    return np.fromfile(path, dtype=SAMPLE_DTYPE, count=count, offset=SAMPLE_LOG_HEADER_SIZE)
+
+
+def load_legacy_snapshot(folder_path, base):
+    """
+    Load a pickled <base>_positions/_values(/_bd_power).npy triple as samples.
+    Length mismatches are truncated with a warning, like the old loaders did.
+    """
+    pos_path = os.path.join(folder_path, f"{base}{LEGACY_POSITIONS_SUFFIX}")
+    val_path = os.path.join(folder_path, f"{base}{LEGACY_VALUES_SUFFIX}")
+    bd_path = os.path.join(folder_path, f"{base}{LEGACY_BD_POWER_SUFFIX}")
+    pos_arr = np.load(pos_path, allow_pickle=True)
+    val_arr = np.load(val_path, allow_pickle=True)
+    if len(pos_arr) != len(val_arr):
+        print(
+            f"\033[91mWarning: {base} positions ({len(pos_arr)}) != values ({len(val_arr)}); "
+            f"truncating both to {min(len(pos_arr), len(val_arr))}\033[0m"
+        )
+    bd_arr = None
+    if os.path.exists(bd_path):
+        bd_arr = np.load(bd_path, allow_pickle=True)
+        if len(bd_arr) != min(len(pos_arr), len(val_arr)):
+            print(
+                f"\033[91mWarning: {base} bd_power ({len(bd_arr)}) != positions ({len(pos_arr)}); "
+                f"truncating bd_power to {min(len(bd_arr), len(pos_arr))}\033[0m"
+            )
+    return pack_samples(pos_arr, val_arr, bd_arr)
+
+
+def list_snapshots(folder_path):
+    """
+    Return sorted [(base, kind)] for every snapshot in a folder.
+    kind is "samples" for typed files, "log" for append-only sample logs and
+    "legacy" for pickled pairs; a base that exists in several formats is
+    reported once, preferring them in that order.
+    """
+    names = set(os.listdir(folder_path))
+    found = {}
+    for name in names:
+        if name.endswith(SAMPLES_SUFFIX):
+            found[name[: -len(SAMPLES_SUFFIX)]] = "samples"
+    for name in names:
+        if name.endswith(SAMPLE_LOG_SUFFIX):
+            found.setdefault(name[: -len(SAMPLE_LOG_SUFFIX)], "log")
+    for name in names:
+        if not name.endswith(LEGACY_POSITIONS_SUFFIX):
+            continue
+        base = name[: -len(LEGACY_POSITIONS_SUFFIX)]
+        if base in found:
+            continue
+        if f"{base}{LEGACY_VALUES_SUFFIX}" not in names:
+            print(f"Skipping {base}: missing values file")
+            continue
+        found[base] = "legacy"
+    return sorted(found.items())
+
+
+def load_snapshot(folder_path, base, kind):
+    """Load one snapshot listed by list_snapshots."""
+    if kind == "samples":
+        return load_samples(os.path.join(folder_path, f"{base}{SAMPLES_SUFFIX}"))
+    if kind == "log":
+        return load_sample_log(os.path.join(folder_path, f"{base}{SAMPLE_LOG_SUFFIX}"))
+    return load_legacy_snapshot(folder_path, base)
+
+
+def load_folder_samples(folder_path):
+    """
+    Load and concatenate every snapshot in a folder as one samples array.
+    Raises ValueError when the folder holds no snapshots.
+    """
+    parts = [load_snapshot(folder_path, base, kind) for base, kind in list_snapshots(folder_path)]
+    if not parts:
+        raise ValueError(f"No position/value pairs found in {folder_path}")
+    return np.concatenate(parts), len(parts)
+
+
+def iter_folder_samples(folder_path, chunk_size, snapshots=None):
+    """
+    Yield every snapshot in a folder, in load_folder_samples order, as samples
+    chunks of at most chunk_size records. Typed snapshots and sample logs are
+    read chunk by chunk, so only the current chunk is in memory; a legacy
+    pickled snapshot has to be unpickled whole before it is split.
+    snapshots defaults to list_snapshots(folder_path).
+    """
+    if chunk_size <= 0:
+        raise ValueError("chunk_size must be positive")
+    if snapshots is None:
+        snapshots = list_snapshots(folder_path)
+    for base, kind in snapshots:
+        if kind == "legacy":
+            samples = load_legacy_snapshot(folder_path, base)
+            for start in range(0, len(samples), chunk_size):
+                yield samples[start : start + chunk_size]
+            continue
+        if kind == "samples":
+            path = os.path.join(folder_path, f"{base}{SAMPLES_SUFFIX}")
+            mapped = load_samples(path, mmap=True)
+        else:
+            path = os.path.join(folder_path, f"{base}{SAMPLE_LOG_SUFFIX}")
+            mapped = load_sample_log(path, mmap=True)
+        # The map only validates the file and locates the records; plain reads
+        # keep finished chunks from staying resident.
+        count = len(mapped)
+        offset = getattr(mapped, "offset", 0)
+        del mapped
+        if count == 0:
+            continue
+        with open(path, "rb") as fh:
+            fh.seek(offset)
+            for start in range(0, count, chunk_size):
+                yield np.fromfile(fh, dtype=SAMPLE_DTYPE, count=min(chunk_size, count - start))
+
+
+def convert_folder(folder_path, remove_legacy=False):
+    """
+    Rewrite every legacy pickled snapshot in a folder as <base>_samples.npy.
+    Returns the list of converted bases. Legacy files are kept unless
+    remove_legacy is set.
+    """
+    converted = []
+    for base, kind in list_snapshots(folder_path):
+        if kind != "legacy":
+            continue
+        samples = load_legacy_snapshot(folder_path, base)
+        save_samples(os.path.join(folder_path, f"{base}{SAMPLES_SUFFIX}"), samples)
+        converted.append(base)
+        if remove_legacy:
+            for suffix in (LEGACY_POSITIONS_SUFFIX, LEGACY_VALUES_SUFFIX, LEGACY_BD_POWER_SUFFIX):
+                path = os.path.join(folder_path, f"{base}{suffix}")
+                if os.path.exists(path):
+                    os.remove(path)
+    return converted
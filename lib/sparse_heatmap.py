@@ -0,0 +1,147 @@
+"""
+Sparse (COO) heatmaps for partially scanned rooms.
+
+A scan usually visits a small part of its bounding box, so a dense grid is
+mostly NaN. SparseHeatmap stores only the occupied cells of a window of a
+HeatmapGrid (lib/heatmap_grid.py): their indices xi, yi in the window, value
+and sample count, in x-major order (the order a dense grid's finite cells are
+visited in). Memory is proportional to the number of occupied cells.
+
+Value maps (dBm conversion, deltas) are computed on the values array alone
+(with_values), two heatmaps are matched cell by cell with align(), and a zoom
+is a smaller window of the same cells (zoom_window/on_window). dense() builds
+a grid only for a window that is rendered, e.g. by imshow or the bitmap
+writer.
+"""
+
+import numpy as np
+
+_KEY_OFFSET = np.int64(1 << 31)
+
+
+def lattice_keys(gx, gy):
+    """Sortable int64 keys (x-major) of lattice cells (gx, gy)."""
+    return ((np.asarray(gx, dtype=np.int64) + _KEY_OFFSET) << 32) | (np.asarray(gy, dtype=np.int64) + _KEY_OFFSET)
+
+
+class SparseHeatmap:
+    """Occupied cells of a heatmap window as COO arrays; see the module docstring."""
+
+    def __init__(self, grid, window, xi, yi, values, counts):
+        self.grid = grid
+        self.window = tuple(int(v) for v in window)
+        self.xi = np.asarray(xi, dtype=np.int64)
+        self.yi = np.asarray(yi, dtype=np.int64)
+        self.values = np.asarray(values, dtype=float)
+        self.counts = np.asarray(counts, dtype=np.int64)
+
+    @classmethod
+    def from_dense(cls, grid, window, heatmap, counts=None):
+        """Cells of a dense (nx, ny) grid that hold samples or a finite value."""
+        heatmap = np.asarray(heatmap, dtype=float)
+        occupied = np.isfinite(heatmap)
+        if counts is not None:
+            occupied |= np.asarray(counts) > 0
+        xi, yi = np.nonzero(occupied)  # x-major
+        cell_counts = np.asarray(counts)[xi, yi] if counts is not None else np.zeros(xi.size, dtype=np.int64)
+        return cls(grid, window, xi, yi, heatmap[xi, yi], cell_counts)
+
+    @property
+    def shape(self):
+        return self.window[2], self.window[3]
+
+    @property
+    def num_cells(self):
+        """Number of stored (occupied) cells."""
+        return self.values.size
+
+    def edges(self):
+        return self.grid.edges(self.window)
+
+    def with_values(self, values):
+        """Same cells, other per-cell values (e.g. dBm)."""
+        return SparseHeatmap(self.grid, self.window, self.xi, self.yi, values, self.counts)
+
+    def keys(self):
+        """Lattice keys of the stored cells (sorted)."""
+        return lattice_keys(self.xi + self.window[0], self.yi + self.window[1])
+
+    def centers(self):
+        """(x, y) centers of the stored cells (midpoints of their edges, as for a dense grid)."""
+        ox, oy = self.grid.origin
+        res = self.grid.res
+        gx = self.xi + self.window[0]
+        gy = self.yi + self.window[1]
+        return (
+            ((ox + gx * res) + (ox + (gx + 1) * res)) / 2,
+            ((oy + gy * res) + (oy + (gy + 1) * res)) / 2,
+        )
+
+    def dense(self, values=None, fill=np.nan):
+        """The window as a dense (nx, ny) grid (values default to self.values)."""
+        grid = np.full(self.shape, fill, dtype=float)
+        grid[self.xi, self.yi] = self.values if values is None else values
+        return grid
+
+    def dense_counts(self):
+        counts = np.zeros(self.shape, dtype=np.int64)
+        counts[self.xi, self.yi] = self.counts
+        return counts
+
+    def find(self, gx, gy):
+        """Index of lattice cell (gx, gy) in the stored cells, or -1 when it is not stored."""
+        keys = self.keys()
+        key = lattice_keys(gx, gy)
+        pos = int(np.searchsorted(keys, key))
+        return pos if pos < keys.size and keys[pos] == key else -1
+
+    def argmax(self):
+        """Index of the (first, x-major) largest finite value, or -1."""
+        finite = np.isfinite(self.values)
+        if not finite.any():
+            return -1
+        return int(np.flatnonzero(finite)[np.argmax(self.values[finite])])
+
+    def align(self, other):
+        """Indices (i, j) such that self cell i and other cell j are the same lattice cell."""
+        if other.grid != self.grid:
+            raise ValueError("can only align heatmaps on the same grid")
+        _, i, j = np.intersect1d(self.keys(), other.keys(), assume_unique=True, return_indices=True)
+        return i, j
+
+    def zoom_window(self, center_xy, half_size):
+        """Window of the cells within half_size of center_xy, clipped to this window (None if empty)."""
+        if center_xy is None or self.window[2] == 0 or self.window[3] == 0:
+            return None
+        ox, oy = self.grid.origin
+        res = self.grid.res
+        cx, cy = center_xy[0], center_xy[1]
+        ix0, iy0, nx, ny = self.window
+        x_start = max(int(np.floor((cx - half_size - ox) / res)), ix0)
+        x_end = min(int(np.ceil((cx + half_size - ox) / res)), ix0 + nx)
+        y_start = max(int(np.floor((cy - half_size - oy) / res)), iy0)
+        y_end = min(int(np.ceil((cy + half_size - oy) / res)), iy0 + ny)
+        if x_end <= x_start or y_end <= y_start:
+            return None
+        return (x_start, y_start, x_end - x_start, y_end - y_start)
+
+    def on_window(self, window):
+        """The stored cells that fall in another window of the grid, indexed in it."""
+        gx = self.xi + self.window[0] - window[0]
+        gy = self.yi + self.window[1] - window[1]
+        keep = (gx >= 0) & (gx < window[2]) & (gy >= 0) & (gy < window[3])
+        return SparseHeatmap(self.grid, window, gx[keep], gy[keep], self.values[keep], self.counts[keep])
+
+    def state(self):
+        """Arrays for the folder cache (from_state needs the grid back)."""
+        return {
+            "window": np.array(self.window, dtype=np.int64),
+            "cell_xi": self.xi,
+            "cell_yi": self.yi,
+            "cell_values": self.values,
+            "cell_counts": self.counts,
+        }
+
+    @classmethod
+    def from_state(cls, grid, state):
+        return cls(grid, state["window"], state["cell_xi"], state["cell_yi"], state["cell_values"], state["cell_counts"])
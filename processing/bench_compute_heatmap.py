@@ -0,0 +1,105 @@
+"""
+Regression check and benchmark for the array-based compute_heatmap
+in plot_all_folders_heatmap.py against the original per-sample loop
+(run on the edges of the canonical grid window compute_heatmap picked).
+
+    python bench_compute_heatmap.py                 # 1e5, 1e6, 1e7 samples
+    python bench_compute_heatmap.py --sizes 100000  # quick run
+"""
+
+import argparse
+from collections import defaultdict
+from time import perf_counter
+
+import numpy as np
+
+from plot_all_folders_heatmap import GRID_RES, HeatmapGrid, compute_heatmap
+
+AGGS = ("mean", "median", "max", "min")
+REFERENCE_MAX_SAMPLES = 1_000_000  # the loop version is too slow beyond this
+
+
+def compute_heatmap_reference(xs, ys, vs, grid_res, agg="median", x_edges=None, y_edges=None):
+    """Original dict-of-lists implementation, kept as the regression reference."""
+    if x_edges is None or y_edges is None:
+        min_x, max_x = xs.min(), xs.max()
+        min_y, max_y = ys.min(), ys.max()
+        x_edges = np.arange(min_x, max_x + grid_res, grid_res)
+        y_edges = np.arange(min_y, max_y + grid_res, grid_res)
+
+    heatmap = np.full((len(x_edges) - 1, len(y_edges) - 1), np.nan, dtype=float)
+    cell_values = defaultdict(list)
+    counts = np.zeros_like(heatmap, dtype=int)
+
+    xi = np.digitize(xs, x_edges) - 1
+    yi = np.digitize(ys, y_edges) - 1
+
+    for i_x, i_y, v in zip(xi, yi, vs):
+        if 0 <= i_x < heatmap.shape[0] and 0 <= i_y < heatmap.shape[1]:
+            cell_values[(i_x, i_y)].append(v)
+            counts[i_x, i_y] += 1
+
+    func = {"mean": np.mean, "median": np.median, "max": np.max, "min": np.min}[agg]
+    for (i_x, i_y), values in cell_values.items():
+        if values:
+            heatmap[i_x, i_y] = float(func(values))
+    return heatmap, counts, x_edges, y_edges, xi, yi
+
+
+def make_samples(n, rng):
+    """Random walk over a ~2x2 m area with log-normal power (uW)."""
+    steps = rng.normal(scale=GRID_RES / 4, size=(n, 2))
+    xy = np.cumsum(steps, axis=0)
+    xy = np.mod(xy, 2.0)
+    vs = rng.lognormal(mean=0.0, sigma=1.0, size=n)
+    # Duplicate-heavy data like the recorder produces (stale scope readings)
+    vs[1::7] = vs[0:-1:7][: len(vs[1::7])]
+    return xy[:, 0], xy[:, 1], vs
+
+
+def check_against_reference(xs, ys, vs, grid):
+    for agg in AGGS:
+        new = compute_heatmap(xs, ys, vs, grid, agg=agg)
+        ref = compute_heatmap_reference(xs, ys, vs, grid.res, agg=agg, x_edges=new[2], y_edges=new[3])
+        np.testing.assert_array_equal(new[1], ref[1], err_msg=f"counts differ ({agg})")
+        np.testing.assert_array_equal(new[2], ref[2])
+        np.testing.assert_array_equal(new[3], ref[3])
+        np.testing.assert_array_equal(new[4], ref[4])
+        np.testing.assert_array_equal(new[5], ref[5])
+        if agg == "mean":
+            np.testing.assert_allclose(new[0], ref[0], rtol=1e-12, equal_nan=True, err_msg=agg)
+        else:
+            np.testing.assert_array_equal(new[0], ref[0], err_msg=agg)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10**5, 10**6, 10**7])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    grid = HeatmapGrid(GRID_RES)
+    for n in args.sizes:
+        xs, ys, vs = make_samples(n, rng)
+        if n <= REFERENCE_MAX_SAMPLES:
+            check_against_reference(xs, ys, vs, grid)
+            status = "matches reference"
+        else:
+            status = "reference skipped"
+        for agg in AGGS:
+            t0 = perf_counter()
+            compute_heatmap(xs, ys, vs, grid, agg=agg)
+            t_new = perf_counter() - t0
+            line = f"n={n:>9d} agg={agg:<6s} vectorized {t_new * 1e3:9.1f} ms"
+            if n <= REFERENCE_MAX_SAMPLES:
+                t0 = perf_counter()
+                compute_heatmap_reference(xs, ys, vs, grid.res, agg=agg)
+                t_ref = perf_counter() - t0
+                line += f" | loop {t_ref * 1e3:9.1f} ms ({t_ref / t_new:5.1f}x)"
+            print(line)
+        print(f"n={n:>9d}: {status}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+One-shot converter from pickled *_positions.npy / *_values.npy (/ *_bd_power.npy)
+snapshots to the typed <timestamp>_samples.npy format (see lib/snapshot.py).
+
+    python convert_snapshots.py                    # all folders under ../data
+    python convert_snapshots.py AZF-1 MRT-BD-1     # selected folders
+    python convert_snapshots.py --remove-legacy    # drop pickled files afterwards
+"""
+
+import argparse
+import os
+import sys
+
+# Ensure pickle can resolve project modules referenced in saved arrays
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from lib.snapshot import convert_folder, load_folder_samples
+
+DATA_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../data"))
+
+
+class scope_data(object):
+    """Stand-in for the recorder's class so pickled values can be loaded."""
+
+    def __init__(self, pwr_pw):
+        self.pwr_pw = pwr_pw
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert pickled snapshots to typed *_samples.npy files.")
+    parser.add_argument("folders", nargs="*", help="Subfolders of the data dir (default: all).")
+    parser.add_argument("--data-dir", default=DATA_DIR, help=f"Data directory (default: {DATA_DIR}).")
+    parser.add_argument(
+        "--remove-legacy",
+        action="store_true",
+        help="Delete the pickled *_positions/_values/_bd_power.npy files after converting.",
+    )
+    args = parser.parse_args()
+
+    folders = args.folders or sorted(
+        name for name in os.listdir(args.data_dir) if os.path.isdir(os.path.join(args.data_dir, name))
+    )
+    for name in folders:
+        folder_path = os.path.join(args.data_dir, name)
+        try:
+            converted = convert_folder(folder_path, remove_legacy=args.remove_legacy)
+            samples, num_parts = load_folder_samples(folder_path)
+        except ValueError as exc:
+            print(exc)
+            continue
+        except Exception as exc:
+            print(f"Failed to convert {folder_path}: {exc}", file=sys.stderr)
+            continue
+        print(f"{name}: converted {len(converted)} snapshot(s); {num_parts} typed snapshot(s), {len(samples)} samples")
+
+
+if __name__ == "__main__":
+    main()
@@ -43,41 +43,21 @@ sys.path.insert(0, PROJECT_ROOT)
 
 from lib.yaml_utils import read_yaml_file
 from lib.ep import RFEP
+from lib.snapshot import load_folder_samples
 
 DATA_DIR = os.path.abspath(os.path.join(server_dir, "../data"))
 
 
 # -------------------------------------------------
 def load_and_merge_folder(folder):
-    """Load and merge all *_positions.npy and *_values.npy pairs inside the folder."""
+    """Load and merge all snapshots inside the folder as a typed samples array."""
     folder_path = os.path.join(DATA_DIR, folder)
     if not os.path.isdir(folder_path):
         raise FileNotFoundError(f"Folder not found: {folder_path}")
 
-    positions_parts = []
-    values_parts = []
-
-    for name in sorted(os.listdir(folder_path)):
-        if not name.endswith("_positions.npy"):
-            continue
-        base = name.replace("_positions.npy", "")
-        pos_path = os.path.join(folder_path, name)
-        val_path = os.path.join(folder_path, f"{base}_values.npy")
-        if not os.path.exists(val_path):
-            print(f"Skipping {base}: missing values file")
-            continue
-
-        positions_parts.append(np.load(pos_path, allow_pickle=True))
-        values_parts.append(np.load(val_path, allow_pickle=True))
-
-    if not positions_parts:
-        raise ValueError(f"No valid position/value pairs found in {folder_path}")
-
-    merged_positions = np.concatenate(positions_parts)
-    merged_values = np.concatenate(values_parts)
-    merged_count = len(positions_parts)
-    print(f"Merged {merged_count} file pairs from {folder_path}: {len(merged_positions)} samples total")
-    return merged_positions, merged_values
+    samples, merged_count = load_folder_samples(folder_path)
+    print(f"Merged {merged_count} file pairs from {folder_path}: {len(samples)} samples total")
+    return samples
 
 
 # -------------------------------------------------
@@ -223,20 +203,17 @@ def plot_heatmaps_for_stat(heatmap, xi, yi, x_bf, y_bf, last_positions, stat_nam
 # MAIN
 # -------------------------------------------------
 
-positions, o_values = load_and_merge_folder(FOLDER)
+samples = load_and_merge_folder(FOLDER)
 
-print(f"Processing {len(positions)} samples for folder {FOLDER}")
+print(f"Processing {len(samples)} samples for folder {FOLDER}")
 
 print("CHANGE OF X POSITION DUE TO QTM position not same as antenna position")
-y_positions = [p.y + 0.1 for p in positions]
+y_positions = samples["y"] + 0.1
 
-temp_pos_list = PositionerValues(positions)
-positions_list = PositionerValues.from_xyz(
-    temp_pos_list.get_x_positions(), y_positions, temp_pos_list.get_z_positions()
-)
+positions_list = PositionerValues.from_xyz(samples["x"], y_positions, samples["z"])
 
 # power in uW
-values = np.array([v.pwr_pw / 1e6 for v in o_values], dtype=float)
+values = samples["pwr_pw"] / 1e6
 print(f"MAX POWER (raw samples): {np.max(values):.2f} uW")
 
 
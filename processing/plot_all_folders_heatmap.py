@@ -4,9 +4,11 @@ and plot a heatmap of mean power for the concatenated samples.
 """
 
 import argparse
+import contextlib
+import io
 import os
 import sys
-from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 
 import matplotlib.pyplot as plt
 import numpy as np
@@ -24,10 +26,11 @@ class scope_data(object):
 
 
 WAVELENGTH = 3e8 / 920e6  # meters
-GRID_RES = 0.04 * WAVELENGTH  # meters (default; overridden by --grid-res-lambda)
+GRID_RES = 0.04 * WAVELENGTH  # meters (default without heatmap_grid in the settings; see load_grid_from_settings)
 SMALL_POWER_UW = 1e-8  # threshold for reporting tiny measurements (micro-watts)
 ZOOM_HALF_SIZE = 0.5 * WAVELENGTH  # meters, half-width/height for target zoom plots
 DEFAULT_BASELINE_FOLDER = "RANDOM-1"
+STREAM_CHUNK_SIZE = 1_000_000  # samples per chunk with --stream
 
 
 DATA_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../data"))
@@ -39,6 +42,15 @@ PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 if PROJECT_ROOT not in sys.path:
     sys.path.insert(0, PROJECT_ROOT)
 
+from lib.bitmap import DEFAULT_SCALE as BITMAP_SCALE, write_heatmap_png
+from lib.cell_stats import CellStats
+from lib.heatmap_accumulator import DEFAULT_RELATIVE_ACCURACY, HeatmapAccumulator
+from lib.heatmap_cache import FolderCache
+from lib.heatmap_grid import HeatmapGrid, union_windows
+from lib.heatmap_pyramid import DEFAULT_LEVELS as PYRAMID_LEVELS, HeatmapPyramid, coarser_window
+from lib.sparse_heatmap import SparseHeatmap
+from lib.snapshot import iter_folder_samples, list_snapshots, load_folder_samples
+
 
 def parse_target_location(value, source_label):
     """Parse target_location as [x, y, z?] from a string or list."""
@@ -73,6 +85,25 @@ def load_target_from_settings(settings_path=SETTINGS_PATH):
         return None
 
 
+def load_grid_from_settings(settings_path=SETTINGS_PATH, resolution_lambda=None):
+    """
+    HeatmapGrid from the heatmap_grid section of experiment-settings.yaml
+    (origin, resolution_lambda, extent); resolution_lambda overrides the
+    configured resolution. Without the section: GRID_RES cells from (0, 0).
+    """
+    grid_settings = None
+    if os.path.exists(settings_path):
+        try:
+            with open(settings_path, "r", encoding="utf-8") as fh:
+                settings = yaml.safe_load(fh) or {}
+            grid_settings = settings.get("heatmap_grid")
+        except Exception as exc:
+            print(f"Failed to load heatmap_grid from {settings_path}: {exc}", file=sys.stderr)
+    if grid_settings is None and resolution_lambda is None:
+        return HeatmapGrid(GRID_RES)
+    return HeatmapGrid.from_settings(grid_settings, WAVELENGTH, resolution_lambda)
+
+
 def target_rect_from_xyz(target_xyz, rect_size=0.2 * WAVELENGTH):
     """Rectangle of fixed size (default 0.5 lambda) centered on target x/y."""
     if not target_xyz or len(target_xyz) < 2:
@@ -108,6 +139,26 @@ def load_folder_config(folder_path):
         return {}
 
 
+def update_bd_stats(bd_stats, bd_pw):
+    """
+    Fold a bd_pw column into running {count, min, max, sum} stats of its valid
+    (finite, > 0) values. bd_stats stays None until a finite value is seen.
+    """
+    bd_pw = np.asarray(bd_pw, dtype=float)
+    finite = np.isfinite(bd_pw)
+    if not finite.any():
+        return bd_stats
+    if bd_stats is None:
+        bd_stats = {"count": 0, "min": np.inf, "max": -np.inf, "sum": 0.0}
+    valid = bd_pw[finite & (bd_pw > 0)]
+    if valid.size:
+        bd_stats["count"] += int(valid.size)
+        bd_stats["min"] = min(bd_stats["min"], float(valid.min()))
+        bd_stats["max"] = max(bd_stats["max"], float(valid.max()))
+        bd_stats["sum"] += float(valid.sum())
+    return bd_stats
+
+
 def heatmap_to_dbm(heatmap_uw, floor_watts=1e-15):
     """
     Convert heatmap values (uW) to dBm with a small floor to avoid -inf.
@@ -121,145 +172,103 @@ def heatmap_to_dbm(heatmap_uw, floor_watts=1e-15):
 
 
 def load_folder(folder_path):
-    """Load and concatenate all *_positions.npy, *_values.npy, and optional *_bd_power.npy in a folder."""
-    positions_parts = []
-    values_parts = []
-    bd_power_parts = []
+    """
+    Load and concatenate every snapshot in a folder as a typed samples array
+    (fields x, y, z, t, pwr_pw, bd_pw; see lib/snapshot.py). Typed
+    *_samples.npy files load without pickle; legacy pickled pairs still work.
+    """
+    samples, num_parts = load_folder_samples(folder_path)
+    print(f"{os.path.basename(folder_path)}: merged {num_parts} pairs, {len(samples)} samples")
+    return samples
 
-    for name in sorted(os.listdir(folder_path)):
-        if not name.endswith("_positions.npy"):
-            continue
-        base = name[: -len("_positions.npy")]
-        pos_path = os.path.join(folder_path, name)
-        val_path = os.path.join(folder_path, f"{base}_values.npy")
-        bd_path = os.path.join(folder_path, f"{base}_bd_power.npy")
-        if not os.path.exists(val_path):
-            print(f"Skipping {base}: missing values file")
-            continue
-        pos_arr = np.load(pos_path, allow_pickle=True)
-        val_arr = np.load(val_path, allow_pickle=True)
-        if len(pos_arr) != len(val_arr):
-            min_len = min(len(pos_arr), len(val_arr))
-            print(
-                f"\033[91mWarning: {base} positions ({len(pos_arr)}) != values ({len(val_arr)}); "
-                f"truncating both to {min_len}\033[0m"
-            )
-            pos_arr = pos_arr[:min_len]
-            val_arr = val_arr[:min_len]
-        positions_parts.append(pos_arr)
-        values_parts.append(val_arr)
-        if os.path.exists(bd_path):
-            bd_arr = np.load(bd_path, allow_pickle=True)
-            if len(bd_arr) != len(pos_arr):
-                min_len = min(len(bd_arr), len(pos_arr))
-                print(
-                    f"\033[91mWarning: {base} bd_power ({len(bd_arr)}) != positions ({len(pos_arr)}); "
-                    f"truncating bd_power to {min_len}\033[0m"
-                )
-                bd_arr = bd_arr[:min_len]
-            bd_power_parts.append(bd_arr)
 
-    if not positions_parts:
-        raise ValueError(f"No position/value pairs found in {folder_path}")
+def _small_values(vs, threshold=SMALL_POWER_UW):
+    """Return (keep_mask, num_zeros, num_small, min_small) for zero / below-threshold power values (uW)."""
+    zeros = vs == 0.0
+    small = (vs > 0.0) & (vs < threshold)
+    min_small = vs[small].min() if small.any() else None
+    return ~(zeros | small), int(zeros.sum()), int(small.sum()), min_small
 
-    positions = np.concatenate(positions_parts)
-    values = np.concatenate(values_parts)
-    bd_power = np.concatenate(bd_power_parts) if bd_power_parts else None
-    print(f"{os.path.basename(folder_path)}: merged {len(positions_parts)} pairs, {len(positions)} samples")
-    return positions, values, bd_power
+
+def _small_value_report(num_zeros, num_small, min_small, threshold=SMALL_POWER_UW):
+    reports = []
+    if num_zeros:
+        reports.append(f"{num_zeros} zeros")
+    if num_small:
+        reports.append(f"{num_small} below {threshold:.1e} uW (min {min_small:.2e})")
+    return ", ".join(reports)
 
 
-def filter_small_values(folder_path, positions, values, vs, threshold=SMALL_POWER_UW):
+def filter_small_values(folder_path, samples, vs, threshold=SMALL_POWER_UW):
     """
     Log and drop zero or near-zero power samples (threshold in uW).
-    Returns filtered positions, values, and vs arrays.
+    Returns filtered samples and vs arrays.
     """
-    zeros = vs == 0.0
-    small = (vs > 0.0) & (vs < threshold)
-    drop_mask = ~(zeros | small)
-
-    reports = []
-    if zeros.any():
-        reports.append(f"{zeros.sum()} zeros")
-    if small.any():
-        reports.append(f"{small.sum()} below {threshold:.1e} uW (min {vs[small].min():.2e})")
+    drop_mask, num_zeros, num_small, min_small = _small_values(vs, threshold)
+    report = _small_value_report(num_zeros, num_small, min_small, threshold)
 
     dropped = len(vs) - int(drop_mask.sum())
-    report = ", ".join(reports) if reports else ""
     if dropped:
-        return positions[drop_mask], values[drop_mask], vs[drop_mask], dropped, report
+        return samples[drop_mask], vs[drop_mask], dropped, report
 
-    return positions, values, vs, 0, report
+    return samples, vs, 0, report
 
 
-def drop_consecutive_equal_values(positions, values):
+def drop_consecutive_equal_values(samples):
     """
     Remove runs of consecutive measurements that have identical power.
-    The same indices are removed from positions to keep arrays aligned.
+    Whole sample records are removed so positions stay aligned.
     """
-    if len(positions) != len(values):
-        min_len = min(len(positions), len(values))
-        print(
-            f"Warning: length mismatch positions={len(positions)} values={len(values)}; truncating to {min_len}"
-        )
-        positions = positions[:min_len]
-        values = values[:min_len]
-
-    keep_idx = [0]
-    last_power = values[0].pwr_pw
-    for idx in range(1, len(values)):
-        if values[idx].pwr_pw != last_power:
-            keep_idx.append(idx)
-            last_power = values[idx].pwr_pw
+    if len(samples) == 0:
+        return samples, 0
 
-    if len(keep_idx) == len(values):
-        return positions, values, 0
+    power = samples["pwr_pw"]
+    keep = np.ones(len(power), dtype=bool)
+    # A dropped sample equals the last kept one, so comparing neighbours is enough (NaN != NaN: kept)
+    keep[1:] = power[1:] != power[:-1]
 
-    dropped = len(values) - len(keep_idx)
-    return positions[keep_idx], values[keep_idx], dropped
+    dropped = len(samples) - int(np.count_nonzero(keep))
+    if dropped == 0:
+        return samples, 0
+    return samples[keep], dropped
 
 
-def drop_nonincreasing_timestamps(positions, values):
+def drop_nonincreasing_timestamps(samples):
     """
-    Drop samples whose position timestamp does not increase vs. the previous one.
+    Drop samples whose position timestamp does not increase vs. the last kept one.
     Assumes any duplicates/non-increasing timestamps occur consecutively.
+    Samples without a timestamp (NaN) are always kept and restart the comparison.
     """
-    if len(positions) != len(values):
-        min_len = min(len(positions), len(values))
-        print(
-            f"Warning: length mismatch positions={len(positions)} values={len(values)}; truncating to {min_len}"
-        )
-        positions = positions[:min_len]
-        values = values[:min_len]
-
-    if len(positions) <= 1:
-        return positions, values
-
-    keep_idx = [0]
-    equal_count = 0
-    decrease_count = 0
-    last_t = getattr(positions[0], "t", None)
-    for idx in range(1, len(positions)):
-        curr_t = getattr(positions[idx], "t", None)
-        if last_t is None or curr_t is None:
-            keep_idx.append(idx)
-            last_t = curr_t
-            continue
-        if curr_t > last_t:
-            keep_idx.append(idx)
-            last_t = curr_t
-        elif curr_t == last_t:
-            equal_count += 1
-        else:
-            decrease_count += 1
-
-    if len(keep_idx) == len(positions):
-        return positions, values, 0, {"equal": 0, "decrease": 0}
-
-    dropped = len(positions) - len(keep_idx)
-    return positions[keep_idx], values[keep_idx], dropped, {
-        "equal": equal_count,
-        "decrease": decrease_count,
+    if len(samples) <= 1:
+        return samples, 0, {"equal": 0, "decrease": 0}
+
+    ts = samples["t"]
+    no_t = np.isnan(ts)
+    if not no_t.any():
+        # The last kept timestamp is the running maximum of everything before
+        curr = ts[1:]
+        prev = np.maximum.accumulate(ts)[:-1]
+    else:
+        # Same on dense ranks, offset per NaN-separated segment so the running
+        # maximum restarts after every NaN (rank 0 = NaN, always kept)
+        n = len(ts)
+        rank = np.zeros(n, dtype=np.int64)
+        rank[~no_t] = np.unique(ts[~no_t], return_inverse=True)[1] + 1
+        segment = np.cumsum(no_t, dtype=np.int64) * (n + 2)
+        curr = rank[1:]
+        prev = np.maximum.accumulate(segment + rank)[:-1] - segment[1:]
+    has_t = ~no_t[1:]
+    equal = has_t & (curr == prev)
+    decrease = has_t & (curr < prev)
+
+    keep = np.ones(len(ts), dtype=bool)
+    keep[1:] = ~(equal | decrease)
+    dropped = len(samples) - int(np.count_nonzero(keep))
+    if dropped == 0:
+        return samples, 0, {"equal": 0, "decrease": 0}
+    return samples[keep], dropped, {
+        "equal": int(np.count_nonzero(equal)),
+        "decrease": int(np.count_nonzero(decrease)),
     }
 
 
@@ -286,22 +295,20 @@ def heatmap_delta_db(curr_heatmap, base_heatmap):
     return diff
 
 
-def _target_mask(x_edges, y_edges, target_rect):
+def _target_mask(x_centers, y_centers, target_rect):
+    """Cells (given by their centers) inside the target rect, or None without one."""
     if not target_rect:
         return None
     x0, y0, w, h = target_rect
     x1, y1 = x0 + w, y0 + h
-    xc = (x_edges[:-1] + x_edges[1:]) / 2
-    yc = (y_edges[:-1] + y_edges[1:]) / 2
-    mask_x = (xc >= x0) & (xc <= x1)
-    mask_y = (yc >= y0) & (yc <= y1)
-    if not mask_x.any() or not mask_y.any():
-        return None
-    return np.outer(mask_x, mask_y)
+    return (x_centers >= x0) & (x_centers <= x1) & (y_centers >= y0) & (y_centers <= y1)
 
 
-def gain_stats(curr, base, x_edges, y_edges, target_rect=None):
-    """Return avg/max gain (linear and dB) vs baseline; optionally within target rect."""
+def gain_stats(curr, base, x_centers, y_centers, target_rect=None):
+    """
+    Return avg/max gain (linear and dB) vs baseline; optionally within target rect.
+    curr and base hold the values of the same cells, centered at x/y_centers.
+    """
     mask = (
         np.isfinite(curr)
         & np.isfinite(base)
@@ -322,44 +329,102 @@ def gain_stats(curr, base, x_edges, y_edges, target_rect=None):
         }
 
     global_stats = _stats(mask)
-    target_mask = _target_mask(x_edges, y_edges, target_rect)
+    target_mask = _target_mask(x_centers, y_centers, target_rect)
     target_stats = _stats(mask & target_mask) if target_mask is not None else None
     return global_stats, target_stats
 
 
-def compute_heatmap(xs, ys, vs, grid_res, agg="median", x_edges=None, y_edges=None):
-    """Bin values onto a 2D grid and compute an aggregate power per cell."""
-    if x_edges is None or y_edges is None:
-        min_x, max_x = xs.min(), xs.max()
-        min_y, max_y = ys.min(), ys.max()
-        x_edges = np.arange(min_x, max_x + grid_res, grid_res)
-        y_edges = np.arange(min_y, max_y + grid_res, grid_res)
+def last_distinct_cells(xi, yi, n=5, previous=()):
+    """
+    The last n distinct (i_x, i_y) cells visited, oldest first. previous is the
+    result for the samples before xi/yi, so chunks can be chained.
+    """
+    recent = []
+    seen = set()
+    for i in range(len(xi) - 1, -1, -1):
+        if len(recent) == n:
+            break
+        cell = (int(xi[i]), int(yi[i]))
+        if cell not in seen:
+            seen.add(cell)
+            recent.append(cell)
+    for cell in reversed(previous):
+        if len(recent) == n:
+            break
+        if cell not in seen:
+            seen.add(cell)
+            recent.append(cell)
+    recent.reverse()
+    return recent
+
 
-    heatmap = np.full((len(x_edges) - 1, len(y_edges) - 1), np.nan, dtype=float)
+def compute_sparse_heatmap(xs, ys, vs, grid, agg="median", window=None):
+    """
+    Bin values onto the canonical grid and compute an aggregate power per
+    occupied cell. Returns (SparseHeatmap, xi, yi): the heatmap covers window
+    (default: grid.window of the samples' cells), xi, yi are each sample's
+    cell in it (-1 for samples outside the grid).
+    """
     if agg not in {"mean", "median", "max", "min"}:
         raise ValueError("agg must be one of: mean, median, max, min")
-    cell_values = defaultdict(list)
-    counts = np.zeros_like(heatmap, dtype=int)
-
-    xi = np.digitize(xs, x_edges) - 1
-    yi = np.digitize(ys, y_edges) - 1
-
-    for i_x, i_y, v in zip(xi, yi, vs):
-        if 0 <= i_x < heatmap.shape[0] and 0 <= i_y < heatmap.shape[1]:
-            cell_values[(i_x, i_y)].append(v)
-            counts[i_x, i_y] += 1
-
-    agg_funcs = {
-        "mean": np.mean,
-        "median": np.median,
-        "max": np.max,
-        "min": np.min,
-    }
-    func = agg_funcs[agg]
-    for (i_x, i_y), values in cell_values.items():
-        if values:
-            heatmap[i_x, i_y] = float(func(values))
-    return heatmap, counts, x_edges, y_edges, xi, yi
+    ix, iy, inside = grid.locate(xs, ys)
+    if window is None:
+        window = grid.window(ix[inside], iy[inside])
+        if window is None:
+            raise ValueError("no samples inside the heatmap grid")
+    nx, ny = window[2], window[3]
+
+    # Cell indices are arithmetic on the shared lattice, no edge search.
+    xi = np.where(inside, ix - window[0], -1)
+    yi = np.where(inside, iy - window[1], -1)
+
+    # Flatten (i_x, i_y) to a linear cell index so all reductions are array ops.
+    in_grid = inside & (xi >= 0) & (xi < nx) & (yi >= 0) & (yi < ny)
+    lin = (xi[in_grid] * ny + yi[in_grid]).astype(np.intp)
+    v = np.asarray(vs, dtype=float)[in_grid]
+
+    if agg == "mean" and nx * ny <= lin.size:
+        # A window no larger than the sample arrays: bincount is cheaper than sorting.
+        counts = np.bincount(lin, minlength=nx * ny)
+        cells = np.flatnonzero(counts)
+        values = np.bincount(lin, weights=v, minlength=nx * ny)[cells] / counts[cells]
+        cell_x, cell_y = np.divmod(cells, ny)
+        return SparseHeatmap(grid, window, cell_x, cell_y, values, counts[cells]), xi, yi
+
+    # Group samples per cell: each occupied cell becomes a contiguous segment.
+    if agg == "median":
+        # Sort by value first, then stable-sort by cell so segments stay value-ordered.
+        order = np.argsort(v)
+        order = order[np.argsort(lin[order], kind="stable")]
+    else:
+        order = np.argsort(lin, kind="stable")
+    lin_sorted = lin[order]
+    v_sorted = v[order]
+    starts = np.flatnonzero(np.r_[True, lin_sorted[1:] != lin_sorted[:-1]]) if lin.size else np.zeros(0, dtype=np.intp)
+    cells = lin_sorted[starts]
+    n = np.diff(np.r_[starts, lin_sorted.size])
+
+    if lin.size == 0:
+        values = np.zeros(0)
+    elif agg == "mean":
+        values = np.add.reduceat(v_sorted, starts) / n
+    elif agg == "min":
+        values = np.minimum.reduceat(v_sorted, starts)
+    elif agg == "max":
+        values = np.maximum.reduceat(v_sorted, starts)
+    else:
+        lo = v_sorted[starts + (n - 1) // 2]
+        hi = v_sorted[starts + n // 2]
+        values = (lo + hi) / 2.0
+    cell_x, cell_y = np.divmod(cells, ny)
+    return SparseHeatmap(grid, window, cell_x, cell_y, values, n), xi, yi
+
+
+def compute_heatmap(xs, ys, vs, grid, agg="median", window=None):
+    """Dense compute_sparse_heatmap: (heatmap, counts, x_edges, y_edges, xi, yi)."""
+    sparse, xi, yi = compute_sparse_heatmap(xs, ys, vs, grid, agg=agg, window=window)
+    x_edges, y_edges = sparse.edges()
+    return sparse.dense(), sparse.dense_counts(), x_edges, y_edges, xi, yi
 
 
 def fill_empty_cells_nearest(heatmap):
@@ -376,6 +441,156 @@ def fill_empty_cells_nearest(heatmap):
     return filled
 
 
+def heatmap_spec(
+    key, path, data, x_edges, y_edges, cmap, vmin, vmax, title, cbar_label, rects=(), markers=(), bitmap_path=None
+):
+    """
+    One heatmap product (uW, counts, dBm, delta) as plot_heatmap/plot_diff_heatmap
+    draw it: the image data and extent, colour limits (None autoscales, like imshow),
+    titles and overlays. rects are (x0, y0, w, h, edgecolor) outlines, markers
+    (x, y, color) crosses. bitmap_path is where save_bitmap writes it pixel-exact.
+    """
+    return {
+        "key": key,
+        "path": path,
+        "data": data,
+        "extent": [x_edges[0], x_edges[-1], y_edges[0], y_edges[-1]],
+        "cmap": cmap,
+        "vmin": vmin,
+        "vmax": vmax,
+        "title": title,
+        "cbar_label": cbar_label,
+        "rects": list(rects),
+        "markers": list(markers),
+        "bitmap_path": bitmap_path,
+    }
+
+
+def _target_rects(target_rect):
+    return [(*target_rect, "green")] if target_rect else []
+
+
+def _recent_cell_rects(recent_cells, x_edges, y_edges):
+    """Outlines of the recently visited cells, the last one in lime."""
+    rects = []
+    for idx, (i_x, i_y) in enumerate(recent_cells or []):
+        if 0 <= i_x < len(x_edges) - 1 and 0 <= i_y < len(y_edges) - 1:
+            rects.append(
+                (
+                    x_edges[i_x],
+                    y_edges[i_y],
+                    x_edges[i_x + 1] - x_edges[i_x],
+                    y_edges[i_y + 1] - y_edges[i_y],
+                    "lime" if idx == len(recent_cells) - 1 else "red",
+                )
+            )
+    return rects
+
+
+def _draw_overlays(ax, spec):
+    for x0, y0, w, h, color in spec["rects"]:
+        ax.add_patch(plt.Rectangle((x0, y0), w, h, fill=False, edgecolor=color, linewidth=2))
+    for x, y, color in spec["markers"]:
+        ax.plot(x, y, marker="x", color=color, markersize=8, markeredgewidth=2)
+
+
+def draw_heatmap(fig, ax, spec):
+    """Draw a heatmap_spec on fresh axes; returns (image, colorbar)."""
+    img = ax.imshow(
+        spec["data"].T,
+        origin="lower",
+        cmap=spec["cmap"],
+        extent=spec["extent"],
+        vmin=spec["vmin"],
+        vmax=spec["vmax"],
+    )
+    ax.set_aspect("equal", adjustable="box")
+    ax.set_title(spec["title"])
+    ax.set_xlabel("x [m]")
+    ax.set_ylabel("y [m]")
+    cbar = fig.colorbar(img, ax=ax)
+    cbar.ax.set_ylabel(spec["cbar_label"])
+    _draw_overlays(ax, spec)
+    return img, cbar
+
+
+class HeadlessRenderer:
+    """
+    Agg renderer for --headless: one figure per product (spec key: uW, counts,
+    dBm, delta) is drawn once by draw_heatmap and reused for every folder and
+    zoom; a render only swaps the image data, extent, colour limits, titles and
+    overlays of the spec.
+    """
+
+    def __init__(self):
+        self._products = {}
+
+    def render(self, spec):
+        key = spec["key"]
+        if key not in self._products:
+            fig, ax = plt.subplots()
+            self._products[key] = (fig, ax, *draw_heatmap(fig, ax, spec))
+        else:
+            fig, ax, img, cbar = self._products[key]
+            img.set_data(spec["data"].T)
+            img.set_cmap(spec["cmap"])
+            img.set_extent(spec["extent"])
+            img.norm.vmin = img.norm.vmax = None
+            img.autoscale_None()
+            if spec["vmin"] is not None:
+                img.norm.vmin = spec["vmin"]
+            if spec["vmax"] is not None:
+                img.norm.vmax = spec["vmax"]
+            cbar.update_normal(img)
+            cbar.ax.set_ylabel(spec["cbar_label"])
+            ax.set_title(spec["title"])
+            for artist in list(ax.patches) + list(ax.lines):
+                artist.remove()
+            _draw_overlays(ax, spec)
+            # limits as on fresh axes: the image extent plus the overlays
+            ax.relim()
+            ax.autoscale_view()
+
+        fig.tight_layout()
+        fig.savefig(spec["path"])
+
+
+_renderer = None
+
+
+def get_headless_renderer():
+    """Process-wide HeadlessRenderer (one per worker with --jobs)."""
+    global _renderer
+    if _renderer is None:
+        plt.switch_backend("Agg")
+        _renderer = HeadlessRenderer()
+    return _renderer
+
+
+def render_heatmaps(specs, show=True, save_bitmap=False, renderer=None, bitmap_scale=BITMAP_SCALE):
+    """
+    Save every heatmap_spec as a PNG: through the HeadlessRenderer when given,
+    otherwise on a new figure that is shown (show) or closed. With save_bitmap
+    the specs with a bitmap_path are also written as pixel-exact bitmaps.
+    """
+    for spec in specs:
+        if renderer is not None:
+            renderer.render(spec)
+        else:
+            fig, ax = plt.subplots()
+            draw_heatmap(fig, ax, spec)
+            fig.tight_layout()
+            fig.savefig(spec["path"])
+            if show:
+                plt.show()
+            else:
+                plt.close(fig)
+        if save_bitmap and spec["bitmap_path"]:
+            write_heatmap_png(
+                spec["bitmap_path"], spec["data"], spec["cmap"], spec["vmin"], spec["vmax"], scale=bitmap_scale
+            )
+
+
 def plot_heatmap(
     folder,
     heatmap,
@@ -393,281 +608,125 @@ def plot_heatmap(
     save_bitmap=False,
     png_name="heatmap.png",
     bitmap_name="heatmap_bitmap.png",
+    renderer=None,
+    bitmap_scale=BITMAP_SCALE,
 ):
-    """Render heatmaps with axes in meters (linear uW and dBm). cmin/cmax apply to the linear plot; vmin/vmax to dBm."""
-
-    def _draw(ax, add_axes=True):
-        imshow_kwargs = dict(
-            origin="lower",
-            cmap=CMAP,
-            extent=[x_edges[0], x_edges[-1], y_edges[0], y_edges[-1]],
-        )
-        if cmin is not None:
-            imshow_kwargs["vmin"] = cmin
-        if cmax is not None:
-            imshow_kwargs["vmax"] = cmax
-        img = ax.imshow(
-            heatmap.T,
-            **imshow_kwargs,
-        )
-        ax.set_aspect("equal", adjustable="box")
-        if add_axes:
-            agg_label = "Median" if agg == "median" else "Mean"
-            ax.set_title(f"{os.path.basename(folder)} | {agg_label.lower()} power per cell [uW]")
-            ax.set_xlabel("x [m]")
-            ax.set_ylabel("y [m]")
-            cbar = plt.colorbar(img, ax=ax)
-            cbar.ax.set_ylabel(f"{agg_label} power per cell [uW]")
-        if recent_cells:
-            for idx, (i_x, i_y) in enumerate(recent_cells):
-                if 0 <= i_x < len(x_edges) - 1 and 0 <= i_y < len(y_edges) - 1:
-                    edgecolor = "lime" if idx == len(recent_cells) - 1 else "red"
-                    ax.add_patch(
-                        plt.Rectangle(
-                            (x_edges[i_x], y_edges[i_y]),
-                            x_edges[i_x + 1] - x_edges[i_x],
-                            y_edges[i_y + 1] - y_edges[i_y],
-                            fill=False,
-                            edgecolor=edgecolor,
-                            linewidth=2,
-                        )
-                    )
-        if target_rect and add_axes:
-            x0, y0, w, h = target_rect
-            ax.add_patch(
-                plt.Rectangle(
-                    (x0, y0),
-                    w,
-                    h,
-                    fill=False,
-                    edgecolor="green",
-                    linewidth=2,
-                )
-            )
-        if not add_axes:
-            ax.axis("off")
-        return img
-
-    fig, ax = plt.subplots()
-    _draw(ax, add_axes=True)
-    fig.tight_layout()
-    plt.savefig(os.path.join(folder, png_name))
-    if show:
-        plt.show()
-    else:
-        plt.close(fig)
-
-    if save_bitmap:
-        fig2, ax2 = plt.subplots()
-        _draw(ax2, add_axes=False)
-        fig2.tight_layout(pad=0)
-        plt.savefig(os.path.join(folder, bitmap_name), bbox_inches="tight", pad_inches=0)
-        plt.close(fig2)
-
-    # Counts heatmap
-    fig_counts, ax_counts = plt.subplots()
-    img_counts = ax_counts.imshow(
-        counts.T,
-        origin="lower",
-        cmap="viridis",
-        extent=[x_edges[0], x_edges[-1], y_edges[0], y_edges[-1]],
-    )
-    ax_counts.set_aspect("equal", adjustable="box")
-    ax_counts.set_title(f"{os.path.basename(folder)} | samples per cell")
-    ax_counts.set_xlabel("x [m]")
-    ax_counts.set_ylabel("y [m]")
-    cbar_counts = fig_counts.colorbar(img_counts, ax=ax_counts)
-    cbar_counts.ax.set_ylabel("Samples per cell")
-    if target_rect and show:
-        x0, y0, w, h = target_rect
-        ax_counts.add_patch(
-            plt.Rectangle(
-                (x0, y0),
-                w,
-                h,
-                fill=False,
-                edgecolor="green",
-                linewidth=2,
-            )
-        )
-    fig_counts.tight_layout()
-    plt.savefig(os.path.join(folder, "heatmap_counts.png"))
-    if save_bitmap:
-        fig_counts_bitmap, ax_counts_bitmap = plt.subplots()
-        img_counts_bitmap = ax_counts_bitmap.imshow(
-            counts.T,
-            origin="lower",
-            cmap="viridis",
-            extent=[x_edges[0], x_edges[-1], y_edges[0], y_edges[-1]],
-        )
-        ax_counts_bitmap.set_aspect("equal", adjustable="box")
-        ax_counts_bitmap.axis("off")
-        fig_counts_bitmap.tight_layout(pad=0)
-        plt.savefig(
-            os.path.join(folder, "heatmap_counts_bitmap.png"),
-            bbox_inches="tight",
-            pad_inches=0,
-        )
-        plt.close(fig_counts_bitmap)
-    if show:
-        plt.show()
-    else:
-        plt.close(fig_counts)
-
-    # dBm plot (uses corresponding vmin/vmax if provided)
-    heatmap_dbm = heatmap_to_dbm(heatmap)
-
-    dbm_kwargs = dict(
-        origin="lower",
-        cmap=CMAP,
-        extent=[x_edges[0], x_edges[-1], y_edges[0], y_edges[-1]],
-    )
-    if vmin is not None:
-        dbm_kwargs["vmin"] = vmin  # expects dBm
-    if vmax is not None:
-        dbm_kwargs["vmax"] = vmax  # expects dBm
-    fig_dbm, ax_dbm = plt.subplots()
-    img_dbm = ax_dbm.imshow(
-        heatmap_dbm.T,
-        **dbm_kwargs,
-    )
-    ax_dbm.set_aspect("equal", adjustable="box")
-    ax_dbm.set_title(f"{os.path.basename(folder)} | power per cell [dBm]")
-    ax_dbm.set_xlabel("x [m]")
-    ax_dbm.set_ylabel("y [m]")
-    cbar_dbm = fig_dbm.colorbar(img_dbm, ax=ax_dbm)
-    cbar_dbm.ax.set_ylabel("Power per cell [dBm]")
+    """
+    Render heatmaps with axes in meters (linear uW, counts and dBm). cmin/cmax apply to the linear plot; vmin/vmax to dBm.
+    With a HeadlessRenderer (--headless) the figures are reused and nothing is shown.
+    With save_bitmap the grids are also written as pixel-exact *_bitmap.png files (bitmap_scale px per cell).
+    """
+    name = os.path.basename(folder)
+    agg_label = "Median" if agg == "median" else "Mean"
+    target_rects = _target_rects(target_rect)
+    markers = []
     if target_rect:
         x0, y0, w, h = target_rect
-        ax_dbm.add_patch(
-            plt.Rectangle(
-                (x0, y0),
-                w,
-                h,
-                fill=False,
-                edgecolor="green",
-                linewidth=2,
-            )
-        )
-        ax_dbm.plot(
-            x0 + w / 2.0,
-            y0 + h / 2.0,
-            marker="x",
-            color="green",
-            markersize=8,
-            markeredgewidth=2,
-        )
-    fig_dbm.tight_layout()
+        markers.append((x0 + w / 2.0, y0 + h / 2.0, "green"))
     base_root = os.path.splitext(png_name)[0]
     if base_root.endswith("_bitmap"):
         base_root = base_root[: -len("_bitmap")]
-    dbm_png_name = f"{base_root}_dBm.png"
-    dbm_bitmap_name = f"{base_root}_dBm_bitmap.png"
-    plt.savefig(os.path.join(folder, dbm_png_name))
-    if save_bitmap:
-        fig_dbm_bitmap, ax_dbm_bitmap = plt.subplots()
-        ax_dbm_bitmap.imshow(
-            heatmap_dbm.T,
-            **dbm_kwargs,
-        )
-        ax_dbm_bitmap.set_aspect("equal", adjustable="box")
-        ax_dbm_bitmap.axis("off")
-        fig_dbm_bitmap.tight_layout(pad=0)
-        plt.savefig(
-            os.path.join(folder, dbm_bitmap_name),
-            bbox_inches="tight",
-            pad_inches=0,
-        )
-        plt.close(fig_dbm_bitmap)
-    if show:
-        plt.show()
-    else:
-        plt.close(fig_dbm)
-
-
-def _cell_center(i_x, i_y, x_edges, y_edges):
-    """Return center coordinate for a heatmap cell index."""
-    cx = (x_edges[i_x] + x_edges[i_x + 1]) / 2.0
-    cy = (y_edges[i_y] + y_edges[i_y + 1]) / 2.0
-    return cx, cy
-
-
-def clip_heatmap_to_window(heatmap, counts, x_edges, y_edges, center_xy, half_size):
-    """Return a clipped heatmap/counts/edges around center_xy with given half_size."""
-    if heatmap.size == 0 or center_xy is None:
-        return None
-    cx, cy = center_xy
-    x0, x1 = cx - half_size, cx + half_size
-    y0, y1 = cy - half_size, cy + half_size
-
-    ix_start = max(np.searchsorted(x_edges, x0, side="right") - 1, 0)
-    ix_end = min(np.searchsorted(x_edges, x1, side="left"), len(x_edges) - 1)
-    iy_start = max(np.searchsorted(y_edges, y0, side="right") - 1, 0)
-    iy_end = min(np.searchsorted(y_edges, y1, side="left"), len(y_edges) - 1)
 
-    if ix_end <= ix_start or iy_end <= iy_start:
-        return None
-
-    clipped_heatmap = heatmap[ix_start:ix_end, iy_start:iy_end]
-    clipped_counts = counts[ix_start:ix_end, iy_start:iy_end] if counts is not None else None
-    clipped_x_edges = x_edges[ix_start:ix_end + 1]
-    clipped_y_edges = y_edges[iy_start:iy_end + 1]
-    return clipped_heatmap, clipped_counts, clipped_x_edges, clipped_y_edges
+    specs = [
+        heatmap_spec(
+            "uW",
+            os.path.join(folder, png_name),
+            heatmap,
+            x_edges,
+            y_edges,
+            CMAP,
+            cmin,
+            cmax,
+            f"{name} | {agg_label.lower()} power per cell [uW]",
+            f"{agg_label} power per cell [uW]",
+            rects=_recent_cell_rects(recent_cells, x_edges, y_edges) + target_rects,
+            bitmap_path=os.path.join(folder, bitmap_name),
+        ),
+        heatmap_spec(
+            "counts",
+            os.path.join(folder, "heatmap_counts.png"),
+            counts,
+            x_edges,
+            y_edges,
+            "viridis",
+            None,
+            None,
+            f"{name} | samples per cell",
+            "Samples per cell",
+            rects=target_rects,
+            bitmap_path=os.path.join(folder, "heatmap_counts_bitmap.png"),
+        ),
+        heatmap_spec(
+            "dBm",
+            os.path.join(folder, f"{base_root}_dBm.png"),
+            heatmap_to_dbm(heatmap),
+            x_edges,
+            y_edges,
+            CMAP,
+            vmin,
+            vmax,
+            f"{name} | power per cell [dBm]",
+            "Power per cell [dBm]",
+            rects=target_rects,
+            markers=markers,
+            bitmap_path=os.path.join(folder, f"{base_root}_dBm_bitmap.png"),
+        ),
+    ]
+    render_heatmaps(specs, show=show, save_bitmap=save_bitmap, renderer=renderer, bitmap_scale=bitmap_scale)
 
 
 def write_folder_log(
     folder,
     heatmap,
-    counts,
-    x_edges,
-    y_edges,
     target_xyz,
     agg,
-    bd_power_pw=None,
+    bd_stats=None,
     first_cell=None,
     first_pos=None,
     baseline_heatmap=None,
-    baseline_x_edges=None,
-    baseline_y_edges=None,
     baseline_name=None,
 ):
-    """Write a per-folder summary stats log."""
+    """
+    Write a per-folder summary stats log. bd_stats comes from update_bd_stats
+    (None: no bd_power column). heatmap and baseline_heatmap are SparseHeatmaps
+    on the same grid, so the target's cell is located once and looked up in both.
+    """
     log_path = os.path.join(folder, "heatmap.txt")
-    if np.isfinite(heatmap).any():
-        max_idx = np.nanargmax(heatmap)
-        i_x, i_y = np.unravel_index(max_idx, heatmap.shape)
-        max_val = float(heatmap[i_x, i_y])
-        max_x, max_y = _cell_center(i_x, i_y, x_edges, y_edges)
-        max_count = int(counts[i_x, i_y])
+    grid = heatmap.grid
+    ix0, iy0, nx, ny = heatmap.window
+    max_i = heatmap.argmax()
+    if max_i >= 0:
+        i_x, i_y = int(heatmap.xi[max_i]), int(heatmap.yi[max_i])
+        max_val = float(heatmap.values[max_i])
+        centers_x, centers_y = heatmap.centers()
+        max_x, max_y = float(centers_x[max_i]), float(centers_y[max_i])
     else:
         i_x = i_y = None
         max_val = float("nan")
         max_x = max_y = float("nan")
-        max_count = 0
 
-    total_samples = int(counts.sum())
-    nonzero_counts = counts[counts > 0]
+    total_samples = int(heatmap.counts.sum())
+    nonzero_counts = heatmap.counts[heatmap.counts > 0]
     min_count = int(nonzero_counts.min()) if nonzero_counts.size else 0
     max_count = int(nonzero_counts.max()) if nonzero_counts.size else 0
-    num_cells = int(counts.size)
+    num_cells = nx * ny
     num_nonzero_cells = int(nonzero_counts.size)
 
     with open(log_path, "w", encoding="utf-8") as fh:
         fh.write(f"folder: {os.path.basename(folder)}\n")
         fh.write(f"aggregation: {agg}\n")
-        fh.write(f"grid_res_m: {GRID_RES}\n")
+        fh.write(f"grid_res_m: {grid.res}\n")
+        fh.write(f"grid_origin_m: {grid.origin[0]:.6f}, {grid.origin[1]:.6f}\n")
         if target_xyz and len(target_xyz) >= 2:
             z_val = target_xyz[2] if len(target_xyz) > 2 else "n/a"
             fh.write(f"target_location: {target_xyz[0]:.6f}, {target_xyz[1]:.6f}, {z_val}\n")
         else:
             fh.write("target_location: n/a\n")
-        if bd_power_pw is not None:
-            bd_vals = np.asarray(bd_power_pw, dtype=float)
-            bd_valid = bd_vals[np.isfinite(bd_vals) & (bd_vals > 0)]
-            if bd_valid.size:
-                bd_min_dbm = float(pw_to_dbm(bd_valid.min()))
-                bd_max_dbm = float(pw_to_dbm(bd_valid.max()))
-                bd_mean_dbm = float(pw_to_dbm(bd_valid.mean()))
+        if bd_stats is not None:
+            if bd_stats["count"]:
+                bd_min_dbm = float(pw_to_dbm(bd_stats["min"]))
+                bd_max_dbm = float(pw_to_dbm(bd_stats["max"]))
+                bd_mean_dbm = float(pw_to_dbm(bd_stats["sum"] / bd_stats["count"]))
                 fh.write(f"bd_power_min_dBm: {bd_min_dbm:.2f}\n")
                 fh.write(f"bd_power_max_dBm: {bd_max_dbm:.2f}\n")
                 fh.write(f"bd_power_mean_dBm: {bd_mean_dbm:.2f}\n")
@@ -693,43 +752,40 @@ def write_folder_log(
         fh.write(f"min_cell_count: {min_count}\n")
         fh.write(f"max_cell_count_all: {max_count}\n")
         if target_xyz and len(target_xyz) >= 2:
-            tx, ty = target_xyz[0], target_xyz[1]
-            ti_x = np.digitize(tx, x_edges) - 1
-            ti_y = np.digitize(ty, y_edges) - 1
-            if 0 <= ti_x < heatmap.shape[0] and 0 <= ti_y < heatmap.shape[1]:
-                tgt_power = heatmap[ti_x, ti_y]
-                tgt_count = int(counts[ti_x, ti_y])
+            target_cell = grid.cell(target_xyz[0], target_xyz[1])
+            ti_x = ti_y = -1
+            if target_cell is not None:
+                ti_x, ti_y = target_cell[0] - ix0, target_cell[1] - iy0
+            if 0 <= ti_x < nx and 0 <= ti_y < ny:
+                # a cell of the window without samples is not stored
+                t = heatmap.find(*target_cell)
+                tgt_power = heatmap.values[t] if t >= 0 else np.nan
+                tgt_count = int(heatmap.counts[t]) if t >= 0 else 0
+                tgt_x, tgt_y = grid.edges((target_cell[0], target_cell[1], 1, 1))
                 fh.write(f"target_cell_index: {ti_x}, {ti_y}\n")
-                fh.write(f"target_cell_center_m: {_cell_center(ti_x, ti_y, x_edges, y_edges)[0]:.6f}, {_cell_center(ti_x, ti_y, x_edges, y_edges)[1]:.6f}\n")
+                fh.write(f"target_cell_center_m: {(tgt_x[0] + tgt_x[1]) / 2:.6f}, {(tgt_y[0] + tgt_y[1]) / 2:.6f}\n")
                 fh.write(f"target_power_uW: {float(tgt_power):.6f}\n")
                 fh.write(f"target_cell_count: {tgt_count}\n")
                 if np.isfinite(tgt_power) and tgt_power > 0:
                     tgt_power_dbm = 10 * np.log10(float(tgt_power) * 1e-6 / 1e-3)
                     fh.write(f"target_power_dBm: {tgt_power_dbm:.2f}\n")
-                if (
-                    baseline_heatmap is not None
-                    and baseline_x_edges is not None
-                    and baseline_y_edges is not None
-                ):
-                    b_ix = np.digitize(tx, baseline_x_edges) - 1
-                    b_iy = np.digitize(ty, baseline_y_edges) - 1
-                    if 0 <= b_ix < baseline_heatmap.shape[0] and 0 <= b_iy < baseline_heatmap.shape[1]:
-                        base_power = baseline_heatmap[b_ix, b_iy]
-                        if np.isfinite(base_power) and base_power > 0 and np.isfinite(tgt_power) and tgt_power > 0:
-                            gain_lin = float(tgt_power / base_power)
-                            gain_db = float(10 * np.log10(gain_lin))
-                            fh.write(f"baseline_folder: {baseline_name or 'n/a'}\n")
-                            fh.write(f"baseline_target_power_uW: {float(base_power):.6f}\n")
-                            if np.isfinite(base_power) and base_power > 0:
-                                base_power_dbm = 10 * np.log10(float(base_power) * 1e-6 / 1e-3)
-                                fh.write(f"baseline_target_power_dBm: {base_power_dbm:.2f}\n")
-                            fh.write(f"target_gain_linear: {gain_lin:.6f}\n")
-                            fh.write(f"target_gain_db: {gain_db:.2f}\n")
+                b = baseline_heatmap.find(*target_cell) if baseline_heatmap is not None else -1
+                if b >= 0:
+                    base_power = baseline_heatmap.values[b]
+                    if np.isfinite(base_power) and base_power > 0 and np.isfinite(tgt_power) and tgt_power > 0:
+                        gain_lin = float(tgt_power / base_power)
+                        gain_db = float(10 * np.log10(gain_lin))
+                        fh.write(f"baseline_folder: {baseline_name or 'n/a'}\n")
+                        fh.write(f"baseline_target_power_uW: {float(base_power):.6f}\n")
+                        if np.isfinite(base_power) and base_power > 0:
+                            base_power_dbm = 10 * np.log10(float(base_power) * 1e-6 / 1e-3)
+                            fh.write(f"baseline_target_power_dBm: {base_power_dbm:.2f}\n")
+                        fh.write(f"target_gain_linear: {gain_lin:.6f}\n")
+                        fh.write(f"target_gain_db: {gain_db:.2f}\n")
             else:
                 fh.write("target_power_uW: n/a\n")
 
 
-
 def plot_diff_heatmap(
     folder,
     baseline_name,
@@ -744,99 +800,78 @@ def plot_diff_heatmap(
     png_name=None,
     bitmap_name=None,
     title_override=None,
+    renderer=None,
+    bitmap_scale=BITMAP_SCALE,
 ):
     """Plot the difference vs baseline in dB (folder - baseline) on aligned grid."""
     png_out = png_name or f"heatmap_vs_{baseline_name}_dB.png"
     bitmap_out = bitmap_name or f"heatmap_vs_{baseline_name}_dB_bitmap.png"
-
-    def _draw(ax, add_axes=True):
-        img = ax.imshow(
-            diff_map.T,
-            vmin=vdmin,
-            vmax=vdmax,
-            origin="lower",
-            cmap=CMAP,
-            extent=[x_edges[0], x_edges[-1], y_edges[0], y_edges[-1]],
-        )
-        ax.set_aspect("equal", adjustable="box")
-        if add_axes:
-            title = title_override or f"{os.path.basename(folder)} - {baseline_name} | delta power per cell [dB]"
-            ax.set_title(title)
-            ax.set_xlabel("x [m]")
-            ax.set_ylabel("y [m]")
-            cbar = plt.colorbar(img, ax=ax)
-            cbar.ax.set_ylabel("Delta vs baseline [dB]")
-        if target_rect and add_axes:
-            x0, y0, w, h = target_rect
-            ax.add_patch(
-                plt.Rectangle(
-                    (x0, y0),
-                    w,
-                    h,
-                    fill=False,
-                    edgecolor="green",
-                    linewidth=2,
-                )
-            )
-        if not add_axes:
-            ax.axis("off")
-        return img
-
-    fig, ax = plt.subplots()
-    _draw(ax, add_axes=True)
-    fig.tight_layout()
-    plt.savefig(os.path.join(folder, png_out))
-    if show:
-        plt.show()
-    else:
-        plt.close(fig)
-
-    if save_bitmap:
-        fig2, ax2 = plt.subplots()
-        _draw(ax2, add_axes=False)
-        fig2.tight_layout(pad=0)
-        plt.savefig(os.path.join(folder, bitmap_out), bbox_inches="tight", pad_inches=0)
-        plt.close(fig2)
+    spec = heatmap_spec(
+        "delta",
+        os.path.join(folder, png_out),
+        diff_map,
+        x_edges,
+        y_edges,
+        CMAP,
+        vdmin,
+        vdmax,
+        title_override or f"{os.path.basename(folder)} - {baseline_name} | delta power per cell [dB]",
+        "Delta vs baseline [dB]",
+        rects=_target_rects(target_rect),
+        bitmap_path=os.path.join(folder, bitmap_out),
+    )
+    render_heatmaps([spec], show=show, save_bitmap=save_bitmap, renderer=renderer, bitmap_scale=bitmap_scale)
 
 
-def export_heatmap_csv(folder, heatmap, x_edges, y_edges, suffix=""):
-    """Export heatmap grid to long-form CSV (x,y,z) plus edge vectors."""
+def export_heatmap_csv(folder, heatmap, suffix="", npz=False):
+    """
+    Export a SparseHeatmap to long-form CSV (x,y,z; finite cells only, x-major) plus edge vectors.
+    With npz=True also write heatmap<suffix>.npz (full window grid incl. NaN, edges, centers; compressed).
+    """
     suffix_str = f"_{suffix}" if suffix else ""
     grid_path = os.path.join(folder, f"heatmap{suffix_str}.csv")
     x_path = os.path.join(folder, f"x_edges{suffix_str}.csv")
     y_path = os.path.join(folder, f"y_edges{suffix_str}.csv")
+    x_edges, y_edges = heatmap.edges()
 
-    # Centers for each cell
-    x_centers = (x_edges[:-1] + x_edges[1:]) / 2
-    y_centers = (y_edges[:-1] + y_edges[1:]) / 2
-
-    rows = []
-    for ix, xc in enumerate(x_centers):
-        for iy, yc in enumerate(y_centers):
-            z = heatmap[ix, iy]
-            if np.isfinite(z):
-                rows.append((xc, yc, z))
+    # Stored cells are already x-major, so the rows come out in dense-grid order
+    x_centers, y_centers = heatmap.centers()
+    finite = np.isfinite(heatmap.values)
+    rows = np.column_stack((x_centers[finite], y_centers[finite], heatmap.values[finite]))
 
+    # One %-format over all rows: same text as a per-row f"{v:.6g}" loop, without the per-row overhead.
     with open(grid_path, "w", encoding="utf-8") as fh:
         fh.write("x,y,z\n")
-        for x, y, z in rows:
-            fh.write(f"{x:.6g},{y:.6g},{z:.6g}\n")
+        fh.write(("%.6g,%.6g,%.6g\n" * len(rows)) % tuple(rows.ravel().tolist()))
 
     np.savetxt(x_path, x_edges, delimiter=",", fmt="%.6g")
     np.savetxt(y_path, y_edges, delimiter=",", fmt="%.6g")
-    print(f"Exported heatmap CSVs: {grid_path}, {x_path}, {y_path}")
+    paths = [grid_path, x_path, y_path]
+    if npz:
+        npz_path = os.path.join(folder, f"heatmap{suffix_str}.npz")
+        np.savez_compressed(
+            npz_path,
+            heatmap=heatmap.dense(),
+            x_edges=x_edges,
+            y_edges=y_edges,
+            x_centers=(x_edges[:-1] + x_edges[1:]) / 2,
+            y_centers=(y_edges[:-1] + y_edges[1:]) / 2,
+        )
+        paths.append(npz_path)
+    print(f"Exported heatmap CSVs: {', '.join(paths)}")
 
 
-def export_heatmap_tex(folder, x_edges, y_edges, heatmap, suffix="", title="", target_rect=None, vmin=None, vmax=None):
+def export_heatmap_tex(folder, heatmap, suffix="", title="", target_rect=None, vmin=None, vmax=None):
     """Write a small PGFPlots snippet that embeds the rendered bitmap with axes/ticks/colorbar drawn in TikZ."""
     suffix_str = f"_{suffix}" if suffix else ""
     tex_path = os.path.join(folder, f"heatmap{suffix_str}.tex")
     png_name = f"heatmap{suffix_str}_bitmap.png"
     png_rel_path = f"figures/{os.path.basename(folder)}/{png_name}"
+    x_edges, y_edges = heatmap.edges()
     xmin, xmax = x_edges[0], x_edges[-1]
     ymin, ymax = y_edges[0], y_edges[-1]
     title_tex = title.replace("_", "\\_") if title else ""
-    finite_vals = heatmap[np.isfinite(heatmap)]
+    finite_vals = heatmap.values[np.isfinite(heatmap.values)]
     vmin_val = float(finite_vals.min()) if finite_vals.size else 0.0
     vmax_val = float(finite_vals.max()) if finite_vals.size else 1.0
     vmin_use = vmin if vmin is not None else vmin_val
@@ -926,13 +961,21 @@ def parse_args():
     parser.add_argument(
         "--baseline-folder",
         default=None,
-        help="Folder name to use as baseline for delta heatmap (default: RANDOM-1 when not set in CLI/config). Set empty to disable.",
+        help=(
+            "Folder name to use as baseline for delta heatmap (default: RANDOM-1 when not set in CLI/config). "
+            "Join names with '+' to pool several runs (e.g. RANDOM-1+RANDOM-2). Set empty to disable."
+        ),
     )
     parser.add_argument(
         "--export-csv",
         action="store_true",
         help="Export heatmap grids and edges to CSV (for LaTeX/pgfplots).",
     )
+    parser.add_argument(
+        "--export-npz",
+        action="store_true",
+        help="With --export-csv, also write each grid as a compressed heatmap*.npz (grid, edges, centers).",
+    )
     parser.add_argument(
         "--fill-empty",
         action="store_true",
@@ -941,7 +984,10 @@ def parse_args():
     parser.add_argument(
         "--grid-res-lambda",
         type=float,
-        help="Grid resolution as a fraction of wavelength (e.g., 0.08 for 0.08*lambda). Overrides default.",
+        help=(
+            "Grid resolution as a fraction of wavelength (e.g., 0.08 for 0.08*lambda). "
+            "Overrides heatmap_grid.resolution_lambda in experiment-settings.yaml."
+        ),
     )
     parser.add_argument(
         "--vdmin",
@@ -967,6 +1013,54 @@ def parse_args():
         default=None,
         help="Colormap maximum for the linear uW heatmap. If omitted, autoscale.",
     )
+    parser.add_argument(
+        "--headless",
+        action="store_true",
+        help="Render with Agg only, reusing one figure per plot type; bitmaps are written without a figure (implies --save-only).",
+    )
+    parser.add_argument(
+        "--bitmap-scale",
+        type=int,
+        default=BITMAP_SCALE,
+        help=f"Pixels per heatmap cell (each direction) in the *_bitmap.png exports (default: {BITMAP_SCALE}).",
+    )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=1,
+        help="Process folders in N worker processes (with --plot-all; implies --save-only).",
+    )
+    parser.add_argument(
+        "--stream",
+        type=int,
+        nargs="?",
+        const=STREAM_CHUNK_SIZE,
+        default=None,
+        metavar="CHUNK",
+        help=(
+            f"Stream each folder in chunks of CHUNK samples (default {STREAM_CHUNK_SIZE}) instead of loading it whole. "
+            f"The median is then a sketch estimate (within {DEFAULT_RELATIVE_ACCURACY * 100:g}%%)."
+        ),
+    )
+    parser.add_argument(
+        "--pyramid",
+        type=int,
+        nargs="?",
+        const=PYRAMID_LEVELS,
+        default=None,
+        metavar="LEVELS",
+        help=(
+            f"Bin each folder once on the grid and derive LEVELS-1 coarser levels (default {PYRAMID_LEVELS} levels: "
+            "2x, 4x, ... the cell size) by merging 2x2 cells. The levels are cached together, so a later --pyramid run "
+            "at any of their resolutions is a lookup. Streams like --stream (median as a sketch estimate)."
+        ),
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Ignore and do not update the per-folder .heatmap_cache/.",
+    )
     parser.add_argument(
         "--vmin",
         type=float,
@@ -982,7 +1076,7 @@ def parse_args():
     return parser.parse_args()
 
 
-def print_run_summary(args, target_rect, baseline_folder_name, baseline_agg, grid_res):
+def print_run_summary(args, target_rect, baseline_folder_name, baseline_agg, grid):
     """Print selected options so it's clear how folders will be processed."""
     rect_desc = (
         f"{target_rect[2]:.3f}x{target_rect[3]:.3f} m at ({target_rect[0]:.3f}, {target_rect[1]:.3f})"
@@ -995,6 +1089,10 @@ def print_run_summary(args, target_rect, baseline_folder_name, baseline_agg, gri
         f"- data dir: {DATA_DIR}\n"
         f"- plot_all: {args.plot_all}\n"
         f"- save_only: {args.save_only}\n"
+        f"- headless: {args.headless}\n"
+        f"- jobs: {args.jobs}\n"
+        f"- stream: {f'{args.stream} samples per chunk' if args.stream else 'off'}\n"
+        f"- pyramid: {f'{args.pyramid} levels' if args.pyramid else 'off'}\n"
         f"- plot_movement: {args.plot_movement}\n"
         f"- agg (main): {args.agg}\n"
         f"- drop_duplicate_timestamps: {args.drop_duplicate_timestamps}\n"
@@ -1003,7 +1101,7 @@ def print_run_summary(args, target_rect, baseline_folder_name, baseline_agg, gri
         f"- target rectangle: {rect_desc}\n"
         f"- baseline folder: {baseline_desc} (agg={baseline_agg})\n"
         f"- fill_empty: {args.fill_empty}\n"
-        f"- grid_res: {grid_res:.4f} m\n"
+        f"- grid: {grid.describe()}\n"
         f"- vdmin/vdmax (baseline dB plots): {args.vdmin}/{args.vdmax}\n"
         f"- cmin/cmax (linear uW plots): {args.cmin}/{args.cmax}\n"
         f"- vmin/vmax (dBm plots): {args.vmin}/{args.vmax}\n"
@@ -1042,469 +1140,946 @@ def print_drop_summary(
     )
 
 
-def main():
-    args = parse_args()
-    if args.vmin is not None and args.vmax is not None and args.vmin > args.vmax:
-        raise ValueError(f"--vmin ({args.vmin}) cannot be greater than --vmax ({args.vmax})")
-    if args.cmin is not None and args.cmax is not None and args.cmin > args.cmax:
-        raise ValueError(f"--cmin ({args.cmin}) cannot be greater than --cmax ({args.cmax})")
-    if args.vdmin is not None and args.vdmax is not None and args.vdmin > args.vdmax:
-        raise ValueError(f"--vdmin ({args.vdmin}) cannot be greater than --vdmax ({args.vdmax})")
-    if not os.path.isdir(DATA_DIR):
-        raise FileNotFoundError(f"DATA_DIR not found: {DATA_DIR}")
-
-    cli_flags = {
-        "baseline_folder": args.baseline_folder is not None,
-        "vmin": args.vmin is not None,
-        "vmax": args.vmax is not None,
-        "cmin": args.cmin is not None,
-        "cmax": args.cmax is not None,
-        "vdmin": args.vdmin is not None,
-        "vdmax": args.vdmax is not None,
+def _path_summary(xs, ys, xi, yi):
+    return {
+        "first_pos": (float(xs[0]), float(ys[0])) if len(xs) else None,
+        "first_cell": (int(xi[0]), int(yi[0])) if len(xi) else None,
+        "recent_cells": last_distinct_cells(xi, yi),
     }
 
-    grid_res = GRID_RES
-    if args.grid_res_lambda:
-        grid_res = float(args.grid_res_lambda) * WAVELENGTH
 
-    target_vals = load_target_from_settings()
-    target_rect = target_rect_from_xyz(target_vals) if target_vals else None
+def _heatmap_entry(heatmap, recent_cells, stats, summary):
+    """
+    Cache entry (arrays, meta) of an aggregated folder: the sparse heatmap and
+    the path summary (first_pos, first_cell, recent_cells, bd_stats), not the
+    cleaned columns.
+    """
+    arrays = dict(heatmap.state(), recent_cells=np.array(recent_cells, dtype=np.int64).reshape(-1, 2))
+    return arrays, {"stats": stats, "summary": summary}
 
-    # Sort subfolders by modification time (newest first) to view recent runs first
-    folder_entries = []
-    for name in os.listdir(DATA_DIR):
-        folder_path = os.path.join(DATA_DIR, name)
-        if os.path.isdir(folder_path):
-            folder_entries.append((os.path.getmtime(folder_path), name))
 
-    if not folder_entries:
-        raise ValueError(f"No subfolders found in {DATA_DIR}")
+def _data_from_entry(grid, arrays, meta):
+    """The aggregate_folder data of a cache entry (_heatmap_entry); the columns are None."""
+    data = {key: None for key in ("xs", "ys", "vs", "xi", "yi")}
+    data["heatmap"] = SparseHeatmap.from_state(grid, arrays)
+    data["recent_cells"] = [tuple(cell) for cell in arrays["recent_cells"].tolist()]
+    data.update(meta["summary"])
+    for key in ("first_pos", "first_cell"):
+        if data[key] is not None:
+            data[key] = tuple(data[key])  # JSON stores them as lists
+    return data
 
-    # Precompute default baseline heatmap if requested
-    baseline_heatmap = baseline_x_edges = baseline_y_edges = None
-    baseline_agg = "mean"
-    baseline_folder_name = args.baseline_folder if cli_flags["baseline_folder"] else DEFAULT_BASELINE_FOLDER
-    baseline_folder_name = baseline_folder_name.strip() if isinstance(baseline_folder_name, str) else ""
 
-    def _build_baseline(baseline_name: str):
-        if not baseline_name:
-            return None, None, None
-        baseline_path = os.path.join(DATA_DIR, baseline_name)
-        if not os.path.isdir(baseline_path):
-            print(f"Baseline folder not found: {baseline_path}")
-            return None, None, None
+def aggregate_folder(
+    folder_path,
+    grid,
+    agg,
+    drop_duplicate_timestamps=False,
+    drop_consecutive_equal=False,
+    use_cache=True,
+    chunk_size=None,
+    pyramid_levels=None,
+):
+    """
+    Load, clean and bin one folder.
+
+    Returns (data, stats): data holds the heatmap (a SparseHeatmap of the
+    occupied cells with their value and count), first_pos, first_cell,
+    recent_cells (last 5 distinct cells, oldest first) and bd_stats (see
+    update_bd_stats). It also
+    holds the cleaned columns xs, ys, vs (uW) and their cell indices xi, yi,
+    except with chunk_size set: then the folder is streamed in chunks
+    (aggregate_folder_streaming) and those are None; likewise with
+    pyramid_levels set, when the heatmap is a level of the folder's pyramid
+    (aggregate_folder_pyramid), and on a cache hit. stats holds the drop
+    counts for print_drop_summary. The heatmap and path summary are cached in
+    the folder's .heatmap_cache/ and reused while its snapshot files are
+    unchanged. Raises ValueError when the folder holds no snapshots.
+    """
+    if pyramid_levels:
+        return aggregate_folder_pyramid(
+            folder_path,
+            grid,
+            agg,
+            drop_duplicate_timestamps,
+            drop_consecutive_equal,
+            use_cache,
+            chunk_size or STREAM_CHUNK_SIZE,
+            pyramid_levels,
+        )
+    if chunk_size:
+        return aggregate_folder_streaming(
+            folder_path, grid, agg, drop_duplicate_timestamps, drop_consecutive_equal, use_cache, chunk_size
+        )
+    params = {
+        "grid": grid.params(),
+        "agg": agg,
+        "drop_duplicate_timestamps": drop_duplicate_timestamps,
+        "drop_consecutive_equal": drop_consecutive_equal,
+        "small_power_uw": SMALL_POWER_UW,
+    }
+    cache = FolderCache(folder_path) if use_cache else None
+    if cache is not None:
+        hit = cache.load(params)
+        if hit is not None:
+            arrays, meta = hit
+            print(f"{os.path.basename(folder_path)}: cached {meta['stats']['start_count']} samples")
+            return _data_from_entry(grid, arrays, meta), meta["stats"]
+
+    samples = load_folder(folder_path)
+    bd_stats = update_bd_stats(None, samples["bd_pw"])
+    stats = {"start_count": len(samples), "drop_ts": 0, "drop_dups": 0, "drop_small": 0, "ts_info": None}
+
+    if drop_duplicate_timestamps:
+        samples, stats["drop_ts"], stats["ts_info"] = drop_nonincreasing_timestamps(samples)
+
+    if drop_consecutive_equal:
+        samples, stats["drop_dups"] = drop_consecutive_equal_values(samples)
+
+    vs = samples["pwr_pw"] / 1e6  # uW
+
+    samples, vs, stats["drop_small"], stats["small_report"] = filter_small_values(folder_path, samples, vs)
+    stats["end_count"] = len(samples)
+
+    xs = np.ascontiguousarray(samples["x"])
+    ys = np.ascontiguousarray(samples["y"])
+    heatmap, xi, yi = compute_sparse_heatmap(xs, ys, vs, grid, agg=agg)
+    data = {"xs": xs, "ys": ys, "vs": vs, "xi": xi, "yi": yi, "heatmap": heatmap, "bd_stats": bd_stats}
+    data.update(_path_summary(xs, ys, xi, yi))
+    if cache is not None:
+        summary = {key: data[key] for key in ("first_pos", "first_cell", "bd_stats")}
         try:
-            base_positions, base_values, _ = load_folder(baseline_path)
-            if args.drop_consecutive_equal:
-                base_positions, base_values, _ = drop_consecutive_equal_values(
-                    base_positions, base_values
-                )
-            base_vs = np.array([v.pwr_pw / 1e6 for v in base_values], dtype=float)
-            base_positions, base_values, base_vs, _, _ = filter_small_values(
-                baseline_path, base_positions, base_values, base_vs
-            )
-            base_xs = np.array([p.x for p in base_positions], dtype=float)
-            base_ys = np.array([p.y for p in base_positions], dtype=float)
-            base_heatmap, _, base_x_edges, base_y_edges, _, _ = compute_heatmap(
-                base_xs, base_ys, base_vs, grid_res, agg=baseline_agg
-            )
-            return base_heatmap, base_x_edges, base_y_edges
+            cache.store(params, *_heatmap_entry(heatmap, data["recent_cells"], stats, summary))
         except Exception as exc:
-            print(f"Failed to build baseline from {baseline_path}: {exc}")
-            return None, None, None
+            print(f"Failed to write cache {cache.path}: {exc}")
+    return data, stats
 
-    if baseline_folder_name:
-        baseline_heatmap, baseline_x_edges, baseline_y_edges = _build_baseline(
-            baseline_folder_name
-        )
-        if baseline_heatmap is None:
-            baseline_folder_name = ""
 
-    print_run_summary(args, target_rect, baseline_folder_name, baseline_agg, grid_res)
+def iter_clean_chunks(folder_path, snapshots, chunk_size, drop_duplicate_timestamps, drop_consecutive_equal, stats):
+    """
+    Stream a folder through the cleaning steps of aggregate_folder and yield
+    (raw, samples, vs) per chunk: the raw chunk, its cleaned samples and their
+    power in uW. The order-dependent filters are re-run with the last sample of
+    the previous chunk prepended, so the cleaned stream equals cleaning the
+    whole folder at once. Counts are added to stats (see _new_stream_stats).
+    """
+    ts_carry = dup_carry = None
+    for raw in iter_folder_samples(folder_path, chunk_size, snapshots):
+        stats["start_count"] += len(raw)
+        samples = raw
+
+        if drop_duplicate_timestamps:
+            if ts_carry is not None:
+                samples = np.concatenate((ts_carry, samples))
+            samples, dropped, ts_info = drop_nonincreasing_timestamps(samples)
+            if ts_carry is not None:
+                samples = samples[1:]
+            if len(samples):
+                ts_carry = samples[-1:].copy()
+            stats["drop_ts"] += dropped
+            stats["ts_info"]["equal"] += ts_info["equal"]
+            stats["ts_info"]["decrease"] += ts_info["decrease"]
+
+        if drop_consecutive_equal:
+            # neighbours are compared before dropping, so carry the last input sample
+            tail = samples[-1:].copy() if len(samples) else dup_carry
+            if dup_carry is not None:
+                samples = np.concatenate((dup_carry, samples))
+            samples, dropped = drop_consecutive_equal_values(samples)
+            if dup_carry is not None:
+                samples = samples[1:]
+            dup_carry = tail
+            stats["drop_dups"] += dropped
+
+        vs = samples["pwr_pw"] / 1e6  # uW
+        keep, num_zeros, num_small, min_small = _small_values(vs)
+        small = stats["small"]
+        small[0] += num_zeros
+        small[1] += num_small
+        if min_small is not None:
+            small[2] = min_small if small[2] is None else min(small[2], min_small)
+        if num_zeros or num_small:
+            samples, vs = samples[keep], vs[keep]
+        stats["drop_small"] += num_zeros + num_small
+        stats["end_count"] += len(samples)
+        yield raw, samples, vs
+
+
+def _new_stream_stats(drop_duplicate_timestamps):
+    return {
+        "start_count": 0,
+        "end_count": 0,
+        "drop_ts": 0,
+        "drop_dups": 0,
+        "drop_small": 0,
+        "small": [0, 0, None],  # zeros, below threshold, smallest below threshold
+        "ts_info": {"equal": 0, "decrease": 0} if drop_duplicate_timestamps else None,
+    }
 
-    folder_entries.sort(key=lambda x: x[0], reverse=True)
-    for _, folder_name in folder_entries:
-        folder_path = os.path.join(DATA_DIR, folder_name)
-        try:
-            positions, values, bd_power = load_folder(folder_path)
-        except ValueError as e:
-            print(e)
+
+def _stream_bin(folder_path, grid, drop_duplicate_timestamps, drop_consecutive_equal, chunk_size, levels=1):
+    """
+    The two passes over a streamed folder: the first finds the grid window
+    (and first position, bd_power stats), the second bins the chunks into a
+    HeatmapAccumulator. Returns (acc, window, stats, summary, paths), where
+    paths[k] is the (first_cell, recent_cells) of the samples' path on pyramid
+    level k (cells 2**k times the grid's, see lib/heatmap_pyramid.py).
+    """
+    name = os.path.basename(folder_path)
+    snapshots = list_snapshots(folder_path)
+    if not snapshots:
+        raise ValueError(f"No position/value pairs found in {folder_path}")
+
+    stats = _new_stream_stats(drop_duplicate_timestamps)
+    window = None
+    first_pos = None
+    bd_stats = None
+    num_chunks = 0
+    for raw, samples, _ in iter_clean_chunks(
+        folder_path, snapshots, chunk_size, drop_duplicate_timestamps, drop_consecutive_equal, stats
+    ):
+        num_chunks += 1
+        bd_stats = update_bd_stats(bd_stats, raw["bd_pw"])
+        if len(samples) == 0:
             continue
+        xs, ys = samples["x"], samples["y"]
+        if first_pos is None:
+            first_pos = (float(xs[0]), float(ys[0]))
+        ix, iy, inside = grid.locate(xs, ys)
+        window = union_windows(window, grid.window(ix[inside], iy[inside]))
+    print(f"{name}: streamed {len(snapshots)} snapshots, {stats['start_count']} samples in {num_chunks} chunks")
+    stats["small_report"] = _small_value_report(*stats.pop("small"))
+    if window is None:
+        raise ValueError(f"{name}: no samples left after filtering")
+
+    x_edges, y_edges = grid.edges(window)
+    acc = HeatmapAccumulator(x_edges, y_edges)
+    windows = [window]
+    for _ in range(levels - 1):
+        windows.append(coarser_window(windows[-1]))
+    paths = [(None, []) for _ in windows]
+    for _, samples, vs in iter_clean_chunks(
+        folder_path,
+        snapshots,
+        chunk_size,
+        drop_duplicate_timestamps,
+        drop_consecutive_equal,
+        _new_stream_stats(drop_duplicate_timestamps),
+    ):
+        if len(samples) == 0:
+            continue
+        ix, iy, inside = grid.locate(samples["x"], samples["y"])
+        for k, level_window in enumerate(windows):
+            xi = np.where(inside, (ix >> k) - level_window[0], -1)
+            yi = np.where(inside, (iy >> k) - level_window[1], -1)
+            if k == 0:
+                acc.add_binned(xi, yi, vs)
+            first_cell, recent_cells = paths[k]
+            if first_cell is None:
+                first_cell = (int(xi[0]), int(yi[0]))
+            paths[k] = (first_cell, last_distinct_cells(xi, yi, previous=recent_cells))
+
+    summary = {"first_pos": first_pos, "bd_stats": bd_stats}
+    return acc, window, stats, summary, paths
+
+
+def aggregate_folder_streaming(
+    folder_path, grid, agg, drop_duplicate_timestamps, drop_consecutive_equal, use_cache, chunk_size
+):
+    """
+    aggregate_folder without loading the folder into memory: snapshots are read
+    in chunks of chunk_size samples and cleaned as in iter_clean_chunks, then
+    binned into a HeatmapAccumulator (_stream_bin). Mean/min/max match the
+    in-memory result; the median is the accumulator's sketch estimate.
+    """
+    name = os.path.basename(folder_path)
+    params = {
+        "grid": grid.params(),
+        "agg": agg,
+        "drop_duplicate_timestamps": drop_duplicate_timestamps,
+        "drop_consecutive_equal": drop_consecutive_equal,
+        "small_power_uw": SMALL_POWER_UW,
+        "stream": True,
+        "relative_accuracy": DEFAULT_RELATIVE_ACCURACY,
+    }
+    cache = FolderCache(folder_path) if use_cache else None
+    if cache is not None:
+        hit = cache.load(params)
+        if hit is not None:
+            arrays, meta = hit
+            print(f"{name}: cached {meta['stats']['start_count']} samples")
+            return _data_from_entry(grid, arrays, meta), meta["stats"]
+
+    acc, window, stats, summary, paths = _stream_bin(
+        folder_path, grid, drop_duplicate_timestamps, drop_consecutive_equal, chunk_size
+    )
+    first_cell, recent_cells = paths[0]
+    heatmap = SparseHeatmap.from_dense(grid, window, acc.heatmap(agg), acc.counts())
+    summary["first_cell"] = first_cell
+    if cache is not None:
+        try:
+            cache.store(params, *_heatmap_entry(heatmap, recent_cells, stats, summary))
+        except Exception as exc:
+            print(f"Failed to write cache {cache.path}: {exc}")
+    data = {key: None for key in ("xs", "ys", "vs", "xi", "yi")}
+    data["heatmap"] = heatmap
+    data["recent_cells"] = recent_cells
+    data.update(summary)
+    return data, stats
 
-        baseline_txt_path = os.path.join(folder_path, "baseline.txt")
-        if os.path.isfile(baseline_txt_path):
-            print(f"Warning: baseline.txt is deprecated and ignored in {folder_path}; use config.yml instead.")
-
-        folder_config = load_folder_config(folder_path)
-        if "bdmin" in folder_config and "vdmin" not in folder_config:
-            folder_config["vdmin"] = folder_config["bdmin"]
-        if "bdmax" in folder_config and "vdmax" not in folder_config:
-            folder_config["vdmax"] = folder_config["bdmax"]
-
-        def apply_config(key, current_val, cli_set):
-            if key not in folder_config or folder_config[key] is None:
-                return current_val
-            if cli_set:
-                print(
-                    f"Warning: {key} set in CLI overrides config.yml for {folder_name}; using CLI value ({current_val})."
-                )
-                return current_val
-            return folder_config[key]
-
-        folder_vmin = apply_config("vmin", args.vmin, cli_flags["vmin"])
-        folder_vmax = apply_config("vmax", args.vmax, cli_flags["vmax"])
-        folder_cmin = apply_config("cmin", args.cmin, cli_flags["cmin"])
-        folder_cmax = apply_config("cmax", args.cmax, cli_flags["cmax"])
-        folder_vdmin = apply_config("vdmin", args.vdmin, cli_flags["vdmin"])
-        folder_vdmax = apply_config("vdmax", args.vdmax, cli_flags["vdmax"])
-        baseline_override_name = apply_config("baseline-folder", baseline_folder_name, cli_flags["baseline_folder"])
-        baseline_override_name = baseline_override_name.strip() if isinstance(baseline_override_name, str) else ""
-        folder_target_vals = None
-        if "target_location" in folder_config:
-            folder_target_vals = parse_target_location(
-                folder_config.get("target_location"),
-                os.path.join(folder_path, "config.yml"),
-            )
 
-        if folder_vmin is not None and folder_vmax is not None and folder_vmin > folder_vmax:
-            raise ValueError(
-                f"config/CLI mismatch for {folder_name}: vmin ({folder_vmin}) cannot be greater than vmax ({folder_vmax})"
-            )
-        if folder_cmin is not None and folder_cmax is not None and folder_cmin > folder_cmax:
-            raise ValueError(
-                f"config/CLI mismatch for {folder_name}: cmin ({folder_cmin}) cannot be greater than cmax ({folder_cmax})"
-            )
-        if folder_vdmin is not None and folder_vdmax is not None and folder_vdmin > folder_vdmax:
-            raise ValueError(
-                f"config/CLI mismatch for {folder_name}: vdmin ({folder_vdmin}) cannot be greater than vdmax ({folder_vdmax})"
-            )
+def aggregate_folder_pyramid(
+    folder_path, grid, agg, drop_duplicate_timestamps, drop_consecutive_equal, use_cache, chunk_size, levels
+):
+    """
+    aggregate_folder through a HeatmapPyramid (lib/heatmap_pyramid.py): the
+    folder is streamed and binned once on grid, and levels - 1 coarser levels
+    are derived by merging 2x2 cells. All levels are cached as one entry,
+    keyed without the resolution, so a later run on any of their grids (a
+    --grid-res-lambda of 2**k times the finest) is a lookup. Otherwise the
+    pyramid is rebuilt with grid as its finest level. The median is the
+    sketch estimate, as with --stream.
+    """
+    name = os.path.basename(folder_path)
+    params = {
+        "pyramid": True,
+        "origin": list(grid.origin),
+        "extent": list(grid.extent) if grid.extent is not None else None,
+        "drop_duplicate_timestamps": drop_duplicate_timestamps,
+        "drop_consecutive_equal": drop_consecutive_equal,
+        "small_power_uw": SMALL_POWER_UW,
+        "relative_accuracy": DEFAULT_RELATIVE_ACCURACY,
+    }
+    cache = FolderCache(folder_path) if use_cache else None
+    pyramid = level = None
+    if cache is not None:
+        hit = cache.load(params)
+        if hit is not None:
+            arrays, meta = hit
+            pyramid = HeatmapPyramid.from_state(arrays)
+            level = pyramid.level(grid)
+            if level is not None:
+                stats, summary = meta["stats"], meta["summary"]
+                paths = [
+                    (first_cell, [tuple(cell) for cell in arrays[f"recent_cells{k}"].tolist()])
+                    for k, first_cell in enumerate(meta["first_cells"])
+                ]
+                print(f"{name}: pyramid level {level} of {len(pyramid)} ({stats['start_count']} samples)")
+
+    if level is None:
+        acc, window, stats, summary, paths = _stream_bin(
+            folder_path, grid, drop_duplicate_timestamps, drop_consecutive_equal, chunk_size, levels
+        )
+        pyramid = HeatmapPyramid.build(grid, window, acc, levels)
+        level = 0
+        if cache is not None:
+            arrays = pyramid.state()
+            for k, (_, recent_cells) in enumerate(paths):
+                arrays[f"recent_cells{k}"] = np.array(recent_cells, dtype=np.int64).reshape(-1, 2)
+            meta = {"stats": stats, "summary": summary, "first_cells": [first_cell for first_cell, _ in paths]}
+            try:
+                cache.store(params, arrays, meta)
+            except Exception as exc:
+                print(f"Failed to write cache {cache.path}: {exc}")
+
+    first_cell, recent_cells = paths[level]
+    data = {key: None for key in ("xs", "ys", "vs", "xi", "yi")}
+    data["heatmap"] = pyramid.heatmap(level, agg)
+    data["recent_cells"] = recent_cells
+    data.update(summary)
+    data["first_cell"] = tuple(first_cell) if first_cell is not None else None
+    if data["first_pos"] is not None:
+        data["first_pos"] = tuple(data["first_pos"])  # JSON stores it as a list
+    return data, stats
+
+
+def folder_cell_stats(
+    folder_path,
+    grid,
+    drop_duplicate_timestamps=False,
+    drop_consecutive_equal=False,
+    use_cache=True,
+    chunk_size=None,
+    data=None,
+):
+    """
+    CellStats of a folder's cleaned samples on the canonical grid. Built from the cleaned columns in
+    data when aggregate_folder kept them, otherwise by streaming the folder in
+    chunks of chunk_size (default STREAM_CHUNK_SIZE) samples. Cached in the
+    folder's .heatmap_cache/ like the heatmap itself.
+    """
+    params = {
+        "cell_stats": True,
+        "grid": grid.params(),
+        "drop_duplicate_timestamps": drop_duplicate_timestamps,
+        "drop_consecutive_equal": drop_consecutive_equal,
+        "small_power_uw": SMALL_POWER_UW,
+        "relative_accuracy": DEFAULT_RELATIVE_ACCURACY,
+    }
+    cache = FolderCache(folder_path) if use_cache else None
+    if cache is not None:
+        hit = cache.load(params)
+        if hit is not None:
+            return CellStats.from_state(hit[0])
+
+    stats = CellStats(grid)
+    if data is not None and data["xs"] is not None:
+        stats.add(data["xs"], data["ys"], data["vs"])
+    else:
+        for _, samples, vs in iter_clean_chunks(
+            folder_path,
+            list_snapshots(folder_path),
+            chunk_size or STREAM_CHUNK_SIZE,
+            drop_duplicate_timestamps,
+            drop_consecutive_equal,
+            _new_stream_stats(drop_duplicate_timestamps),
+        ):
+            stats.add(samples["x"], samples["y"], vs)
+    if cache is not None:
+        try:
+            cache.store(params, stats.state(), {})
+        except Exception as exc:
+            print(f"Failed to write cache {cache.path}: {exc}")
+    return stats
 
-        start_count = len(values)
-        drop_ts = drop_dups = drop_small = 0
-        ts_info = None
-        small_report = ""
 
-        if args.drop_duplicate_timestamps:
-            positions, values, drop_ts, ts_info = drop_nonincreasing_timestamps(positions, values)
+def build_baseline(baseline_name, grid, args):
+    """
+    Return the CellStats of a baseline folder, or None if unavailable.
+    "A+B" pools the samples of folders A and B (e.g. repeated runs).
+    """
+    if not baseline_name:
+        return None
+    parts = []
+    for name in baseline_name.split("+"):
+        baseline_path = os.path.join(DATA_DIR, name.strip())
+        if not os.path.isdir(baseline_path):
+            print(f"Baseline folder not found: {baseline_path}")
+            return None
+        try:
+            parts.append(
+                folder_cell_stats(
+                    baseline_path,
+                    grid,
+                    drop_consecutive_equal=args.drop_consecutive_equal,
+                    use_cache=not args.no_cache,
+                    chunk_size=args.stream,
+                )
+            )
+        except Exception as exc:
+            print(f"Failed to build baseline from {baseline_path}: {exc}")
+            return None
+    stats = CellStats.pooled(parts)
+    if not stats.count.any():
+        print(f"Baseline {baseline_name} has no samples left after filtering")
+        return None
+    return stats
 
-        if args.drop_consecutive_equal:
-            positions, values, drop_dups = drop_consecutive_equal_values(positions, values)
 
-        vs = np.array([v.pwr_pw / 1e6 for v in values], dtype=float)  # uW
+def process_folder(folder_name, args, cli_flags, grid, target_vals, baseline):
+    """
+    Aggregate, plot and export one data folder.
 
-        positions, values, vs, drop_small, small_report = filter_small_values(
-            folder_path, positions, values, vs
+    baseline is (name, agg, CellStats) of the shared baseline.
+    Returns (processed, target_vals): processed is False when the folder holds
+    no snapshots; target_vals is seeded from this folder's first position when
+    it was still unset (later folders then zoom around the same spot).
+    """
+    baseline_folder_name, baseline_agg, baseline_stats = baseline
+    renderer = get_headless_renderer() if args.headless else None
+    folder_path = os.path.join(DATA_DIR, folder_name)
+    try:
+        data, stats = aggregate_folder(
+            folder_path,
+            grid,
+            args.agg,
+            drop_duplicate_timestamps=args.drop_duplicate_timestamps,
+            drop_consecutive_equal=args.drop_consecutive_equal,
+            use_cache=not args.no_cache,
+            chunk_size=args.stream,
+            pyramid_levels=args.pyramid,
         )
-        print_drop_summary(
-            os.path.basename(folder_path),
-            start_count,
-            len(values),
-            drop_ts,
-            drop_dups,
-            drop_small,
-            small_report,
-            ts_info,
+    except ValueError as e:
+        print(e)
+        return False, target_vals
+
+    baseline_txt_path = os.path.join(folder_path, "baseline.txt")
+    if os.path.isfile(baseline_txt_path):
+        print(f"Warning: baseline.txt is deprecated and ignored in {folder_path}; use config.yml instead.")
+
+    folder_config = load_folder_config(folder_path)
+    if "bdmin" in folder_config and "vdmin" not in folder_config:
+        folder_config["vdmin"] = folder_config["bdmin"]
+    if "bdmax" in folder_config and "vdmax" not in folder_config:
+        folder_config["vdmax"] = folder_config["bdmax"]
+
+    def apply_config(key, current_val, cli_set):
+        if key not in folder_config or folder_config[key] is None:
+            return current_val
+        if cli_set:
+            print(
+                f"Warning: {key} set in CLI overrides config.yml for {folder_name}; using CLI value ({current_val})."
+            )
+            return current_val
+        return folder_config[key]
+
+    folder_vmin = apply_config("vmin", args.vmin, cli_flags["vmin"])
+    folder_vmax = apply_config("vmax", args.vmax, cli_flags["vmax"])
+    folder_cmin = apply_config("cmin", args.cmin, cli_flags["cmin"])
+    folder_cmax = apply_config("cmax", args.cmax, cli_flags["cmax"])
+    folder_vdmin = apply_config("vdmin", args.vdmin, cli_flags["vdmin"])
+    folder_vdmax = apply_config("vdmax", args.vdmax, cli_flags["vdmax"])
+    baseline_override_name = apply_config("baseline-folder", baseline_folder_name, cli_flags["baseline_folder"])
+    baseline_override_name = baseline_override_name.strip() if isinstance(baseline_override_name, str) else ""
+    folder_target_vals = None
+    if "target_location" in folder_config:
+        folder_target_vals = parse_target_location(
+            folder_config.get("target_location"),
+            os.path.join(folder_path, "config.yml"),
+        )
+
+    if folder_vmin is not None and folder_vmax is not None and folder_vmin > folder_vmax:
+        raise ValueError(
+            f"config/CLI mismatch for {folder_name}: vmin ({folder_vmin}) cannot be greater than vmax ({folder_vmax})"
         )
+    if folder_cmin is not None and folder_cmax is not None and folder_cmin > folder_cmax:
+        raise ValueError(
+            f"config/CLI mismatch for {folder_name}: cmin ({folder_cmin}) cannot be greater than cmax ({folder_cmax})"
+        )
+    if folder_vdmin is not None and folder_vdmax is not None and folder_vdmin > folder_vdmax:
+        raise ValueError(
+            f"config/CLI mismatch for {folder_name}: vdmin ({folder_vdmin}) cannot be greater than vdmax ({folder_vdmax})"
+        )
+
+    print_drop_summary(
+        os.path.basename(folder_path),
+        stats["start_count"],
+        stats["end_count"],
+        stats["drop_ts"],
+        stats["drop_dups"],
+        stats["drop_small"],
+        stats["small_report"],
+        stats["ts_info"],
+    )
 
-        xs = np.array([p.x for p in positions], dtype=float)
-        ys = np.array([p.y for p in positions], dtype=float)
+    first_pos = data["first_pos"]
 
-        active_target_vals = folder_target_vals or target_vals
-        if active_target_vals is None and len(xs) and len(ys):
-            active_target_vals = [float(xs[0]), float(ys[0])]
-            if target_vals is None and folder_target_vals is None:
-                target_vals = active_target_vals
-        active_target_rect = target_rect_from_xyz(active_target_vals) if active_target_vals else None
+    active_target_vals = folder_target_vals or target_vals
+    if active_target_vals is None and first_pos is not None:
+        active_target_vals = [float(first_pos[0]), float(first_pos[1])]
+        if target_vals is None and folder_target_vals is None:
+            target_vals = active_target_vals
+    active_target_rect = target_rect_from_xyz(active_target_vals) if active_target_vals else None
 
-        heatmap, counts, x_edges, y_edges, xi, yi = compute_heatmap(
-            xs, ys, vs, grid_res, agg=args.agg
+    # Sparse until rendering: only the plots below densify (their own window)
+    heatmap = data["heatmap"]
+    if args.fill_empty:
+        heatmap = SparseHeatmap.from_dense(
+            grid, heatmap.window, fill_empty_cells_nearest(heatmap.dense()), heatmap.dense_counts()
         )
-        if args.fill_empty:
-            heatmap = fill_empty_cells_nearest(heatmap)
-
-        heatmap_dbm = heatmap_to_dbm(heatmap)
-        zoomed = None
-        zoom_heatmap_dbm = None
-        if active_target_vals is not None:
-            zoomed = clip_heatmap_to_window(
-                heatmap, counts, x_edges, y_edges, active_target_vals, ZOOM_HALF_SIZE
-            )
-            if zoomed is not None:
-                zoom_heatmap, zoom_counts, zoom_x_edges, zoom_y_edges = zoomed
-                zoom_heatmap_dbm = heatmap_to_dbm(zoom_heatmap)
-        if (
-            args.vmin is not None
-            or args.vmax is not None
-            or "vmin" in folder_config
-            or "vmax" in folder_config
-        ):
-            finite_dbm = heatmap_dbm[np.isfinite(heatmap_dbm)]
-            if finite_dbm.size:
-                dmin, dmax = float(finite_dbm.min()), float(finite_dbm.max())
-                if folder_vmin is not None and dmin < folder_vmin:
-                    print(f"Warning: dBm map min {dmin:.2f} is below vmin {folder_vmin} for {folder_name} (clipping).")
-                if folder_vmax is not None and dmax > folder_vmax:
-                    print(f"Warning: dBm map max {dmax:.2f} is above vmax {folder_vmax} for {folder_name} (clipping).")
 
-        if args.export_csv:
-            export_heatmap_csv(folder_path, heatmap, x_edges, y_edges)
+    heatmap_dbm = heatmap.with_values(heatmap_to_dbm(heatmap.values))
+    zoom_heatmap = zoom_heatmap_dbm = None
+    zoom_window = heatmap.zoom_window(active_target_vals, ZOOM_HALF_SIZE)
+    if zoom_window is not None:
+        zoom_heatmap = heatmap.on_window(zoom_window)
+        zoom_heatmap_dbm = heatmap_dbm.on_window(zoom_window)
+    if (
+        args.vmin is not None
+        or args.vmax is not None
+        or "vmin" in folder_config
+        or "vmax" in folder_config
+    ):
+        finite_dbm = heatmap_dbm.values[np.isfinite(heatmap_dbm.values)]
+        if finite_dbm.size:
+            dmin, dmax = float(finite_dbm.min()), float(finite_dbm.max())
+            if folder_vmin is not None and dmin < folder_vmin:
+                print(f"Warning: dBm map min {dmin:.2f} is below vmin {folder_vmin} for {folder_name} (clipping).")
+            if folder_vmax is not None and dmax > folder_vmax:
+                print(f"Warning: dBm map max {dmax:.2f} is above vmax {folder_vmax} for {folder_name} (clipping).")
+
+    if args.export_csv:
+        export_heatmap_csv(folder_path, heatmap, npz=args.export_npz)
+        export_heatmap_tex(
+            folder_path,
+            heatmap,
+            title=f"{os.path.basename(folder_path)} | {args.agg} power [uW]",
+            target_rect=active_target_rect,
+            vmin=folder_cmin,
+            vmax=folder_cmax,
+        )
+        export_heatmap_csv(folder_path, heatmap_dbm, suffix="dBm", npz=args.export_npz)
+        export_heatmap_tex(
+            folder_path,
+            heatmap_dbm,
+            suffix="dBm",
+            title=f"{os.path.basename(folder_path)} | {args.agg} power [dBm]",
+            target_rect=active_target_rect,
+            vmin=folder_vmin,
+            vmax=folder_vmax,
+        )
+        if zoom_heatmap is not None:
+            export_heatmap_csv(folder_path, zoom_heatmap, suffix="zoom", npz=args.export_npz)
             export_heatmap_tex(
                 folder_path,
-                x_edges,
-                y_edges,
-                heatmap,
-                title=f"{os.path.basename(folder_path)} | {args.agg} power [uW]",
+                zoom_heatmap,
+                suffix="zoom",
+                title=f"{os.path.basename(folder_path)} | {args.agg} power [uW] (zoom)",
                 target_rect=active_target_rect,
                 vmin=folder_cmin,
                 vmax=folder_cmax,
             )
-            export_heatmap_csv(folder_path, heatmap_dbm, x_edges, y_edges, suffix="dBm")
+            export_heatmap_csv(folder_path, zoom_heatmap_dbm, suffix="zoom_dBm", npz=args.export_npz)
             export_heatmap_tex(
                 folder_path,
-                x_edges,
-                y_edges,
-                heatmap_dbm,
-                suffix="dBm",
-                title=f"{os.path.basename(folder_path)} | {args.agg} power [dBm]",
+                zoom_heatmap_dbm,
+                suffix="zoom_dBm",
+                title=f"{os.path.basename(folder_path)} | {args.agg} power [dBm] (zoom)",
                 target_rect=active_target_rect,
                 vmin=folder_vmin,
                 vmax=folder_vmax,
             )
-            if zoomed is not None:
-                export_heatmap_csv(
-                    folder_path, zoom_heatmap, zoom_x_edges, zoom_y_edges, suffix="zoom"
-                )
-                export_heatmap_tex(
-                    folder_path,
-                    zoom_x_edges,
-                    zoom_y_edges,
-                    zoom_heatmap,
-                    suffix="zoom",
-                    title=f"{os.path.basename(folder_path)} | {args.agg} power [uW] (zoom)",
-                    target_rect=active_target_rect,
-                    vmin=folder_cmin,
-                    vmax=folder_cmax,
-                )
-                if zoom_heatmap_dbm is not None:
-                    export_heatmap_csv(
-                        folder_path,
-                        zoom_heatmap_dbm,
-                        zoom_x_edges,
-                        zoom_y_edges,
-                        suffix="zoom_dBm",
-                    )
-                    export_heatmap_tex(
-                        folder_path,
-                        zoom_x_edges,
-                        zoom_y_edges,
-                        zoom_heatmap_dbm,
-                        suffix="zoom_dBm",
-                        title=f"{os.path.basename(folder_path)} | {args.agg} power [dBm] (zoom)",
-                        target_rect=active_target_rect,
-                        vmin=folder_vmin,
-                        vmax=folder_vmax,
-                    )
-
-        # If baseline available, compute aligned heatmap and plot delta
-        if baseline_override_name:
-            if baseline_override_name == baseline_folder_name and baseline_heatmap is not None:
-                curr_baseline_heatmap = baseline_heatmap
-                curr_baseline_x_edges = baseline_x_edges
-                curr_baseline_y_edges = baseline_y_edges
-            else:
-                curr_baseline_heatmap, curr_baseline_x_edges, curr_baseline_y_edges = _build_baseline(
-                    baseline_override_name
-                )
+
+    # If baseline available, line the folder's cell stats up with it and plot the delta
+    if baseline_override_name:
+        if baseline_override_name == baseline_folder_name and baseline_stats is not None:
+            curr_baseline_stats = baseline_stats
         else:
-            curr_baseline_heatmap = curr_baseline_x_edges = curr_baseline_y_edges = None
+            curr_baseline_stats = build_baseline(baseline_override_name, grid, args)
+    else:
+        curr_baseline_stats = None
 
-        if (
-            curr_baseline_heatmap is not None
-            and curr_baseline_x_edges is not None
-            and curr_baseline_y_edges is not None
-        ):
-            aligned_heatmap, _, _, _, _, _ = compute_heatmap(
-                xs,
-                ys,
-                vs,
-                grid_res,
-                agg=baseline_agg,
-                x_edges=curr_baseline_x_edges,
-                y_edges=curr_baseline_y_edges,
+    curr_baseline_heatmap = None
+    if curr_baseline_stats is not None:
+        folder_stats = folder_cell_stats(
+            folder_path,
+            grid,
+            args.drop_duplicate_timestamps,
+            args.drop_consecutive_equal,
+            use_cache=not args.no_cache,
+            chunk_size=args.stream,
+            data=data,
+        )
+        # Both sit on the canonical grid: the delta is taken over the cells they share,
+        # on the baseline's window (or the full extent).
+        delta_window = grid.full_window or curr_baseline_stats.window
+        aligned_heatmap = folder_stats.sparse(baseline_agg).on_window(delta_window)
+        curr_baseline_heatmap = curr_baseline_stats.sparse(baseline_agg).on_window(delta_window)
+        if args.fill_empty:
+            aligned_heatmap = SparseHeatmap.from_dense(
+                grid, delta_window, fill_empty_cells_nearest(aligned_heatmap.dense()), aligned_heatmap.dense_counts()
             )
-            if args.fill_empty:
-                aligned_heatmap = fill_empty_cells_nearest(aligned_heatmap)
-                curr_baseline_heatmap = fill_empty_cells_nearest(curr_baseline_heatmap)
-            diff_map = heatmap_delta_db(aligned_heatmap, curr_baseline_heatmap)
-            if args.vdmin is not None or args.vdmax is not None or "vdmin" in folder_config or "vdmax" in folder_config:
-                finite_diff = diff_map[np.isfinite(diff_map)]
-                if finite_diff.size:
-                    dmin, dmax = float(finite_diff.min()), float(finite_diff.max())
-                    if folder_vdmin is not None and dmin < folder_vdmin:
-                        print(f"Warning: diff map min {dmin:.2f} dB is below vdmin {folder_vdmin} for {folder_name} (clipping).")
-                    if folder_vdmax is not None and dmax > folder_vdmax:
-                        print(f"Warning: diff map max {dmax:.2f} dB is above vdmax {folder_vdmax} for {folder_name} (clipping).")
-            global_gain, target_gain = gain_stats(
-                aligned_heatmap,
-                curr_baseline_heatmap,
-                curr_baseline_x_edges,
-                curr_baseline_y_edges,
-                active_target_rect,
+            curr_baseline_heatmap = SparseHeatmap.from_dense(
+                grid,
+                delta_window,
+                fill_empty_cells_nearest(curr_baseline_heatmap.dense()),
+                curr_baseline_heatmap.dense_counts(),
             )
-            gain_title = None
-            if global_gain:
-                gain_title = f"avg {global_gain['avg_db']:.1f}dB / max {global_gain['max_db']:.1f}dB"
-                print(
-                    f"Gain vs {baseline_override_name}: avg {global_gain['avg_db']:.2f} dB ({global_gain['avg_lin']:.2f}x), "
-                    f"max {global_gain['max_db']:.2f} dB ({global_gain['max_lin']:.2f}x)"
-                )
-            if target_gain:
-                target_str = f"target avg {target_gain['avg_db']:.1f}dB / max {target_gain['max_db']:.1f}dB"
-                gain_title = f"{gain_title} | {target_str}" if gain_title else target_str
-                print(
-                    f"Target gain vs {baseline_override_name}: avg {target_gain['avg_db']:.2f} dB ({target_gain['avg_lin']:.2f}x), "
-                    f"max {target_gain['max_db']:.2f} dB ({target_gain['max_lin']:.2f}x)"
-                )
+        i, j = aligned_heatmap.align(curr_baseline_heatmap)
+        curr_vals = aligned_heatmap.values[i]
+        base_vals = curr_baseline_heatmap.values[j]
+        diff_map = SparseHeatmap(
+            grid,
+            delta_window,
+            curr_baseline_heatmap.xi[j],
+            curr_baseline_heatmap.yi[j],
+            heatmap_delta_db(curr_vals, base_vals),
+            curr_baseline_heatmap.counts[j],
+        )
+        if args.vdmin is not None or args.vdmax is not None or "vdmin" in folder_config or "vdmax" in folder_config:
+            finite_diff = diff_map.values[np.isfinite(diff_map.values)]
+            if finite_diff.size:
+                dmin, dmax = float(finite_diff.min()), float(finite_diff.max())
+                if folder_vdmin is not None and dmin < folder_vdmin:
+                    print(f"Warning: diff map min {dmin:.2f} dB is below vdmin {folder_vdmin} for {folder_name} (clipping).")
+                if folder_vdmax is not None and dmax > folder_vdmax:
+                    print(f"Warning: diff map max {dmax:.2f} dB is above vdmax {folder_vdmax} for {folder_name} (clipping).")
+        diff_x_centers, diff_y_centers = diff_map.centers()
+        global_gain, target_gain = gain_stats(
+            curr_vals,
+            base_vals,
+            diff_x_centers,
+            diff_y_centers,
+            active_target_rect,
+        )
+        gain_title = None
+        if global_gain:
+            gain_title = f"avg {global_gain['avg_db']:.1f}dB / max {global_gain['max_db']:.1f}dB"
+            print(
+                f"Gain vs {baseline_override_name}: avg {global_gain['avg_db']:.2f} dB ({global_gain['avg_lin']:.2f}x), "
+                f"max {global_gain['max_db']:.2f} dB ({global_gain['max_lin']:.2f}x)"
+            )
+        if target_gain:
+            target_str = f"target avg {target_gain['avg_db']:.1f}dB / max {target_gain['max_db']:.1f}dB"
+            gain_title = f"{gain_title} | {target_str}" if gain_title else target_str
+            print(
+                f"Target gain vs {baseline_override_name}: avg {target_gain['avg_db']:.2f} dB ({target_gain['avg_lin']:.2f}x), "
+                f"max {target_gain['max_db']:.2f} dB ({target_gain['max_lin']:.2f}x)"
+            )
+        diff_x_edges, diff_y_edges = diff_map.edges()
+        plot_diff_heatmap(
+            folder_path,
+            baseline_override_name,
+            diff_map.dense(),
+            diff_x_edges,
+            diff_y_edges,
+            vdmin=folder_vdmin,
+            vdmax=folder_vdmax,
+            target_rect=active_target_rect,
+            show=not args.save_only,
+            renderer=renderer,
+            save_bitmap=args.export_csv,
+            bitmap_scale=args.bitmap_scale,
+            png_name=f"heatmap_vs_{baseline_override_name}_dB.png",
+            bitmap_name=f"heatmap_vs_{baseline_override_name}_dB_bitmap.png",
+            title_override=gain_title,
+        )
+        if args.export_csv:
+            suffix = f"vs_{baseline_override_name}_dB"
+            export_heatmap_csv(folder_path, diff_map, suffix=suffix, npz=args.export_npz)
+            export_heatmap_tex(
+                folder_path,
+                diff_map,
+                suffix=suffix,
+                title=f"{os.path.basename(folder_path)} - {baseline_override_name} [dB]{' | ' + gain_title if gain_title else ''}",
+                target_rect=active_target_rect,
+            )
+        zoom_diff_window = diff_map.zoom_window(active_target_vals, ZOOM_HALF_SIZE) if target_vals is not None else None
+        if zoom_diff_window is not None:
+            zoom_diff = diff_map.on_window(zoom_diff_window)
+            zoom_x_edges, zoom_y_edges = zoom_diff.edges()
             plot_diff_heatmap(
                 folder_path,
                 baseline_override_name,
-                diff_map,
-                curr_baseline_x_edges,
-                curr_baseline_y_edges,
+                zoom_diff.dense(),
+                zoom_x_edges,
+                zoom_y_edges,
                 vdmin=folder_vdmin,
                 vdmax=folder_vdmax,
                 target_rect=active_target_rect,
                 show=not args.save_only,
+                renderer=renderer,
                 save_bitmap=args.export_csv,
-                png_name=f"heatmap_vs_{baseline_override_name}_dB.png",
-                bitmap_name=f"heatmap_vs_{baseline_override_name}_dB_bitmap.png",
+                bitmap_scale=args.bitmap_scale,
+                png_name=f"heatmap_zoom_vs_{baseline_override_name}_dB.png",
+                bitmap_name=f"heatmap_zoom_vs_{baseline_override_name}_dB_bitmap.png",
                 title_override=gain_title,
             )
             if args.export_csv:
-                suffix = f"vs_{baseline_override_name}_dB"
-                export_heatmap_csv(
-                    folder_path, diff_map, curr_baseline_x_edges, curr_baseline_y_edges, suffix=suffix
-                )
+                zoom_suffix = f"zoom_vs_{baseline_override_name}_dB"
+                export_heatmap_csv(folder_path, zoom_diff, suffix=zoom_suffix, npz=args.export_npz)
                 export_heatmap_tex(
                     folder_path,
-                    curr_baseline_x_edges,
-                    curr_baseline_y_edges,
-                    diff_map,
-                    suffix=suffix,
-                    title=f"{os.path.basename(folder_path)} - {baseline_override_name} [dB]{' | ' + gain_title if gain_title else ''}",
+                    zoom_diff,
+                    suffix=zoom_suffix,
+                    title=f"{os.path.basename(folder_path)} - {baseline_override_name} [dB] (zoom){' | ' + gain_title if gain_title else ''}",
                     target_rect=active_target_rect,
                 )
-            if target_vals is not None:
-                zoomed_diff = clip_heatmap_to_window(
-                    diff_map,
-                    None,
-                    curr_baseline_x_edges,
-                    curr_baseline_y_edges,
-                    active_target_vals,
-                    ZOOM_HALF_SIZE,
-                )
-                if zoomed_diff is not None:
-                    zoom_diff, _, zoom_x_edges, zoom_y_edges = zoomed_diff
-                    plot_diff_heatmap(
-                        folder_path,
-                        baseline_override_name,
-                        zoom_diff,
-                        zoom_x_edges,
-                        zoom_y_edges,
-                        vdmin=folder_vdmin,
-                        vdmax=folder_vdmax,
-                        target_rect=active_target_rect,
-                        show=not args.save_only,
-                        save_bitmap=args.export_csv,
-                        png_name=f"heatmap_zoom_vs_{baseline_override_name}_dB.png",
-                        bitmap_name=f"heatmap_zoom_vs_{baseline_override_name}_dB_bitmap.png",
-                        title_override=gain_title,
-                    )
-                    if args.export_csv:
-                        zoom_suffix = f"zoom_vs_{baseline_override_name}_dB"
-                        export_heatmap_csv(
-                            folder_path, zoom_diff, zoom_x_edges, zoom_y_edges, suffix=zoom_suffix
-                        )
-                        export_heatmap_tex(
-                            folder_path,
-                            zoom_x_edges,
-                            zoom_y_edges,
-                            zoom_diff,
-                            suffix=zoom_suffix,
-                            title=f"{os.path.basename(folder_path)} - {baseline_override_name} [dB] (zoom){' | ' + gain_title if gain_title else ''}",
-                            target_rect=active_target_rect,
-                        )
-
-        recent_cells = None
-        if args.plot_movement:
-            # Take the last 5 distinct cells (most recent first), not just the last 5 samples.
-            recent_cells = []
-            seen = set()
-            for cell in reversed(list(zip(xi, yi))):
-                if cell in seen:
-                    continue
-                seen.add(cell)
-                recent_cells.append(cell)
-                if len(recent_cells) == 5:
-                    break
-            recent_cells.reverse()
-        first_cell = (int(xi[0]), int(yi[0])) if len(xi) else None
-        first_pos = (float(xs[0]), float(ys[0])) if len(xs) else None
-        write_folder_log(
-            folder_path,
-            heatmap,
-            counts,
-            x_edges,
-            y_edges,
-            active_target_vals,
-            args.agg,
-            bd_power_pw=bd_power,
-            first_cell=first_cell,
-            first_pos=first_pos,
-            baseline_heatmap=curr_baseline_heatmap,
-            baseline_x_edges=curr_baseline_x_edges,
-            baseline_y_edges=curr_baseline_y_edges,
-            baseline_name=baseline_override_name,
-        )
+
+    # The last 5 distinct cells, not just the last 5 samples.
+    recent_cells = data["recent_cells"] if args.plot_movement else None
+    write_folder_log(
+        folder_path,
+        heatmap,
+        active_target_vals,
+        args.agg,
+        bd_stats=data["bd_stats"],
+        first_cell=data["first_cell"],
+        first_pos=first_pos,
+        baseline_heatmap=curr_baseline_heatmap,
+        baseline_name=baseline_override_name,
+    )
+    x_edges, y_edges = heatmap.edges()
+    plot_heatmap(
+        folder_path,
+        heatmap.dense(),
+        heatmap.dense_counts(),
+        x_edges,
+        y_edges,
+        recent_cells,
+        active_target_rect,
+        agg=args.agg,
+        cmin=folder_cmin,
+        cmax=folder_cmax,
+        vmin=folder_vmin,
+        vmax=folder_vmax,
+        show=not args.save_only,
+        renderer=renderer,
+        save_bitmap=args.export_csv,
+        bitmap_scale=args.bitmap_scale,
+        png_name="heatmap.png",
+        bitmap_name="heatmap_bitmap.png",
+    )
+    if zoom_heatmap is not None:
+        zoom_x_edges, zoom_y_edges = zoom_heatmap.edges()
         plot_heatmap(
             folder_path,
-            heatmap,
-            counts,
-            x_edges,
-            y_edges,
-            recent_cells,
-            active_target_rect,
+            zoom_heatmap.dense(),
+            zoom_heatmap.dense_counts(),
+            zoom_x_edges,
+            zoom_y_edges,
+            recent_cells=None,
+            target_rect=active_target_rect,
             agg=args.agg,
             cmin=folder_cmin,
             cmax=folder_cmax,
             vmin=folder_vmin,
             vmax=folder_vmax,
             show=not args.save_only,
+            renderer=renderer,
             save_bitmap=args.export_csv,
-            png_name="heatmap.png",
-            bitmap_name="heatmap_bitmap.png",
+            bitmap_scale=args.bitmap_scale,
+            png_name="heatmap_zoom.png",
+            bitmap_name="heatmap_zoom_bitmap.png",
         )
-        if zoomed is not None:
-            zoom_heatmap, zoom_counts, zoom_x_edges, zoom_y_edges = zoomed
-            plot_heatmap(
-                folder_path,
-                zoom_heatmap,
-                zoom_counts,
-                zoom_x_edges,
-                zoom_y_edges,
-                recent_cells=None,
-                target_rect=active_target_rect,
-                agg=args.agg,
-                cmin=folder_cmin,
-                cmax=folder_cmax,
-                vmin=folder_vmin,
-                vmax=folder_vmax,
-                show=not args.save_only,
-                save_bitmap=args.export_csv,
-                png_name="heatmap_zoom.png",
-                bitmap_name="heatmap_zoom_bitmap.png",
-            )
-        if not args.plot_all:
+    return True, target_vals
+
+
+def seed_target_location(folder_names, args, grid):
+    """
+    Target the sequential loop would seed for folders without their own
+    target_location: the first position of the first such folder with data.
+    Used before fanning folders out to worker processes; the folder is
+    aggregated exactly as its worker will (same mode and cache entry).
+    """
+    for folder_name in folder_names:
+        folder_path = os.path.join(DATA_DIR, folder_name)
+        with contextlib.redirect_stdout(io.StringIO()):
+            folder_config = load_folder_config(folder_path)
+            if "target_location" in folder_config and parse_target_location(
+                folder_config.get("target_location"),
+                os.path.join(folder_path, "config.yml"),
+            ):
+                continue
+            try:
+                data, _ = aggregate_folder(
+                    folder_path,
+                    grid,
+                    args.agg,
+                    drop_duplicate_timestamps=args.drop_duplicate_timestamps,
+                    drop_consecutive_equal=args.drop_consecutive_equal,
+                    use_cache=not args.no_cache,
+                    chunk_size=args.stream,
+                    pyramid_levels=args.pyramid,
+                )
+            except ValueError:
+                continue
+        if data["first_pos"] is not None:
+            return [float(data["first_pos"][0]), float(data["first_pos"][1])]
+    return None
+
+
+def _init_worker():
+    plt.switch_backend("Agg")
+
+
+def _process_folder_job(folder_name, args, cli_flags, grid, target_vals, baseline):
+    """Worker: run process_folder and return its console output (plus any exception)."""
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        try:
+            process_folder(folder_name, args, cli_flags, grid, target_vals, baseline)
+        except Exception as exc:
+            return out.getvalue(), exc
+    return out.getvalue(), None
+
+
+def process_folders_parallel(folder_names, args, cli_flags, grid, target_vals, baseline):
+    """
+    Process folders in args.jobs worker processes. The baseline is built once
+    by the caller and shipped to every worker; each folder's output is printed
+    as one block, in folder_names (newest-first) order.
+    """
+    if target_vals is None:
+        target_vals = seed_target_location(folder_names, args, grid)
+    pool = ProcessPoolExecutor(max_workers=args.jobs, initializer=_init_worker)
+    try:
+        futures = [
+            pool.submit(_process_folder_job, name, args, cli_flags, grid, target_vals, baseline)
+            for name in folder_names
+        ]
+        for future in futures:
+            text, exc = future.result()
+            print(text, end="", flush=True)
+            if exc is not None:
+                raise exc
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+
+def main():
+    args = parse_args()
+    if args.vmin is not None and args.vmax is not None and args.vmin > args.vmax:
+        raise ValueError(f"--vmin ({args.vmin}) cannot be greater than --vmax ({args.vmax})")
+    if args.cmin is not None and args.cmax is not None and args.cmin > args.cmax:
+        raise ValueError(f"--cmin ({args.cmin}) cannot be greater than --cmax ({args.cmax})")
+    if args.vdmin is not None and args.vdmax is not None and args.vdmin > args.vdmax:
+        raise ValueError(f"--vdmin ({args.vdmin}) cannot be greater than --vdmax ({args.vdmax})")
+    if not os.path.isdir(DATA_DIR):
+        raise FileNotFoundError(f"DATA_DIR not found: {DATA_DIR}")
+    if args.jobs < 1:
+        raise ValueError(f"--jobs must be at least 1 (got {args.jobs})")
+    if args.stream is not None and args.stream < 1:
+        raise ValueError(f"--stream chunk size must be at least 1 (got {args.stream})")
+    if args.pyramid is not None and args.pyramid < 1:
+        raise ValueError(f"--pyramid needs at least 1 level (got {args.pyramid})")
+    if args.bitmap_scale < 1:
+        raise ValueError(f"--bitmap-scale must be at least 1 (got {args.bitmap_scale})")
+    if args.headless:
+        args.save_only = True
+    if args.jobs > 1 and args.plot_all and not args.save_only:
+        print("Note: --jobs > 1 renders in worker processes; plots are saved, not shown.")
+        args.save_only = True
+
+    cli_flags = {
+        "baseline_folder": args.baseline_folder is not None,
+        "vmin": args.vmin is not None,
+        "vmax": args.vmax is not None,
+        "cmin": args.cmin is not None,
+        "cmax": args.cmax is not None,
+        "vdmin": args.vdmin is not None,
+        "vdmax": args.vdmax is not None,
+    }
+
+    grid = load_grid_from_settings(resolution_lambda=args.grid_res_lambda or None)
+
+    target_vals = load_target_from_settings()
+    target_rect = target_rect_from_xyz(target_vals) if target_vals else None
+
+    # Sort subfolders by modification time (newest first) to view recent runs first
+    folder_entries = []
+    for name in os.listdir(DATA_DIR):
+        folder_path = os.path.join(DATA_DIR, name)
+        if os.path.isdir(folder_path):
+            folder_entries.append((os.path.getmtime(folder_path), name))
+
+    if not folder_entries:
+        raise ValueError(f"No subfolders found in {DATA_DIR}")
+
+    # Precompute default baseline cell stats if requested
+    baseline_stats = None
+    baseline_agg = "mean"
+    baseline_folder_name = args.baseline_folder if cli_flags["baseline_folder"] else DEFAULT_BASELINE_FOLDER
+    baseline_folder_name = baseline_folder_name.strip() if isinstance(baseline_folder_name, str) else ""
+
+    if baseline_folder_name:
+        baseline_stats = build_baseline(baseline_folder_name, grid, args)
+        if baseline_stats is None:
+            baseline_folder_name = ""
+
+    print_run_summary(args, target_rect, baseline_folder_name, baseline_agg, grid)
+
+    baseline = (baseline_folder_name, baseline_agg, baseline_stats)
+    folder_entries.sort(key=lambda x: x[0], reverse=True)
+    folder_names = [name for _, name in folder_entries]
+
+    if args.jobs > 1 and args.plot_all:
+        process_folders_parallel(folder_names, args, cli_flags, grid, target_vals, baseline)
+        return
+
+    for folder_name in folder_names:
+        processed, target_vals = process_folder(folder_name, args, cli_flags, grid, target_vals, baseline)
+        if processed and not args.plot_all:
             break
 
 
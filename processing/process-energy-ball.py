@@ -32,6 +32,8 @@ PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 if PROJECT_ROOT not in sys.path:
     sys.path.insert(0, PROJECT_ROOT)
 
+from lib.snapshot import load_folder_samples
+
 
 def find_latest_exp(path_glob: str) -> str | None:
     files = glob.glob(path_glob, recursive=True)
@@ -113,26 +115,12 @@ def build_dataset(iterations: list[dict]) -> xr.Dataset:
 
 
 def load_position_value_pairs(folder_path: str):
-    """Load concatenated *_positions.npy and *_values.npy pairs from a folder."""
-    positions_parts = []
-    values_parts = []
-    for name in sorted(os.listdir(folder_path)):
-        if not name.endswith("_positions.npy"):
-            continue
-        base = name[: -len("_positions.npy")]
-        pos_path = os.path.join(folder_path, name)
-        val_path = os.path.join(folder_path, f"{base}_values.npy")
-        if not os.path.exists(val_path):
-            continue
-        positions_parts.append(np.load(pos_path, allow_pickle=True))
-        values_parts.append(np.load(val_path, allow_pickle=True))
-
-    if not positions_parts:
-        return None, None
-
-    positions = np.concatenate(positions_parts)
-    values = np.concatenate(values_parts)
-    return positions, values
+    """Load all snapshots in a folder as one typed samples array (None if there are none)."""
+    try:
+        samples, _ = load_folder_samples(folder_path)
+    except ValueError:
+        return None
+    return samples
 
 
 def compute_heatmap(xs, ys, vs, grid_res):
@@ -408,15 +396,15 @@ def main():
         # Position/value heatmap for the folder containing the input file.
         folder_for_positions = os.path.abspath(os.path.dirname(input_path))
         try:
-            positions, values = load_position_value_pairs(folder_for_positions)
+            samples = load_position_value_pairs(folder_for_positions)
         except Exception as exc:
             print(f"Skipping position heatmap due to error: {exc}", file=sys.stderr)
-            positions = values = None
+            samples = None
 
-        if positions is not None and values is not None:
-            xs = np.array([p.x for p in positions], dtype=float)
-            ys = np.array([p.y for p in positions], dtype=float)
-            vs = np.array([v.pwr_pw / 1e6 for v in values], dtype=float)  # uW
+        if samples is not None:
+            xs = samples["x"]
+            ys = samples["y"]
+            vs = samples["pwr_pw"] / 1e6  # uW
 
             heatmap, counts, x_edges, y_edges, xi, yi = compute_heatmap(xs, ys, vs, GRID_RES)
             print(
@@ -430,7 +418,7 @@ def main():
                 os.path.basename(folder_for_positions), heatmap, counts, x_edges, y_edges, target_rect
             )
         else:
-            print(f"No *_positions.npy/_values.npy pairs found in {folder_for_positions}", file=sys.stderr)
+            print(f"No snapshots (*_samples.npy or *_positions.npy/_values.npy) found in {folder_for_positions}", file=sys.stderr)
 
         # Save plots to disk before showing them.
         save_dir = args.save_dir or os.path.abspath(os.path.dirname(input_path))
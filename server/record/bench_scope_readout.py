@@ -0,0 +1,60 @@
+"""
+Round-trip latency of Scope.read_measurements: one query per measurement
+versus one batched ';'-joined query.
+
+    python bench_scope_readout.py                       # fake resource, 2 ms per round trip
+    python bench_scope_readout.py --latency 0.005 -n 500
+    python bench_scope_readout.py --ip 192.108.1.219    # real scope
+"""
+
+import argparse
+from time import perf_counter
+
+from fake_scope import FakeScopeResource
+from scope import Scope
+
+
+def time_readout(scope, n):
+    t = []
+    for _ in range(n):
+        t0 = perf_counter()
+        scope.read_measurements()
+        t.append(perf_counter() - t0)
+    t.sort()
+    return sum(t) / n, t[n // 2], t[min(n - 1, int(n * 0.99))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--ip", help="Benchmark a real scope instead of the fake resource.")
+    parser.add_argument("--latency", type=float, default=0.002, help="Fake round-trip latency in s.")
+    parser.add_argument("-n", type=int, default=200, help="Readouts per mode.")
+    args = parser.parse_args()
+
+    if args.ip:
+        scope = Scope(ip=args.ip)
+    else:
+        scope = Scope(ip="fake", resource=FakeScopeResource(latency=args.latency, seed=0))
+    if scope.check_status():
+        scope._init_scope()
+
+    # Both modes must return the same measurements.
+    scope.batched = False
+    keys_single = list(scope.read_measurements())
+    scope.batched = True
+    keys_batched = list(scope.read_measurements())
+    assert keys_single == keys_batched, (keys_single, keys_batched)
+
+    results = {}
+    for batched in (False, True):
+        scope.batched = batched
+        results[batched] = time_readout(scope, args.n)
+        mean, p50, p99 = results[batched]
+        name = "batched" if batched else "per-measurement"
+        print(f"{name:<16s} mean {mean * 1e3:7.2f} ms  p50 {p50 * 1e3:7.2f} ms  p99 {p99 * 1e3:7.2f} ms")
+    print(f"speedup {results[False][0] / results[True][0]:.1f}x ({len(scope.meas_list)} measurements)")
+    scope.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+In-memory stand-in for the scope's pyvisa resource, for running scope.py and
+the readout benchmark without hardware.
+
+    from fake_scope import FakeScopeResource
+    scope = Scope(ip="fake", resource=FakeScopeResource(latency=0.002))
+
+Every write()/query() sleeps `latency` seconds to model one VISA round trip.
+Queries may be chained with ';' (leading ':' restarts at the root) and are
+answered with one ';'-joined reply, like the instrument does.
+"""
+
+import random
+import time
+
+
+class FakeScopeResource:
+    def __init__(self, latency=0.002, num_meas=3, header=False, seed=None):
+        self.latency = latency
+        self.header = header
+        self.meas_list = [f"MEAS{i + 1}" for i in range(num_meas)]
+        self.round_trips = 0
+        self._rng = random.Random(seed)
+
+    def _round_trip(self):
+        self.round_trips += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def write(self, command):
+        self._round_trip()
+        for cmd in command.split(";"):
+            cmd = cmd.strip().lstrip(":").upper()
+            if cmd == "*RST":
+                self.meas_list = []
+            elif cmd.startswith("MEASUREMENT:ADDMEAS"):
+                self.meas_list.append(f"MEAS{len(self.meas_list) + 1}")
+
+    def query(self, command):
+        self._round_trip()
+        replies = [self._answer(cmd.strip().lstrip(":")) for cmd in command.split(";")]
+        return ";".join(replies) + "\n"
+
+    def _answer(self, cmd):
+        upper = cmd.upper()
+        if upper == "MEASUREMENT:LIST?":
+            return ",".join(self.meas_list)
+        if upper.endswith(":RESULTS:CURRENT:MEAN?"):
+            meas = upper.split(":")[1]
+            if meas not in self.meas_list:
+                raise ValueError(f"unknown measurement {meas}")
+            value = f"{self._rng.uniform(-180.0, 180.0):.6E}"
+            return f":{cmd[:-1].upper()} {value}" if self.header else value
+        raise ValueError(f"FakeScopeResource does not understand {cmd!r}")
+
+    def close(self):
+        pass
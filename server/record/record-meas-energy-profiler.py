@@ -3,7 +3,7 @@
 # ****************************************************************************************** #
 
 import argparse
-from time import sleep, time
+from time import time
 from typing import Optional
 
 from Positioner import PositionerClient
@@ -13,7 +13,6 @@ import os
 import signal
 import sys
 
-import numpy as np
 import zmq
 
 # ****************************************************************************************** #
@@ -21,6 +20,7 @@ import zmq
 # ****************************************************************************************** #
 
 SAVE_EVERY = 60.0  # seconds
+PROGRESS_INTERVAL = 0.1  # seconds between "." progress marks while no sample arrives
 FOLDER = (
     "RANDOM-ABS-REFL-0"  # subfolder inside data/where to save measurement data
 )
@@ -38,7 +38,11 @@ project_dir = os.path.dirname(server_dir)
 # -------------------------------------------------
 PROJECT_ROOT = os.path.dirname(project_dir)
 sys.path.insert(0, PROJECT_ROOT)
+from lib.acquisition import AcquisitionScheduler
 from lib.ep import RFEP
+from lib.fusion import StreamFusion
+from lib.live_heatmap import LiveHeatmap, LiveHeatmapPublisher, format_coverage
+from lib.snapshot import SAMPLE_LOG_SUFFIX, SampleLog, list_snapshots, load_snapshot, sample_row
 from lib.yaml_utils import read_yaml_file
 
 # -------------------------------------------------
@@ -66,7 +70,7 @@ parser.add_argument(
 parser.add_argument(
     "--load-existing",
     action="store_true",
-    help="Load latest *_positions.npy and *_values.npy from the save folder and plot them.",
+    help="Load existing snapshots from the save folder and plot them.",
 )
 args = parser.parse_args()
 
@@ -87,56 +91,42 @@ def _parse_duration(value: Optional[str]) -> Optional[float]:
 max_duration = _parse_duration(args.duration) or DEFAULT_DURATION
 positioner = PositionerClient(config=settings["positioning"], backend="zmq")
 rfep = RFEP(settings["ep"]["ip"], settings["ep"]["port"])
+scheduler = AcquisitionScheduler.from_settings(settings.get("acquisition"))
+fusion = StreamFusion.from_settings(settings.get("fusion"))
 
 context = zmq.Context()
 iq_socket = context.socket(zmq.PUB)
 iq_socket.bind("tcp://*:50001")
 
+# Live heatmap on the canonical grid (live_heatmap: in the settings; None when disabled)
+live_heatmap = LiveHeatmap.from_settings(settings, os.path.dirname(save_dir))
+live_publisher = (
+    LiveHeatmapPublisher.from_settings(live_heatmap, settings.get("live_heatmap"), save_dir, context)
+    if live_heatmap is not None
+    else None
+)
+
 plt = TechtilePlotter(realtime=True)
 
-positions = []
-values = []
+samples = []  # SAMPLE_DTYPE record tuples not yet written to the sample log
+sample_log = None  # opened in MAIN, after existing snapshots were listed
 last_save = 0
 stop_requested = False
 
 
 def save_data():
-    """Safely save measurement data to disk."""
-    print("Saving data...")
-    positions_snapshot = list(positions)
-    values_snapshot = list(values)
-
-    if len(positions_snapshot) != len(values_snapshot):
-        print(
-            "Warning: positions and values length mismatch:",
-            len(positions_snapshot),
-            len(values_snapshot),
-        )
-
-    positions_path = os.path.join(save_dir, f"{TIMESTAMP}_positions.npy")
-    values_path = os.path.join(save_dir, f"{TIMESTAMP}_values.npy")
-
-    _atomic_save_npy(positions_path, positions_snapshot)
-    _atomic_save_npy(values_path, values_snapshot)
-    print("Data saved.")
-
-
-def _atomic_save_npy(final_path, data):
-    """Write to a temp file, fsync, then replace to avoid partial writes."""
-    tmp_path = f"{final_path}.tmp"
+    """Append the samples recorded since the last save to the sample log (fsynced)."""
+    batch = samples[:]
+    if not batch or sample_log is None:
+        return
+    del samples[: len(batch)]
+    print(f"Saving {len(batch)} samples...")
     try:
-        with open(tmp_path, "wb") as f:
-            np.save(f, data)
-            f.flush()
-            os.fsync(f.fileno())
-        os.replace(tmp_path, final_path)
+        sample_log.append(batch)
     except Exception:
-        try:
-            if os.path.exists(tmp_path):
-                os.remove(tmp_path)
-        except Exception:
-            pass
+        samples[:0] = batch  # keep them for the next attempt
         raise
+    print("Data saved.")
 
 
 def _handle_signal(signum, frame):
@@ -155,56 +145,25 @@ atexit.register(_save_data_safe)
 signal.signal(signal.SIGTERM, _handle_signal)
 
 
-def _load_all_snapshots(folder_path):
-    positions_files = sorted(
-        [f for f in os.listdir(folder_path) if f.endswith("_positions.npy")]
-    )
-    values_files = sorted(
-        [f for f in os.listdir(folder_path) if f.endswith("_values.npy")]
-    )
-    if not positions_files or not values_files:
-        return []
-    pos_map = {
-        name[: -len("_positions.npy")]: os.path.join(folder_path, name)
-        for name in positions_files
-    }
-    val_map = {
-        name[: -len("_values.npy")]: os.path.join(folder_path, name)
-        for name in values_files
-    }
-    bases = sorted(set(pos_map) & set(val_map))
-    return [(pos_map[b], val_map[b]) for b in bases]
-
-
 def _load_existing_data():
-    pairs = _load_all_snapshots(save_dir)
-    if not pairs:
-        print("No existing position/value snapshots found to load.")
+    """Plot samples already stored in the save folder (they stay in their own files)."""
+    snapshots = list_snapshots(save_dir)
+    if not snapshots:
+        print("No existing snapshots found to load.")
         return
     total = 0
-    for pos_path, val_path in pairs:
+    for base, kind in snapshots:
         try:
-            existing_positions = np.load(pos_path, allow_pickle=True).tolist()
-            existing_values = np.load(val_path, allow_pickle=True).tolist()
+            existing = load_snapshot(save_dir, base, kind)
         except Exception as exc:
-            print(f"Failed to load existing snapshots {pos_path}, {val_path}: {exc}")
+            print(f"Failed to load existing snapshot {base} in {save_dir}: {exc}")
             continue
-        if len(existing_positions) != len(existing_values):
-            print(
-                "Warning: existing positions and values length mismatch:",
-                len(existing_positions),
-                len(existing_values),
-            )
-        positions.extend(existing_positions)
-        values.extend(existing_values)
-        for pos, d in zip(existing_positions, existing_values):
-            plt.measurements_rt(
-                pos.x,
-                pos.y,
-                pos.z,
-                d.pwr_pw / 1e6
-            )
-        total += len(existing_positions)
+        pwr_uw = existing["pwr_pw"] / 1e6
+        for x, y, z, p in zip(existing["x"], existing["y"], existing["z"], pwr_uw):
+            plt.measurements_rt(x, y, z, p)
+            if live_heatmap is not None:
+                live_heatmap.add(x, y, p)
+        total += len(existing)
     print(f"Loaded {total} existing samples from {save_dir}.")
 
 
@@ -217,35 +176,58 @@ try:
     positioner.start()
     if args.load_existing:
         _load_existing_data()
+    sample_log = SampleLog(os.path.join(save_dir, f"{TIMESTAMP}{SAMPLE_LOG_SUFFIX}"))
 
     start_time = time()
+    scheduler.start()
+    misses = 0
+    last_misses = 0
+    last_progress = 0
 
     while True:
-        d = rfep.get_data()
+        # Positioner first; in event mode a new rfep reading is what wakes the loop
         pos = positioner.get_data()
 
-        # print(d, pos)
+        if fusion is not None:
+            # Both streams are polled independently and aligned on arrival time
+            # get_data() returns the last position until the positioner moves: only a
+            # new position or a new power reading counts as a sample for the scheduler
+            d = rfep.get_data()
+            new_pos = pos is not None and not fusion.is_repeated_position(pos)
+            rows = fusion.add_position(pos) if new_pos else []
+            if d is not None:
+                rows += fusion.add_power(d.pwr_pw)
+            got_sample = new_pos or d is not None
+        else:
+            d = rfep.get_data() if pos is not None else None
+            got_sample = d is not None and pos is not None
+            rows = [sample_row(pos, d.pwr_pw)] if got_sample else []
 
-        if d is not None and pos is not None:
-            positions.append(pos)
-            values.append(d)
+        # print(d, pos)
 
-            plt.measurements_rt(
-                pos.x,
-                pos.y,
-                pos.z,
-                d.pwr_pw / 1e6  # µW
-            )
+        if rows:
+            samples.extend(rows)
+            for x, y, z, _, pwr_pw, _ in rows:
+                plt.measurements_rt(x, y, z, pwr_pw / 1e6)  # µW
+                if live_heatmap is not None:
+                    live_heatmap.add(x, y, pwr_pw / 1e6)
             print("x", end="", flush=True)
         else:
+            misses += 1
+        # One "." per interval with misses, not one per poll (event mode polls every few ms)
+        if misses != last_misses and time() - last_progress >= PROGRESS_INTERVAL:
             print(".", end="", flush=True)
+            last_misses = misses
+            last_progress = time()
+        if live_publisher is not None and live_publisher.maybe_publish():
+            print(f"\nCoverage: {format_coverage(live_publisher.last_summary)}")
 
         # Periodic autosave
         if time() - last_save >= SAVE_EVERY:
             _save_data_safe()
             last_save = time()
 
-        sleep(0.1)
+        scheduler.wait(got_sample)
         if max_duration is not None and time() - start_time >= max_duration:
             print(f"Reached configured duration ({max_duration:.0f} s). Stopping.")
             break
@@ -265,8 +247,15 @@ finally:
     #                                           CLEANUP                                          #
     # ****************************************************************************************** #
     print("Cleaning up...")
+    scheduler.stop()
+    print(f"Acquisition rate: {scheduler.report()}")
+    if fusion is not None:
+        samples.extend(fusion.flush())
+        print(f"Fusion: {fusion.report()}")
 
     _save_data_safe()
+    if sample_log is not None:
+        sample_log.close()
 
     try:
         positioner.stop()
@@ -278,6 +267,13 @@ finally:
     except Exception:
         pass
 
+    if live_publisher is not None:
+        try:
+            live_publisher.publish()
+        except Exception as e:
+            print("Failed to publish the live heatmap on exit:", e)
+        live_publisher.close()
+
     iq_socket.close()
     context.term()
 
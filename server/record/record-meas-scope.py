@@ -3,7 +3,7 @@
 # ****************************************************************************************** #
 
 import argparse
-from time import sleep, time
+from time import time
 from typing import Optional
 
 from Positioner import PositionerClient
@@ -14,13 +14,14 @@ import os
 import signal
 import sys
 
-import numpy as np
 
 # ****************************************************************************************** #
 #                                           CONFIG                                           #
 # ****************************************************************************************** #
 
 SAVE_EVERY = 60.0  # seconds
+RING_CAPACITY = 4096  # samples buffered per consumer before the oldest are dropped
+PLOT_INTERVAL = 0.1  # seconds the plotter waits for new samples before re-checking stop conditions
 FOLDER = (
     "AZF-1"  # subfolder inside data/where to save measurement data
 )
@@ -38,6 +39,23 @@ project_dir = os.path.dirname(server_dir)
 # -------------------------------------------------
 PROJECT_ROOT = os.path.dirname(project_dir)
 sys.path.insert(0, PROJECT_ROOT)
+from lib.acquisition import (
+    AcquisitionScheduler,
+    AcquisitionThread,
+    ConsumerThread,
+    SampleRing,
+    format_pipeline_stats,
+)
+from lib.fusion import StreamFusion
+from lib.live_heatmap import LiveHeatmap, LiveHeatmapPublisher, format_coverage
+from lib.snapshot import (
+    SAMPLE_LOG_SUFFIX,
+    SampleLog,
+    list_snapshots,
+    load_snapshot,
+    position_key,
+    sample_row,
+)
 from lib.yaml_utils import read_yaml_file
 
 # -------------------------------------------------
@@ -65,7 +83,7 @@ parser.add_argument(
 parser.add_argument(
     "--load-existing",
     action="store_true",
-    help="Load latest *_positions.npy and *_values.npy from the save folder and plot them.",
+    help="Load existing snapshots from the save folder and plot them.",
 )
 args = parser.parse_args()
 
@@ -86,6 +104,8 @@ def _parse_duration(value: Optional[str]) -> Optional[float]:
 max_duration = _parse_duration(args.duration) or DEFAULT_DURATION
 positioner = PositionerClient(config=settings["positioning"], backend="zmq")
 scope = Scope(config=settings["scope"])
+scheduler = AcquisitionScheduler.from_settings(settings.get("acquisition"))
+fusion_settings = settings.get("fusion") or {}
 
 import logging
 
@@ -96,53 +116,96 @@ scope.logger.setLevel(logging.ERROR)
 
 plt = TechtilePlotter(realtime=True)
 
-positions = []
-values = []
-bd_power = []
+samples = []  # SAMPLE_DTYPE record tuples not yet written to the sample log
+sample_log = None  # opened in MAIN, after existing snapshots were listed
 last_save = 0
+last_position = None  # position_key of the last recorded sample
 stop_requested = False
 
+# Live heatmap on the canonical grid, fed by the plotter (live_heatmap: in the settings; None when disabled)
+live_heatmap = LiveHeatmap.from_settings(settings, os.path.dirname(save_dir))
+live_publisher = (
+    LiveHeatmapPublisher.from_settings(live_heatmap, settings.get("live_heatmap"), save_dir)
+    if live_heatmap is not None
+    else None
+)
 
-def save_data():
-    """Safely save measurement data to disk."""
-    print("Saving data...")
-    positions_snapshot = list(positions)
-    values_snapshot = list(values)
-    bd_power_snapshot = list(bd_power)
-
-    if len(positions_snapshot) != len(values_snapshot):
-        print(
-            "Warning: positions and values length mismatch:",
-            len(positions_snapshot),
-            len(values_snapshot),
-        )
-
-    positions_path = os.path.join(save_dir, f"{TIMESTAMP}_positions.npy")
-    values_path = os.path.join(save_dir, f"{TIMESTAMP}_values.npy")
-    bd_power_path = os.path.join(save_dir, f"{TIMESTAMP}_bd_power.npy")
-
-    _atomic_save_npy(positions_path, positions_snapshot)
-    _atomic_save_npy(values_path, values_snapshot)
-    _atomic_save_npy(bd_power_path, bd_power_snapshot)
-    print("Data saved.")
+# Acquisition thread -> ring -> {writer thread, plotter (main thread)}
+# With fusion enabled: {positioner thread, scope thread} -> fusion -> ring -> ...
+ring = SampleRing(RING_CAPACITY, consumers=("writer", "plotter"))
+fusion = StreamFusion.from_settings(fusion_settings, output=ring)
+acquisition = None
+position_reader = None
+writer = None
 
 
-def _atomic_save_npy(final_path, data):
-    """Write to a temp file, fsync, then replace to avoid partial writes."""
-    tmp_path = f"{final_path}.tmp"
+def save_data():
+    """Append the samples recorded since the last save to the sample log (fsynced)."""
+    batch = samples[:]
+    if not batch or sample_log is None:
+        return
+    del samples[: len(batch)]
+    print(f"Saving {len(batch)} samples...")
     try:
-        with open(tmp_path, "wb") as f:
-            np.save(f, data)
-            f.flush()
-            os.fsync(f.fileno())
-        os.replace(tmp_path, final_path)
+        sample_log.append(batch)
     except Exception:
-        try:
-            if os.path.exists(tmp_path):
-                os.remove(tmp_path)
-        except Exception:
-            pass
+        samples[:0] = batch  # keep them for the next attempt
         raise
+    print("Data saved.")
+
+
+def _acquire():
+    """
+    Read positioner and scope once; return a sample record or None if either has no data.
+    The scope is only queried when the positioner has a new sample: get_data()
+    returning the last recorded position again counts as no data.
+    """
+    global last_position
+    pos = positioner.get_data()
+    if pos is None or position_key(pos) == last_position:
+        return None
+    vals = scope.get_power_Watt()*1e12
+    if vals[0] is None:
+        return None
+    last_position = position_key(pos)
+    return sample_row(pos, vals[0], vals[1])
+
+
+def _read_position():
+    """Fusion mode: the positioner's next value, or None while get_data() repeats the last one."""
+    pos = positioner.get_data()
+    if pos is None or fusion.is_repeated_position(pos):
+        return None
+    return pos
+
+
+def _read_power():
+    """Fusion mode: read the scope on its own schedule; (pwr_pw, bd_pw) or None."""
+    vals = scope.get_power_Watt()*1e12
+    if vals[0] is None:
+        return None
+    return vals[0], vals[1]
+
+
+def _write_batch(batch):
+    """Writer consumer: queue records for the sample log and autosave periodically."""
+    global last_save
+    samples.extend(row for _, row in batch)
+    if time() - last_save >= SAVE_EVERY:
+        _save_data_safe()
+        print(f"Pipeline: {format_pipeline_stats(ring, acquisition)}")
+        last_save = time()
+
+
+def _plot_batch(batch):
+    """Plotter consumer (main thread): live plot and console progress."""
+    for _, row in batch:
+        x, y, z, _, pwr_pw, bd_pw = row
+        plt.measurements_rt(x, y, z, pwr_pw / 1e6)
+        if live_heatmap is not None:
+            live_heatmap.add(x, y, pwr_pw / 1e6)
+        print("x", end="", flush=True)
+        print(bd_pw)
 
 
 def _handle_signal(signum, frame):
@@ -161,56 +224,25 @@ atexit.register(_save_data_safe)
 signal.signal(signal.SIGTERM, _handle_signal)
 
 
-def _load_all_snapshots(folder_path):
-    positions_files = sorted(
-        [f for f in os.listdir(folder_path) if f.endswith("_positions.npy")]
-    )
-    values_files = sorted(
-        [f for f in os.listdir(folder_path) if f.endswith("_values.npy")]
-    )
-    if not positions_files or not values_files:
-        return []
-    pos_map = {
-        name[: -len("_positions.npy")]: os.path.join(folder_path, name)
-        for name in positions_files
-    }
-    val_map = {
-        name[: -len("_values.npy")]: os.path.join(folder_path, name)
-        for name in values_files
-    }
-    bases = sorted(set(pos_map) & set(val_map))
-    return [(pos_map[b], val_map[b]) for b in bases]
-
-
 def _load_existing_data():
-    pairs = _load_all_snapshots(save_dir)
-    if not pairs:
-        print("No existing position/value snapshots found to load.")
+    """Plot samples already stored in the save folder (they stay in their own files)."""
+    snapshots = list_snapshots(save_dir)
+    if not snapshots:
+        print("No existing snapshots found to load.")
         return
     total = 0
-    for pos_path, val_path in pairs:
+    for base, kind in snapshots:
         try:
-            existing_positions = np.load(pos_path, allow_pickle=True).tolist()
-            existing_values = np.load(val_path, allow_pickle=True).tolist()
+            existing = load_snapshot(save_dir, base, kind)
         except Exception as exc:
-            print(f"Failed to load existing snapshots {pos_path}, {val_path}: {exc}")
+            print(f"Failed to load existing snapshot {base} in {save_dir}: {exc}")
             continue
-        if len(existing_positions) != len(existing_values):
-            print(
-                "Warning: existing positions and values length mismatch:",
-                len(existing_positions),
-                len(existing_values),
-            )
-        positions.extend(existing_positions)
-        values.extend(existing_values)
-        for pos, d in zip(existing_positions, existing_values):
-            plt.measurements_rt(
-                pos.x,
-                pos.y,
-                pos.z,
-                d
-            )
-        total += len(existing_positions)
+        pwr_uw = existing["pwr_pw"] / 1e6
+        for x, y, z, p in zip(existing["x"], existing["y"], existing["z"], pwr_uw):
+            plt.measurements_rt(x, y, z, p)
+            if live_heatmap is not None:
+                live_heatmap.add(x, y, p)
+        total += len(existing)
     print(f"Loaded {total} existing samples from {save_dir}.")
 
 
@@ -218,6 +250,7 @@ def _load_existing_data():
 #                                           MAIN                                             #
 # ****************************************************************************************** #
 class scope_data(object):
+    # Only needed to unpickle legacy *_values.npy snapshots (--load-existing)
     def __init__(self, pwr_pw):
         self.pwr_pw = pwr_pw
 
@@ -227,35 +260,43 @@ try:
     positioner.start()
     if args.load_existing:
         _load_existing_data()
-
+    sample_log = SampleLog(os.path.join(save_dir, f"{TIMESTAMP}{SAMPLE_LOG_SUFFIX}"))
+
+    writer = ConsumerThread(ring, "writer", _write_batch)
+    if fusion is None:
+        acquisition = AcquisitionThread(_acquire, ring, scheduler)
+    else:
+        # Poll the positioner as fast as it delivers, independent of the scope rate
+        position_reader = AcquisitionThread(
+            _read_position,
+            fusion.position_input,
+            AcquisitionScheduler(
+                mode="event",
+                event_poll_interval=fusion_settings.get("position_poll_interval", 0.002),
+            ),
+        )
+        position_reader.name = "positioner"
+        acquisition = AcquisitionThread(_read_power, fusion.power_input, scheduler)
+        position_reader.start()
+    writer.start()
+    acquisition.start()
     start_time = time()
+    last_misses = 0
 
     while True:
-        vals = scope.get_power_Watt()*1e12
-        pos = positioner.get_data()
-
-        d1 = scope_data(vals[0])
-        d2 = scope_data(vals[1])
-
-        # print(d, pos)
-
-        if vals[0] is not None and pos is not None:
-            positions.append(pos)
-            values.append(d1)
-            bd_power.append(vals[1])
-
-            plt.measurements_rt(pos.x, pos.y, pos.z, d1.pwr_pw / 1e6)
-            print("x", end="", flush=True)
-            print(vals[1])
-        else:
+        _plot_batch(ring.drain("plotter", timeout=PLOT_INTERVAL))
+        if live_publisher is not None and live_publisher.maybe_publish():
+            print(f"\nCoverage: {format_coverage(live_publisher.last_summary)}")
+        if acquisition.misses != last_misses:
             print(".", end="", flush=True)
-
-        # Periodic autosave
-        if time() - last_save >= SAVE_EVERY:
-            _save_data_safe()
-            last_save = time()
-
-        sleep(0.1)
+            last_misses = acquisition.misses
+
+        if acquisition.error is not None:
+            raise acquisition.error
+        if position_reader is not None and position_reader.error is not None:
+            raise position_reader.error
+        if writer.error is not None:
+            raise writer.error
         if max_duration is not None and time() - start_time >= max_duration:
             print(f"Reached configured duration ({max_duration:.0f} s). Stopping.")
             break
@@ -276,13 +317,34 @@ finally:
     # ****************************************************************************************** #
     print("Cleaning up...")
 
+    if acquisition is not None:
+        acquisition.stop(timeout=5)
+    if position_reader is not None:
+        position_reader.stop(timeout=5)
+    if fusion is not None:
+        fusion.flush()
+        print(f"Fusion: {fusion.report()}")
+    if writer is not None:
+        writer.stop(timeout=SAVE_EVERY)
+    print(f"Pipeline: {format_pipeline_stats(ring, acquisition)}")
+    print(f"Acquisition rate: {scheduler.report()}")
+
     _save_data_safe()
+    if sample_log is not None:
+        sample_log.close()
 
     try:
         positioner.stop()
     except Exception:
         pass
 
+    if live_publisher is not None:
+        try:
+            live_publisher.publish()
+        except Exception as e:
+            print("Failed to publish the live heatmap on exit:", e)
+        live_publisher.close()
+
     # iq_socket.close()
     # context.term()
 
@@ -5,11 +5,24 @@ from scipy.signal import find_peaks
 
 
 class Scope:
-    def __init__(self, ip: str):
+    def __init__(self, ip: str, batched: bool = True, resource=None):
+        """
+        batched: read all measurements with one semicolon-joined SCPI query
+                 (one VISA round trip) instead of one query per measurement.
+        resource: an already opened VISA resource (e.g. fake_scope.FakeScopeResource);
+                  by default TCPIP::<ip>::INSTR is opened.
+        """
         self.ip = ip
-        self.rm = visa.ResourceManager()
-        self.scope = self.rm.open_resource(f"TCPIP::{ip}::INSTR")
+        self.batched = batched
+        if resource is None:
+            self.rm = visa.ResourceManager()
+            self.scope = self.rm.open_resource(f"TCPIP::{ip}::INSTR")
+        else:
+            self.rm = None
+            self.scope = resource
         self.channels = ["CH1", "CH2", "CH3", "CH4"]
+        self.meas_list = None
+        self._batch_query = None
 
 
     # ------------------------------------------------------------
@@ -25,8 +38,8 @@ class Scope:
         for _ in range(3):
             self.scope.write("MEASUREMENT:ADDMEAS PHASE")
 
-        # Get measurement names
-        self.meas_list = self.scope.query("MEASUrement:LIST?").strip().split(",")
+        # Get measurement names (cached for read_measurements)
+        self.refresh_measurements()
 
         # Configure channels
         print("[i] Configuring channels…")
@@ -46,26 +59,49 @@ class Scope:
             self.scope.write(f"MEASUrement:{self.meas_list[i]}:SOUrce2 CH1")
     
     def check_status(self):
-        no_meas = len(self.scope.query("MEASUrement:LIST?").strip().split(","))
+        """Return True if the scope needs _init_scope (caches the measurement list otherwise)."""
+        no_meas = len(self.refresh_measurements())
         if(no_meas != 3):
             return True
         return False
 
+    def refresh_measurements(self):
+        """Query MEASUrement:LIST? once and cache it together with the batched readout query."""
+        self.meas_list = self.scope.query("MEASUrement:LIST?").strip().split(",")
+        # Later commands in a ';' chain need a leading ':' to restart at the root node.
+        self._batch_query = ";:".join(
+            f"MEASUrement:{meas}:RESUlts:CURRent:MEAN?" for meas in self.meas_list
+        )
+        return self.meas_list
+
     # ------------------------------------------------------------
     # READOUT
     # ------------------------------------------------------------
     def read_measurements(self):
         """Read the mean history value for all configured measurements."""
-        measurements = self.scope.query("MEASUrement:LIST?").strip().split(",")
-        results = {}
+        if self.meas_list is None:
+            self.refresh_measurements()
+        if self.batched:
+            return self._read_measurements_batched()
 
-        for meas in measurements:
+        results = {}
+        for meas in self.meas_list:
             value = self.scope.query(f"MEASUrement:{meas}:RESUlts:CURRent:MEAN?")
             # print(self.scope.query(f"MEASUrement:{meas}:RESUlts:CURRent:STDDev?"))
             # print(self.scope.query(f"MEASUrement:{meas}:RESUlts:ALLAcqs:POPUlation?"))
             results[meas] = float(value)
         return results
 
+    def _read_measurements_batched(self):
+        """One round trip: send all MEAN? queries joined by ';' and split the reply."""
+        reply = self.scope.query(self._batch_query).strip().split(";")
+        if len(reply) != len(self.meas_list):
+            raise ValueError(
+                f"batched readout returned {len(reply)} values for {len(self.meas_list)} measurements: {reply}"
+            )
+        # With HEADer ON each part is "<header> <value>"; the value is always the last token.
+        return {meas: float(part.split()[-1]) for meas, part in zip(self.meas_list, reply)}
+
     # # ------------------------------------------------------------
     # # LOOP
     # # ------------------------------------------------------------
@@ -88,7 +124,8 @@ class Scope:
     def close(self):
         """Close VISA session."""
         self.scope.close()
-        self.rm.close()
+        if self.rm is not None:
+            self.rm.close()
         print("[i] VISA session closed.")
 
 